@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for knowledge items
+
+Measures the Python heap held per MemoryItem, built the way
+add_to_knowledge builds them, against the earlier dataclass layout
+(datetime timestamp, Q/A texts repeated in metadata). Embeddings live
+in the shared float32 matrix in both cases and are reported separately.
+
+    python bench_memory.py [--sizes 10000 100000 1000000] [--dim 384]
+"""
+
+import sys
+import gc
+import argparse
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+# Add project paths
+project_root = Path(__file__).parent.absolute()
+sys.path.insert(0, str(project_root))
+
+from navi.memory import MemoryItem
+
+@dataclass
+class DataclassItem:
+    """The previous MemoryItem layout"""
+    id: str
+    content: str
+    metadata: Dict[str, Any]
+    timestamp: datetime
+    embedding: Optional[List[float]] = None
+    embedding_row: Optional[int] = None
+
+def interaction(i: int):
+    """A Q/A pair of typical chat length"""
+    user_message = f"How do I configure the backup schedule for project {i} on the home server?"
+    assistant_response = (f"For project {i}, open the scheduler settings, pick a daily window outside "
+                          "working hours and keep at least seven snapshots. Check the first run in the log.")
+    return user_message, assistant_response
+
+def build(cls, count: int) -> list:
+    start = datetime(2026, 1, 1)
+    items = []
+    for i in range(count):
+        user_message, assistant_response = interaction(i)
+        content = f"Q: {user_message}\nA: {assistant_response}"
+        metadata = {
+            "type": "qa_pair",
+            "user_message": user_message,
+            "assistant_response": assistant_response,
+            "context": {"session_id": f"session-{i // 20}"}
+        }
+        items.append(cls(f"{i:032x}", content, metadata, start + timedelta(seconds=i), None, i))
+        # The texts arrive as request strings; only the item's references stay alive
+        del user_message, assistant_response, content, metadata
+    return items
+
+def measure(cls, count: int) -> float:
+    """Bytes of Python heap per item"""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    items = build(cls, count)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    gc.collect()
+    return (after - before) / count
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per knowledge item")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384, help="embedding dimension")
+    args = parser.parse_args()
+
+    matrix_bytes = 4 * args.dim
+    print(f"{'items':>10} {'dataclass B/item':>17} {'compact B/item':>15} {'saved':>7}")
+    for count in args.sizes:
+        legacy = measure(DataclassItem, count)
+        compact = measure(MemoryItem, count)
+        print(f"{count:>10,} {legacy:>17,.0f} {compact:>15,.0f} {1 - compact / legacy:>7.0%}")
+    print(f"Embeddings: {matrix_bytes:,} B/item in the shared float32 matrix (memory-mapped, "
+          f"{args.dim} dims), vs about {32 * args.dim + 56:,} B as a list of Python floats")
+
+if __name__ == "__main__":
+    main()
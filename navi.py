@@ -42,6 +42,16 @@ Options:
   --list-agents       List available agents
   --list-providers    List available providers
   --setup             Run initial setup
+  --memory-service    Run the shared memory service (see the service
+                      section of memory.yaml)
+  --export <file> [format]
+                      Export conversations and knowledge as json,
+                      markdown or csv (format defaults to the file
+                      extension; see the export section of memory.yaml)
+  --migrate-memory [format] [compression]
+                      Convert stored memory files to a format
+                      (json|binary) and compression (none|gzip|zstd);
+                      defaults come from config/memory.yaml
 
 Examples:
   python navi.py                           # Interactive mode
@@ -198,6 +208,87 @@ def run_setup():
     
     print("\n✅ Setup complete! Run 'python navi.py' to start.")
 
+async def memory_service():
+    """Run the memory service until interrupted"""
+    from navi.memory_service import run_memory_service
+
+    navi = NaviCore()
+    await navi.load_config()
+    memory_yaml = navi.config.get("memory") or {}
+    memory_config = memory_yaml.get("memory", {})
+    print("🧠 Starting NAVI memory service (Ctrl+C to stop)...")
+    await run_memory_service(
+        data_dir=memory_config.get("data_dir", "data/memory"),
+        config=memory_config,
+        export_config=memory_yaml.get("export", {})
+    )
+
+async def export_memory(path: str, format_name: str = None):
+    """Export memory data to a file"""
+    from navi.memory import MemoryManager
+
+    try:
+        navi = NaviCore()
+        await navi.load_config()
+        memory_yaml = navi.config.get("memory") or {}
+        memory_config = memory_yaml.get("memory", {})
+        memory = MemoryManager(
+            data_dir=memory_config.get("data_dir", "data/memory"),
+            config=memory_config,
+            export_config=memory_yaml.get("export", {})
+        )
+        # Only the session index is needed; records are streamed from disk
+        await memory.load_conversations()
+        try:
+            stats = await memory.export(path, format_name)
+        finally:
+            await memory.close()
+
+        print(f"✅ Exported {stats['sessions']} sessions ({stats['messages']} messages) "
+              f"and {stats['knowledge_items']} knowledge items")
+        print(f"   {stats['format']}: {stats['path']}")
+
+    except Exception as e:
+        print(f"❌ Error exporting memory: {e}")
+
+async def migrate_memory(format_name: str = None, compression: str = None):
+    """Convert the memory store's files to another record format"""
+    from navi.storage import JsonMemoryStore, create_memory_store
+
+    try:
+        navi = NaviCore()
+        await navi.load_config()
+        memory_config = (navi.config.get("memory") or {}).get("memory", {})
+        storage_config = dict(memory_config.get("storage", {}))
+        if format_name:
+            storage_config["format"] = format_name
+        if compression:
+            storage_config["compression"] = compression
+
+        data_dir = Path(memory_config.get("data_dir", "data/memory"))
+        store = create_memory_store(data_dir, storage_config)
+        if not isinstance(store, JsonMemoryStore):
+            print("ℹ️  The SQLite backend has no record files to migrate.")
+            store.close()
+            return
+
+        print("🔄 Migrating memory files...")
+        # Attaching performs any pending legacy-layout migrations without
+        # reading the stored records into memory
+        store.load_conversations()
+        store.attach_knowledge()
+        stats = store.convert()
+        store.close()
+
+        print(f"✅ Memory now stored as {stats['format']} ({stats['compression']})")
+        for name in ("conversations", "knowledge"):
+            part = stats[name]
+            print(f"   {name}: {part['files']} files, "
+                  f"{part['bytes_before']:,} → {part['bytes_after']:,} bytes")
+
+    except Exception as e:
+        print(f"❌ Error migrating memory: {e}")
+
 async def single_message(message: str, agent: str = None):
     """Process a single message"""
     try:
@@ -206,6 +297,7 @@ async def single_message(message: str, agent: str = None):
         
         response = await navi.chat(message, agent=agent)
         print(response.content)
+        await navi.shutdown()
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -236,6 +328,18 @@ async def main():
     elif args[0] == "--setup":
         run_setup()
     
+    elif args[0] == "--memory-service":
+        await memory_service()
+    
+    elif args[0] == "--export":
+        if len(args) < 2:
+            print("❌ Usage: python navi.py --export <file> [json|markdown|csv]")
+            sys.exit(1)
+        await export_memory(*args[1:3])
+    
+    elif args[0] == "--migrate-memory":
+        await migrate_memory(*args[1:3])
+    
     elif args[0] in ["-a", "--agent"]:
         if len(args) < 3:
             print("❌ Usage: python navi.py --agent <agent_name> <message>")
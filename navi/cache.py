@@ -0,0 +1,191 @@
+# NAVI Caches
+# Bounded in-memory caches for retrieval results and embeddings
+
+import os
+import time
+import pickle
+import hashlib
+import logging
+from array import array
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Hashable
+
+logger = logging.getLogger(__name__)
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and trim surrounding punctuation"""
+    return " ".join(query.lower().split()).strip(" ?!.,;:")
+
+class ResultCache:
+    """Bounded LRU cache whose entries expire by age or data generation
+
+    Callers pass the generation of the data a result was computed from and
+    bump it whenever that data changes; the first lookup or store with a
+    new generation drops every entry computed before it.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._stored_at: Dict[Hashable, float] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync(self, generation: int):
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self._generation = generation
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        """Return the cached value, or None on a miss"""
+        self._sync(generation)
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        if self.ttl_seconds and time.monotonic() - self._stored_at[key] > self.ttl_seconds:
+            del self._entries[key]
+            del self._stored_at[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, generation: int, value: Any):
+        """Store ``value`` (never None) as computed at ``generation``"""
+        self._sync(generation)
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._stored_at[key] = time.monotonic()
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            del self._stored_at[oldest]
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+        self._stored_at.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+class EmbeddingCache:
+    """Size-bounded LRU cache of embeddings keyed by model and text hash
+
+    Keys are SHA-1 digests of the model name and the text, so vectors
+    from different models never mix and long texts cost 20 bytes of key.
+    Vectors are held as packed float32 arrays. With a ``cache_file`` the
+    cache is loaded on start and written back by ``save()``.
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, max_entries: int = 10000, cache_file: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.cache_file = Path(cache_file) if cache_file else None
+        self._entries: "OrderedDict[bytes, array]" = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        """Return the cached embedding, or None"""
+        key = self.key(model_name, text)
+        vector = self._entries.get(key)
+        if vector is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return vector.tolist()
+
+    def put(self, model_name: str, text: str, vector: List[float]):
+        """Cache an embedding, evicting the least recently used beyond the bound"""
+        if self.max_entries <= 0:
+            return
+        key = self.key(model_name, text)
+        self._entries[key] = array('f', vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def load(self):
+        """Read the cache file, if any"""
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable embedding cache {self.cache_file.name}: {e}")
+            return
+        if data.get("version") != self.CACHE_VERSION:
+            return
+        for key, packed in data["entries"][-self.max_entries:]:
+            vector = array('f')
+            vector.frombytes(packed)
+            self._entries[key] = vector
+        logger.info(f"💾 Loaded {len(self._entries)} cached embeddings")
+
+    def save(self):
+        """Write the cache file if entries changed since it was read"""
+        if self.cache_file is None or not self._dirty:
+            return
+        data = {
+            "version": self.CACHE_VERSION,
+            "entries": [(key, vector.tobytes()) for key, vector in self._entries.items()]
+        }
+        tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save embedding cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
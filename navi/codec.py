@@ -0,0 +1,225 @@
+# NAVI Record Codecs
+# On-disk encodings for memory record files
+
+import os
+import gzip
+import json
+import logging
+from array import array
+from itertools import islice
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, BinaryIO, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMP_KEYS = ("timestamp", "updated")
+
+class RecordCodec:
+    """Encodes append-only record files
+
+    Every ``encode`` call produces a self-contained frame, so appending a
+    frame to a file is always valid. The codec of an existing file is
+    recognised from its suffix, which lets stores written in different
+    formats be read side by side.
+    """
+
+    format_name = "json"
+    compression = "none"
+
+    @property
+    def suffix(self) -> str:
+        base = ".mpk" if self.format_name == "binary" else ".jsonl"
+        return base + {"none": "", "gzip": ".gz", "zstd": ".zst"}[self.compression]
+
+    def encode(self, records: Iterable[Dict[str, Any]]) -> bytes:
+        """Encode records as one appendable frame"""
+        return self._compress(self._serialize(records))
+
+    def iter_file(self, f: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Decode records from an open file, reading it incrementally"""
+        try:
+            yield from self._iter_stream(self._decompressed(f))
+        except (OSError, EOFError) as e:
+            # A torn trailing frame loses only the records written last
+            logger.warning(f"Truncated compressed frame, keeping readable prefix: {e}")
+
+    def _serialize(self, records: Iterable[Dict[str, Any]]) -> bytes:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+    def _iter_stream(self, stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+        for line_no, line in enumerate(_iter_lines(stream), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                logger.warning(f"Skipping corrupt record at line {line_no}")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "gzip":
+            return gzip.compress(data)
+        if self.compression == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor().compress(data)
+        return data
+
+    def _decompressed(self, f: BinaryIO) -> BinaryIO:
+        if self.compression == "gzip":
+            # Concatenated gzip members decode as one stream
+            return gzip.GzipFile(fileobj=f)
+        if self.compression == "zstd":
+            import zstandard
+            return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        return f
+
+class MsgpackCodec(RecordCodec):
+    """Binary records: msgpack maps, epoch-microsecond timestamps and
+    float32 embedding blobs"""
+
+    format_name = "binary"
+
+    def _serialize(self, records: Iterable[Dict[str, Any]]) -> bytes:
+        import msgpack
+        packer = msgpack.Packer(use_bin_type=True)
+        return b"".join(packer.pack(self._pack_record(r)) for r in records)
+
+    def _iter_stream(self, stream: BinaryIO) -> Iterator[Dict[str, Any]]:
+        import msgpack
+        unpacker = msgpack.Unpacker(stream, raw=False, strict_map_key=False)
+        try:
+            for record in unpacker:
+                yield self._unpack_record(record)
+        except (ValueError, msgpack.UnpackException) as e:
+            logger.warning(f"Skipping corrupt binary record tail: {e}")
+
+    @staticmethod
+    def _pack_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        packed = dict(record)
+        for key in TIMESTAMP_KEYS:
+            value = packed.get(key)
+            if isinstance(value, str):
+                try:
+                    moment = datetime.fromisoformat(value)
+                except ValueError:
+                    continue
+                if moment.tzinfo is None:
+                    packed[key] = (moment - EPOCH) // timedelta(microseconds=1)
+        embedding = packed.get("embedding")
+        if isinstance(embedding, list):
+            packed["embedding"] = array("f", embedding).tobytes()
+        return packed
+
+    @staticmethod
+    def _unpack_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        for key in TIMESTAMP_KEYS:
+            value = record.get(key)
+            if isinstance(value, int):
+                record[key] = (EPOCH + timedelta(microseconds=value)).isoformat()
+        embedding = record.get("embedding")
+        if isinstance(embedding, bytes):
+            record["embedding"] = array("f", embedding).tolist()
+        return record
+
+def _iter_lines(stream: BinaryIO, chunk_size: int = 65536) -> Iterator[bytes]:
+    """Split any readable stream into lines without loading it whole"""
+    # read1 returns what is already decoded, so a torn frame costs only itself
+    read = getattr(stream, "read1", stream.read)
+    tail = b""
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+def _module_available(name: str) -> bool:
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+def get_codec(format_name: str = "json", compression: str = "none") -> RecordCodec:
+    """Build the codec selected in config, degrading when packages are missing"""
+    if format_name == "binary" and not _module_available("msgpack"):
+        logger.warning("⚠️  msgpack not installed. Using JSON records. Install with: pip install msgpack")
+        format_name = "json"
+    if compression == "zstd" and not _module_available("zstandard"):
+        logger.warning("⚠️  zstandard not installed. Using gzip. Install with: pip install zstandard")
+        compression = "gzip"
+    if format_name not in ("json", "binary"):
+        logger.warning(f"⚠️  Unknown record format '{format_name}', using json")
+        format_name = "json"
+    if compression not in ("none", "gzip", "zstd"):
+        logger.warning(f"⚠️  Unknown compression '{compression}', using none")
+        compression = "none"
+
+    codec = MsgpackCodec() if format_name == "binary" else RecordCodec()
+    codec.compression = compression
+    return codec
+
+RECORD_SUFFIXES = [".jsonl.gz", ".jsonl.zst", ".jsonl", ".mpk.gz", ".mpk.zst", ".mpk"]
+
+def record_stem(path: Path) -> Optional[str]:
+    """Strip a record-file suffix from a file name, or None if it has none"""
+    name = path.name
+    for suffix in RECORD_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return None
+
+def codec_for_path(path: Path) -> RecordCodec:
+    """Recognise the codec a record file was written with"""
+    name = Path(path).name
+    compression = "none"
+    if name.endswith(".gz"):
+        compression, name = "gzip", name[:-3]
+    elif name.endswith(".zst"):
+        compression, name = "zstd", name[:-4]
+    codec = MsgpackCodec() if name.endswith(".mpk") else RecordCodec()
+    codec.compression = compression
+    return codec
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield records from a record file of any supported format, streaming"""
+    path = Path(path)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        yield from codec_for_path(path).iter_file(f)
+
+def write_records(path: Path, records: Iterable[Dict[str, Any]], append: bool = False,
+                  codec: Optional[RecordCodec] = None, batch_size: int = 1000):
+    """Write records using the codec implied by ``path`` by default
+
+    Records are encoded ``batch_size`` at a time, each batch as its own
+    frame, so a large iterable is never held in memory whole. Appending
+    nothing leaves the file untouched.
+    """
+    codec = codec or codec_for_path(path)
+    records = iter(records)
+    f = None
+    try:
+        if not append:
+            f = open(path, 'wb')
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            if f is None:
+                f = open(path, 'ab')
+            f.write(codec.encode(batch))
+        if f is not None:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        if f is not None:
+            f.close()
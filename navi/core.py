@@ -15,6 +15,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from navi.providers import setup_providers, provider_manager, Message, ChatResponse
 from navi.memory import MemoryManager, ConversationMemory
+from navi.memory_service import RemoteMemoryManager
 from navi.agents import AgentManager
 
 # Configure logging
@@ -45,8 +46,24 @@ class NaviCore:
         self.provider_manager = setup_providers()
         
         # Initialize memory
-        self.memory_manager = MemoryManager()
-        await self.memory_manager.initialize()
+        memory_yaml = self.config.get("memory") or {}
+        memory_config = memory_yaml.get("memory", {})
+        service_config = memory_config.get("service", {})
+        if service_config.get("enabled"):
+            # Share one memory process (and embedding model) between workers
+            self.memory_manager = RemoteMemoryManager(service_config)
+            try:
+                await self.memory_manager.initialize()
+            except (ConnectionError, OSError) as e:
+                logger.warning(f"⚠️  Memory service unavailable ({e}); using local memory")
+                self.memory_manager = None
+        if self.memory_manager is None:
+            self.memory_manager = MemoryManager(
+                data_dir=memory_config.get("data_dir", "data/memory"),
+                config=memory_config,
+                export_config=memory_yaml.get("export", {})
+            )
+            await self.memory_manager.initialize()
         
         # Initialize agents
         self.agent_manager = AgentManager(
@@ -98,7 +115,9 @@ class NaviCore:
             else:
                 response = await self.agent_manager.process_message(message, conversation)
             
-            # Save to memory
+            # Save to memory, noting which agent answered so knowledge can be filtered by it
+            if response.metadata and "agent" in response.metadata:
+                context = dict(context or {}, agent=response.metadata["agent"])
             await self.memory_manager.save_interaction(message, response.content, context)
             
             return response
@@ -124,6 +143,11 @@ class NaviCore:
             logger.error(f"Stream chat error: {e}")
             yield f"Error: {str(e)}"
     
+    async def shutdown(self):
+        """Flush memory and stop background workers"""
+        if self.memory_manager:
+            await self.memory_manager.close()
+    
     def get_agent_list(self) -> List[str]:
         """Get list of available agents"""
         if self.agent_manager:
@@ -205,6 +229,8 @@ class NaviCLI:
                 break
             except Exception as e:
                 print(f"\n❌ Error: {e}")
+        
+        await self.navi.shutdown()
     
     def print_help(self):
         """Print help information"""
@@ -253,6 +279,7 @@ async def main():
         
         response = await navi.chat(command)
         print(response.content)
+        await navi.shutdown()
     else:
         # Interactive mode
         cli = NaviCLI()
@@ -0,0 +1,129 @@
+# NAVI Deduplication
+# MinHash signatures with locality-sensitive banding for near-duplicate lookups
+
+import re
+import random
+import logging
+from typing import Dict, List, Optional, Any, Iterable, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+MASK64 = (1 << 64) - 1
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Words that flip what a question asks for; questions differing in any of
+# them are never duplicates however similar the rest is ("t" is the tail
+# of contractions such as "don't")
+POLARITY_WORDS = frozenset("no not never nor none nothing nobody without on off t".split())
+
+def words(text: str) -> List[str]:
+    """Lowercase word tokens, stopwords and negations included"""
+    return WORD_PATTERN.findall(text.lower())
+
+def shingles(text: str, size: int = 2) -> Set[str]:
+    """Overlapping word ``size``-grams compared for near-duplicates, so a
+    changed word breaks every shingle it is part of"""
+    tokens = words(text)
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def polarity(text: str) -> Set[str]:
+    """Negations and on/off particles present in a text"""
+    return POLARITY_WORDS.intersection(words(text))
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    """Share of tokens two sets have in common"""
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+class NearDuplicateIndex:
+    """Finds stored texts whose shingle sets are likely similar to a new one
+
+    Each text gets a MinHash signature of ``bands * rows`` values, and each
+    band of ``rows`` values is hashed into a bucket. Texts with Jaccard
+    similarity s share at least one bucket with probability
+    1 - (1 - s^rows)^bands, which is near 1 above about 0.75 and small
+    below 0.4, so a lookup only sees the few keys sharing a bucket; its
+    cost does not grow with the number of stored texts. Callers confirm
+    candidates with the exact ``jaccard``.
+
+    Token hashes use Python's per-process ``hash``, so signatures are only
+    kept in memory and rebuilt on start.
+    """
+
+    def __init__(self, bands: int = 12, rows: int = 5, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        generator = random.Random(seed)
+        permutations = bands * rows
+        # Multiply-add hashing mod 2**64 with odd multipliers permutes the hash space
+        self._multipliers = [generator.getrandbits(64) | 1 for _ in range(permutations)]
+        self._offsets = [generator.getrandbits(64) for _ in range(permutations)]
+        if np is not None:
+            self._np_multipliers = np.array(self._multipliers, dtype=np.uint64)[:, None]
+            self._np_offsets = np.array(self._offsets, dtype=np.uint64)[:, None]
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, tokens: Iterable[str]) -> Tuple[int, ...]:
+        """One bucket hash per band for a shingle (or token) set"""
+        hashes = [hash(token) & MASK64 for token in tokens]
+        if not hashes:
+            return tuple([0] * self.bands)
+        if np is not None:
+            values = np.array(hashes, dtype=np.uint64)[None, :]
+            minimums = (values * self._np_multipliers + self._np_offsets).min(axis=1).tolist()
+        else:
+            minimums = [min((multiplier * value + offset) & MASK64 for value in hashes)
+                        for multiplier, offset in zip(self._multipliers, self._offsets)]
+        rows = self.rows
+        return tuple(hash(tuple(minimums[band * rows:(band + 1) * rows])) for band in range(self.bands))
+
+    def add(self, key: str, signature: Tuple[int, ...]):
+        """Index ``signature`` under ``key``, replacing any earlier one"""
+        if key in self._signatures:
+            self.remove(key)
+        self._signatures[key] = signature
+        for buckets, value in zip(self._buckets, signature):
+            buckets.setdefault(value, set()).add(key)
+
+    def remove(self, key: str) -> bool:
+        """Drop ``key``; returns False if it was not indexed"""
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return False
+        for buckets, value in zip(self._buckets, signature):
+            keys = buckets.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del buckets[value]
+        return True
+
+    def candidates(self, signature: Tuple[int, ...], limit: Optional[int] = None) -> List[str]:
+        """Keys sharing a bucket with ``signature``, most shared buckets first"""
+        shared: Dict[str, int] = {}
+        for buckets, value in zip(self._buckets, signature):
+            for key in buckets.get(value, ()):
+                shared[key] = shared.get(key, 0) + 1
+        ranked = sorted(shared, key=shared.get, reverse=True)
+        return ranked if limit is None else ranked[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size information"""
+        return {
+            "signatures": len(self._signatures),
+            "bands": self.bands,
+            "rows": self.rows
+        }
@@ -0,0 +1,111 @@
+# NAVI Eviction
+# Access-aware eviction order for the bounded knowledge store
+
+import math
+import heapq
+import logging
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+class EvictionPolicy:
+    """Keeps knowledge items in eviction order on a min-heap
+
+    ``policy`` picks what is evicted first:
+
+    - "lru": the item retrieved (or stored) longest ago
+    - "lfu": the item retrieved least often, oldest first among equals
+    - "age_weighted": the lowest hit count decayed by time since the last
+      hit, halving every ``half_life_days``; ranked as
+      log2(1 + hits) + last_hit / half_life, which orders items the same
+      way at any later time, so priorities only change when touched
+
+    ``touch`` pushes a new heap entry and leaves the old one to be skipped
+    when popped, so updates and evictions are O(log n); the heap is
+    rebuilt once stale entries outnumber live ones.
+    """
+
+    POLICIES = ("lru", "lfu", "age_weighted")
+
+    def __init__(self, policy: str = "lru", half_life_days: float = 30.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown eviction policy '{policy}' (choose from {', '.join(self.POLICIES)})")
+        self.policy = policy
+        self.half_life = max(half_life_days, 1e-6) * 86400.0
+        # key -> [hits, last access (epoch seconds), version of its live heap entry]
+        self._state: Dict[str, List[Any]] = {}
+        self._heap: List[Tuple[Tuple[float, ...], int, str]] = []
+        self._version = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._state
+
+    def _priority(self, hits: int, last: float) -> Tuple[float, ...]:
+        if self.policy == "lfu":
+            return (hits, last)
+        if self.policy == "age_weighted":
+            return (math.log2(1 + hits) + last / self.half_life,)
+        return (last,)
+
+    def _push(self, key: str, state: List[Any]):
+        self._version += 1
+        state[2] = self._version
+        heapq.heappush(self._heap, (self._priority(state[0], state[1]), self._version, key))
+        if len(self._heap) > 2 * len(self._state) + 64:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [(self._priority(hits, last), version, key)
+                      for key, (hits, last, version) in self._state.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, key: str, last_access: float, hits: int = 0):
+        """Track ``key``, last used at ``last_access`` (epoch seconds)"""
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [hits, last_access, 0]
+        else:
+            state[0], state[1] = hits, last_access
+        self._push(key, state)
+
+    def touch(self, key: str, now: float):
+        """Record a hit on ``key`` at ``now``"""
+        state = self._state.get(key)
+        if state is None:
+            return
+        state[0] += 1
+        state[1] = max(state[1], now)
+        self.hits += 1
+        self._push(key, state)
+
+    def remove(self, key: str) -> bool:
+        """Stop tracking ``key``; its heap entries are skipped from now on"""
+        return self._state.pop(key, None) is not None
+
+    def pop(self) -> Optional[str]:
+        """Remove and return the key to evict next, or None if empty"""
+        while self._heap:
+            _, version, key = heapq.heappop(self._heap)
+            state = self._state.get(key)
+            if state is not None and state[2] == version:
+                del self._state[key]
+                return key
+        return None
+
+    def clear(self):
+        """Stop tracking every key"""
+        self._state.clear()
+        self._heap = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Return policy and heap information"""
+        return {
+            "policy": self.policy,
+            "tracked": len(self._state),
+            "heap_entries": len(self._heap),
+            "hits": self.hits
+        }
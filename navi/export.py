@@ -0,0 +1,140 @@
+# NAVI Memory Export
+# Streams conversations and knowledge to JSON, Markdown or CSV
+
+import csv
+import gzip
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterator, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("json", "markdown", "csv")
+FORMAT_SUFFIXES = {".json": "json", ".md": "markdown", ".markdown": "markdown", ".csv": "csv"}
+
+class MemoryExporter:
+    """Writes a memory store out one record at a time
+
+    Sessions and knowledge items are pulled from generators and written
+    straight to the (optionally gzip-compressed) output stream, so memory
+    use does not grow with the size of the store.
+    """
+
+    CSV_FIELDS = ["kind", "session_id", "id", "role", "timestamp", "content", "metadata"]
+
+    def __init__(self, sessions: Iterator[Tuple[str, List[Dict[str, Any]]]],
+                 knowledge: Iterator[Dict[str, Any]], include_metadata: bool = True):
+        self.sessions = sessions
+        self.knowledge = knowledge
+        self.include_metadata = include_metadata
+        self.counts = {"sessions": 0, "messages": 0, "knowledge_items": 0}
+
+    @staticmethod
+    def detect_format(path: Path) -> Optional[str]:
+        """Guess the export format from a file name, ignoring a .gz suffix"""
+        path = Path(path)
+        if path.suffix == ".gz":
+            path = path.with_suffix("")
+        return FORMAT_SUFFIXES.get(path.suffix.lower())
+
+    def export(self, path: Path, format_name: str, compress: bool = False) -> Path:
+        """Write the export file and return its path"""
+        if format_name not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{format_name}'")
+        path = Path(path)
+        if compress and path.suffix != ".gz":
+            path = path.with_name(path.name + ".gz")
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if compress:
+            stream = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else:
+            stream = open(path, 'w', encoding='utf-8', newline='')
+        with stream:
+            getattr(self, f"_write_{format_name}")(stream)
+        return path
+
+    def _messages(self) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Yield (session_id, message), with None marking the start of a session"""
+        for session_id, messages in self.sessions:
+            self.counts["sessions"] += 1
+            yield session_id, None
+            for message in messages:
+                self.counts["messages"] += 1
+                yield session_id, self._clean(message)
+
+    def _items(self) -> Iterator[Dict[str, Any]]:
+        for item in self.knowledge:
+            self.counts["knowledge_items"] += 1
+            yield self._clean(item)
+
+    def _clean(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        record = {key: value for key, value in record.items()
+                  if key not in ("embedding", "embedding_row")}
+        if not self.include_metadata:
+            record.pop("metadata", None)
+        return record
+
+    def _write_json(self, stream: TextIO):
+        stream.write('{"exported": %s, "conversations": [' % json.dumps(datetime.now().isoformat()))
+        first_session = True
+        first_message = True
+        for session_id, message in self._messages():
+            if message is None:
+                if not first_session:
+                    stream.write(']}')
+                stream.write(('' if first_session else ',') +
+                             '\n  {"session_id": %s, "messages": [' % json.dumps(session_id))
+                first_session = False
+                first_message = True
+                continue
+            stream.write(('' if first_message else ',') + '\n    ' +
+                         json.dumps(message, ensure_ascii=False))
+            first_message = False
+        if not first_session:
+            stream.write(']}')
+
+        stream.write('\n], "knowledge": [')
+        for index, item in enumerate(self._items()):
+            stream.write((',' if index else '') + '\n  ' + json.dumps(item, ensure_ascii=False))
+        stream.write('\n]}\n')
+
+    def _write_markdown(self, stream: TextIO):
+        stream.write(f"# NAVI Memory Export\n\n_Exported {datetime.now().isoformat()}_\n\n")
+        stream.write("## Conversations\n")
+        for session_id, message in self._messages():
+            if message is None:
+                stream.write(f"\n### Session `{session_id}`\n\n")
+                continue
+            stream.write(f"**{message['role'].capitalize()}** ({message['timestamp']}):\n\n")
+            stream.write(f"{message['content']}\n\n")
+            self._write_markdown_metadata(stream, message)
+
+        stream.write("\n## Knowledge\n")
+        for item in self._items():
+            stream.write(f"\n### {item['id']}\n\n_{item['timestamp']}_\n\n{item['content']}\n\n")
+            self._write_markdown_metadata(stream, item)
+
+    def _write_markdown_metadata(self, stream: TextIO, record: Dict[str, Any]):
+        if record.get("metadata"):
+            metadata = json.dumps(record["metadata"], ensure_ascii=False, indent=2)
+            stream.write(f"<details><summary>Metadata</summary>\n\n```json\n{metadata}\n```\n\n</details>\n\n")
+
+    def _write_csv(self, stream: TextIO):
+        fields = self.CSV_FIELDS if self.include_metadata else self.CSV_FIELDS[:-1]
+        writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for session_id, message in self._messages():
+            if message is None:
+                continue
+            writer.writerow(self._csv_row(message, kind="message", session_id=session_id))
+        for item in self._items():
+            writer.writerow(self._csv_row(item, kind="knowledge"))
+
+    def _csv_row(self, record: Dict[str, Any], **extra) -> Dict[str, Any]:
+        row = dict(record, **extra)
+        if "metadata" in row:
+            row["metadata"] = json.dumps(row["metadata"], ensure_ascii=False)
+        return row
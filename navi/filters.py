@@ -0,0 +1,163 @@
+# NAVI Knowledge Filters
+# Secondary indexes over knowledge metadata for filtered retrieval
+
+import bisect
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+def epoch_seconds(moment: Union[datetime, float]) -> float:
+    """Seconds since the epoch; naive times are compared as they are, which
+    also avoids the slow local-time conversion of ``datetime.timestamp``.
+    Numbers are taken to be epoch seconds already."""
+    if isinstance(moment, (int, float)):
+        return float(moment)
+    if moment.tzinfo is None:
+        return (moment - EPOCH).total_seconds()
+    return (moment.replace(tzinfo=None) - EPOCH).total_seconds() - moment.utcoffset().total_seconds()
+
+class MetadataIndex:
+    """Maps metadata values and timestamps to knowledge item ids
+
+    Each equality field (session, type, agent) maps a value to the set of
+    item ids carrying it, and timestamps are kept sorted so a time range is
+    two bisections. ``select`` starts from the smallest matching set and
+    checks the remaining conditions per item, so its cost follows the size
+    of the filtered subset rather than of the whole knowledge base.
+    """
+
+    FIELDS = ("session", "type", "agent")
+
+    def __init__(self):
+        self._by_field: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in self.FIELDS}
+        # Parallel lists sorted by time
+        self._moments: List[float] = []
+        self._time_keys: List[str] = []
+        self._entries: Dict[str, Tuple[Dict[str, Any], float, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def fields_of(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract the indexed fields from a knowledge item's metadata"""
+        context = metadata.get("context") or {}
+        return {
+            "session": context.get("session_id", "default"),
+            "type": metadata.get("type"),
+            "agent": metadata.get("agent") or context.get("agent")
+        }
+
+    def add(self, key: str, metadata: Dict[str, Any], timestamp: Union[datetime, float], value: Any = None):
+        """Index an item, replacing any earlier entry for ``key``"""
+        if key in self._entries:
+            self.remove(key)
+        fields = self.fields_of(metadata)
+        moment = epoch_seconds(timestamp)
+        for field, field_value in fields.items():
+            if field_value is not None:
+                self._by_field[field].setdefault(field_value, set()).add(key)
+        # Items mostly arrive in time order, so this usually appends
+        position = bisect.bisect_right(self._moments, moment)
+        self._moments.insert(position, moment)
+        self._time_keys.insert(position, key)
+        self._entries[key] = (fields, moment, value)
+
+    def _drop_fields(self, key: str, fields: Dict[str, Any]):
+        for field, value in fields.items():
+            keys = self._by_field[field].get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_field[field][value]
+
+    def remove(self, key: str) -> bool:
+        """Drop ``key``; returns False if it was not indexed"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        fields, moment, _ = entry
+        self._drop_fields(key, fields)
+        position = bisect.bisect_left(self._moments, moment)
+        while position < len(self._moments) and self._moments[position] == moment:
+            if self._time_keys[position] == key:
+                del self._moments[position]
+                del self._time_keys[position]
+                break
+            position += 1
+        return True
+
+    def select(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               **conditions) -> Optional[Set[str]]:
+        """Ids of items matching every condition, or None when nothing is filtered
+
+        ``conditions`` are field=value pairs from ``FIELDS``; ``since`` and
+        ``until`` bound the timestamp inclusively.
+        """
+        conditions = {field: value for field, value in conditions.items() if value is not None}
+        for field in conditions:
+            if field not in self.FIELDS:
+                raise ValueError(f"Cannot filter on '{field}'")
+        if not conditions and since is None and until is None:
+            return None
+
+        start = epoch_seconds(since) if since is not None else None
+        end = epoch_seconds(until) if until is not None else None
+        if not conditions:
+            low = 0 if start is None else bisect.bisect_left(self._moments, start)
+            high = len(self._moments) if end is None else bisect.bisect_right(self._moments, end)
+            return set(self._time_keys[low:high])
+
+        sets = [self._by_field[field].get(value, set()) for field, value in conditions.items()]
+        selected = set()
+        for key in min(sets, key=len):
+            fields, moment, _ = self._entries[key]
+            if start is not None and moment < start:
+                continue
+            if end is not None and moment > end:
+                continue
+            if all(fields[field] == value for field, value in conditions.items()):
+                selected.add(key)
+        return selected
+
+    def pop_before(self, until: datetime, limit: Optional[int] = None) -> List[str]:
+        """Remove and return the oldest keys timestamped at or before ``until``
+
+        At most ``limit`` keys are taken, oldest first; they leave the time
+        order in one slice deletion rather than one bisection each.
+        """
+        count = bisect.bisect_right(self._moments, epoch_seconds(until))
+        if limit is not None:
+            count = min(count, limit)
+        keys = self._time_keys[:count]
+        del self._moments[:count]
+        del self._time_keys[:count]
+        for key in keys:
+            fields, _, _ = self._entries.pop(key)
+            self._drop_fields(key, fields)
+        return keys
+
+    def get(self, key: str) -> Any:
+        """The value stored with ``key``"""
+        return self._entries[key][2]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of distinct values per field"""
+        return dict({field: len(values) for field, values in self._by_field.items()},
+                    items=len(self._entries))
+
+class TimeIndex(MetadataIndex):
+    """Keys ordered by time alone, such as sessions by their last message"""
+
+    FIELDS = ()
+
+    @staticmethod
+    def fields_of(metadata: Any) -> Dict[str, Any]:
+        return {}
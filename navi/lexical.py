@@ -0,0 +1,202 @@
+# NAVI Lexical Search
+# Tokenization, an incrementally maintained BM25 index and rank fusion
+
+import re
+import math
+import heapq
+import logging
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Any, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a about an and are as at be been but by can could did do does for from had has
+have how i if in into is it its me my no not of on or our so that the their them
+then there these they this to was we were what when where which who why will
+with would you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, without stopwords"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """Inverted index with Okapi BM25 ranking, updated one document at a time
+
+    Each term maps to parallel int arrays of document numbers and term
+    frequencies, so a query reads only the postings of its own terms.
+    Removing a document drops it from the statistics at once; its postings
+    are skipped until ``prune()`` (or enough removals) compacts them away.
+    Document numbers in a posting list stay ascending, so a search
+    restricted to a few keys looks each one up instead of scanning.
+    """
+
+    # Compact automatically once this share of document numbers is dead
+    PRUNE_RATIO = 0.5
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._keys: List[Optional[str]] = []
+        self._values: List[Any] = []
+        self._lengths = array('i')
+        self._terms: List[Optional[Tuple[str, ...]]] = []
+        self._document_frequencies: Counter = Counter()
+        self._numbers: Dict[str, int] = {}
+        self._total_length = 0
+        self._removed = 0
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._numbers
+
+    def add(self, key: str, text: str, value: Any = None):
+        """Index ``text`` under ``key``, replacing any earlier version"""
+        if key in self._numbers:
+            self.remove(key)
+        terms = Counter(tokenize(text))
+        number = len(self._keys)
+        self._numbers[key] = number
+        self._keys.append(key)
+        self._values.append(value)
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._terms.append(tuple(terms))
+        self._document_frequencies.update(terms.keys())
+        self._total_length += length
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('i'), array('i'))
+            postings[0].append(number)
+            postings[1].append(frequency)
+
+    def remove(self, key: str) -> bool:
+        """Remove ``key``; returns False if it was not indexed"""
+        number = self._numbers.pop(key, None)
+        if number is None:
+            return False
+        self._keys[number] = None
+        self._values[number] = None
+        self._document_frequencies.subtract(self._terms[number])
+        self._terms[number] = None
+        self._total_length -= self._lengths[number]
+        self._removed += 1
+        if self._removed > self.PRUNE_RATIO * len(self._keys):
+            self.prune()
+        return True
+
+    def clear(self):
+        """Remove every document"""
+        self.__init__(self.k1, self.b)
+
+    def prune(self):
+        """Drop removed documents from the postings and renumber the rest"""
+        if not self._removed:
+            return
+        renumber = array('i', [-1]) * len(self._keys)
+        keys, values, lengths, terms = [], [], array('i'), []
+        for number, key in enumerate(self._keys):
+            if key is not None:
+                renumber[number] = len(keys)
+                keys.append(key)
+                values.append(self._values[number])
+                lengths.append(self._lengths[number])
+                terms.append(self._terms[number])
+
+        postings = {}
+        for term, (numbers, frequencies) in self._postings.items():
+            live_numbers, live_frequencies = array('i'), array('i')
+            for number, frequency in zip(numbers, frequencies):
+                new_number = renumber[number]
+                if new_number >= 0:
+                    live_numbers.append(new_number)
+                    live_frequencies.append(frequency)
+            if live_numbers:
+                postings[term] = (live_numbers, live_frequencies)
+
+        self._postings = postings
+        self._keys = keys
+        self._values = values
+        self._lengths = lengths
+        self._terms = terms
+        self._document_frequencies = +self._document_frequencies
+        self._numbers = {key: number for number, key in enumerate(keys)}
+        self._removed = 0
+
+    def search(self, query: str, k: int, keys: Optional[Iterable[str]] = None) -> List[Tuple[Any, float]]:
+        """Return up to ``k`` (value, BM25 score) pairs, best first
+
+        ``keys`` restricts the results to those documents; term statistics
+        still cover the whole index. When the keys are few next to a term's
+        postings, each key is binary-searched rather than scanning the list.
+        """
+        documents = len(self._numbers)
+        if not documents or k <= 0:
+            return []
+        allowed = None
+        if keys is not None:
+            allowed = {self._numbers[key] for key in keys if key in self._numbers}
+            if not allowed:
+                return []
+            lookup_cost = len(allowed) * max(1, documents.bit_length())
+        average_length = self._total_length / documents or 1.0
+        k1, b = self.k1, self.b
+        keys, lengths = self._keys, self._lengths
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            document_frequency = self._document_frequencies.get(term, 0)
+            if postings is None or document_frequency <= 0:
+                continue
+            idf = math.log(1 + (documents - document_frequency + 0.5) / (document_frequency + 0.5))
+            numbers, frequencies = postings
+            if allowed is not None and lookup_cost < len(numbers):
+                matches = []
+                for number in allowed:
+                    position = bisect_left(numbers, number)
+                    if position < len(numbers) and numbers[position] == number:
+                        matches.append((number, frequencies[position]))
+            else:
+                matches = [(number, frequency) for number, frequency in zip(numbers, frequencies)
+                           if keys[number] is not None
+                           and (allowed is None or number in allowed)]
+            for number, frequency in matches:
+                norm = k1 * (1 - b + b * lengths[number] / average_length)
+                scores[number] = scores.get(number, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        return [(self._values[number], score) for number, score in best]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size information"""
+        return {
+            "documents": len(self._numbers),
+            "terms": len(self._postings),
+            "removed_pending": self._removed
+        }
+
+def reciprocal_rank_fusion(rankings: List[List[Any]], k: int = 60,
+                           key: Callable[[Any], Any] = id) -> List[Any]:
+    """Merge ranked lists by summing 1 / (k + rank) for every list an entry is in
+
+    Entries are matched with ``key``; the first object seen for a key is
+    the one returned.
+    """
+    scores: Dict[Any, float] = {}
+    entries: Dict[Any, Any] = {}
+    for ranking in rankings:
+        for rank, entry in enumerate(ranking, 1):
+            entry_key = key(entry)
+            entries.setdefault(entry_key, entry)
+            scores[entry_key] = scores.get(entry_key, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(scores.items(), key=itemgetter(1), reverse=True)
+    return [entries[entry_key] for entry_key, _ in ordered]
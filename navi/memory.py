@@ -2,33 +2,119 @@
 # Local-first memory system with RAG and JSON storage
 
 import json
+import time
 import asyncio
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
-from datetime import datetime, timedelta
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from operator import itemgetter
+from array import array
 import hashlib
 
+from navi.storage import InterProcessLock, MemoryStore, PersistenceWriter, create_memory_store
+from navi.vectors import EmbeddingMatrix, IVFIndex, QuantizedIndex, ShardedIndex, VectorIndex
+from navi.snapshot import WarmSnapshot, paused_gc
+from navi.export import MemoryExporter
+from navi.lexical import BM25Index, reciprocal_rank_fusion
+from navi.filters import EPOCH, MetadataIndex, TimeIndex, epoch_seconds
+from navi.messages import MessageIndex
+from navi.dedup import NearDuplicateIndex, jaccard, polarity, shingles
+from navi.eviction import EvictionPolicy
+from navi.cache import EmbeddingCache, ResultCache, normalize_query
+
 logger = logging.getLogger(__name__)
 
-@dataclass
+SEARCH_MODES = ("semantic", "keyword", "hybrid")
+
 class MemoryItem:
-    """Individual memory item"""
-    id: str
-    content: str
-    metadata: Dict[str, Any]
-    timestamp: datetime
-    embedding: Optional[List[float]] = None
+    """Individual memory item
+    
+    Kept compact since the knowledge base holds every item in memory:
+    slots instead of a ``__dict__``, the timestamp as epoch seconds
+    (``created``, with the UTC offset of an aware timestamp in
+    ``utc_offset``), embeddings as a row of the shared embedding matrix or
+    else a packed float32 array, and the question/answer texts of a Q/A
+    pair held once in ``content`` rather than again in ``metadata``.
+    ``to_dict`` restores the full record.
+    """
+    
+    __slots__ = ("id", "content", "metadata", "created", "utc_offset", "_vector", "embedding_row",
+                 "qa_split")
+    
+    def __init__(self, id: str, content: str, metadata: Dict[str, Any], timestamp: Any,
+                 embedding: Optional[List[float]] = None, embedding_row: Optional[int] = None):
+        self.id = id
+        self.content = content
+        self.timestamp = timestamp
+        self.embedding = embedding
+        self.embedding_row = embedding_row
+        # Length of the question when the pair's texts were left out of metadata
+        self.qa_split: Optional[int] = None
+        user_message = metadata.get("user_message")
+        assistant_response = metadata.get("assistant_response")
+        if (isinstance(user_message, str) and isinstance(assistant_response, str)
+                and content == f"Q: {user_message}\nA: {assistant_response}"):
+            metadata = {key: value for key, value in metadata.items()
+                        if key not in ("user_message", "assistant_response")}
+            self.qa_split = len(user_message)
+        self.metadata = metadata
+    
+    @property
+    def timestamp(self) -> datetime:
+        if self.utc_offset is None:
+            return EPOCH + timedelta(seconds=self.created)
+        offset = timedelta(seconds=self.utc_offset)
+        return (EPOCH + timedelta(seconds=self.created) + offset).replace(tzinfo=timezone(offset))
+    
+    @timestamp.setter
+    def timestamp(self, value: Any):
+        self.created = epoch_seconds(value)
+        # Seconds east of UTC, or None for naive (and numeric) timestamps
+        offset = value.utcoffset() if isinstance(value, datetime) else None
+        self.utc_offset = offset.total_seconds() if offset is not None else None
+    
+    @property
+    def embedding(self) -> Optional[array]:
+        """Inline embedding, only kept for items outside the matrix"""
+        return self._vector
+    
+    @embedding.setter
+    def embedding(self, vector: Optional[List[float]]):
+        self._vector = array('f', vector) if vector is not None else None
+    
+    @property
+    def user_message(self) -> Optional[str]:
+        if self.qa_split is None:
+            return self.metadata.get("user_message")
+        return self.content[3:3 + self.qa_split]
+    
+    @property
+    def assistant_response(self) -> Optional[str]:
+        if self.qa_split is None:
+            return self.metadata.get("assistant_response")
+        return self.content[3 + self.qa_split + 4:]
+    
+    def full_metadata(self) -> Dict[str, Any]:
+        """Metadata including the question and answer texts"""
+        if self.qa_split is None:
+            return self.metadata
+        return dict(self.metadata, user_message=self.user_message,
+                    assistant_response=self.assistant_response)
+    
+    def __repr__(self) -> str:
+        return f"MemoryItem(id={self.id!r}, timestamp={self.timestamp.isoformat()!r})"
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON storage"""
         return {
             "id": self.id,
             "content": self.content,
-            "metadata": self.metadata,
+            "metadata": self.full_metadata(),
             "timestamp": self.timestamp.isoformat(),
-            "embedding": self.embedding
+            "embedding": self._vector.tolist() if self._vector is not None else None,
+            "embedding_row": self.embedding_row
         }
     
     @classmethod
@@ -39,8 +125,22 @@ class MemoryItem:
             content=data["content"],
             metadata=data["metadata"],
             timestamp=datetime.fromisoformat(data["timestamp"]),
-            embedding=data.get("embedding")
+            embedding=data.get("embedding"),
+            embedding_row=data.get("embedding_row")
         )
+    
+    def to_tuple(self) -> Tuple[Any, ...]:
+        """Compact fields as held in memory, for snapshots"""
+        return (self.id, self.content, self.metadata, self.created, self.utc_offset,
+                self._vector, self.embedding_row, self.qa_split)
+    
+    @classmethod
+    def from_tuple(cls, fields: Tuple[Any, ...]) -> "MemoryItem":
+        """Rebuild an item from ``to_tuple`` without re-checking its metadata"""
+        item = cls.__new__(cls)
+        (item.id, item.content, item.metadata, item.created, item.utc_offset,
+         item._vector, item.embedding_row, item.qa_split) = fields
+        return item
 
 class ConversationMemory:
     """Manages conversation context and history"""
@@ -81,9 +181,11 @@ class ConversationMemory:
 class LocalEmbeddings:
     """Local embeddings using sentence transformers"""
     
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 cache: Optional[EmbeddingCache] = None):
         self.model_name = model_name
         self.model = None
+        self.cache = cache
         
     async def initialize(self):
         """Initialize the embedding model"""
@@ -91,18 +193,45 @@ class LocalEmbeddings:
             from sentence_transformers import SentenceTransformer
             self.model = SentenceTransformer(self.model_name)
             logger.info(f"✅ Initialized local embeddings: {self.model_name}")
+            if self.cache is not None:
+                self.cache.load()
         except ImportError:
             logger.warning("⚠️  sentence-transformers not installed. Embeddings disabled.")
         except Exception as e:
             logger.error(f"❌ Failed to initialize embeddings: {e}")
     
-    async def encode(self, texts: List[str]) -> List[List[float]]:
-        """Encode texts to embeddings"""
+    async def encode(self, texts: List[str], cached: bool = False) -> List[List[float]]:
+        """Encode texts to embeddings
+        
+        Only ``cached=True`` encodes, meant for search queries, go through
+        the cache and run the model for uncached texts alone. Everything
+        else is written once and never looked up again, so it goes straight
+        to the model and stays out of the cache.
+        """
         if not self.model:
             return []
+        if self.cache is None or not cached:
+            return await self._encode(texts)
+        
+        vectors = [self.cache.get(self.model_name, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if not missing:
+            return vectors
         
+        # One model call for every miss, merged back in input order
+        computed = await self._encode(missing)
+        if not computed:
+            return []
+        fresh = dict(zip(missing, computed))
+        for text, vector in fresh.items():
+            self.cache.put(self.model_name, text, vector)
+        return [fresh[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+    
+    async def _encode(self, texts: List[str]) -> List[List[float]]:
         try:
-            embeddings = self.model.encode(texts)
+            # Inference runs off the event loop so other work can overlap it
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(None, self.model.encode, texts)
             return embeddings.tolist()
         except Exception as e:
             logger.error(f"Encoding error: {e}")
@@ -131,19 +260,174 @@ class LocalEmbeddings:
 class MemoryManager:
     """Main memory management system"""
     
-    def __init__(self, data_dir: str = "data/memory"):
+    def __init__(self, data_dir: str = "data/memory", config: Optional[Dict[str, Any]] = None,
+                 export_config: Optional[Dict[str, Any]] = None):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.config = config or {}
+        self.export_config = export_config or {}
+        storage_config = self.config.get("storage", {})
+        self.retrieval_config = self.config.get("retrieval", {})
         
         self.conversations_file = self.data_dir / "conversations.json"
         self.knowledge_file = self.data_dir / "knowledge.json"
-        self.embeddings_file = self.data_dir / "embeddings.json"
+        self.embeddings_file = self.data_dir / "embeddings.f32"
         
         self.conversations: Dict[str, List[Dict]] = {}
         self.knowledge: List[MemoryItem] = []
-        self.embeddings = LocalEmbeddings()
+        # Knowledge items by id, for constant-time duplicate checks
+        self.knowledge_ids: Dict[str, MemoryItem] = {}
+        
+        # Repeated texts (retries, repeated queries) skip the model
+        performance_config = self.config.get("performance", {})
+        embedding_cache = None
+        if performance_config.get("cache_embeddings", True):
+            cache_file = performance_config.get("embedding_cache_file")
+            embedding_cache = EmbeddingCache(
+                max_entries=performance_config.get("embedding_cache_entries", 10000),
+                cache_file=self.data_dir / cache_file if cache_file else None
+            )
+        self.embeddings = LocalEmbeddings(
+            self.config.get("embeddings", {}).get("model", "sentence-transformers/all-MiniLM-L6-v2"),
+            cache=embedding_cache
+        )
+        
+        # Several processes may share the data directory; each picks up the
+        # others' writes at most every refresh_interval_seconds
+        self.shared = storage_config.get("shared", False)
+        self.refresh_interval = storage_config.get("refresh_interval_seconds", 2.0)
+        self._last_refresh = time.monotonic()
+        
+        # Embeddings live in a shared memory-mapped matrix when numpy is available
+        self.embedding_matrix: Optional[EmbeddingMatrix] = None
+        if EmbeddingMatrix.available():
+            matrix_lock = InterProcessLock(self.data_dir / "embeddings.lock") if self.shared else None
+            self.embedding_matrix = EmbeddingMatrix(self.embeddings_file, lock=matrix_lock)
+        # Rows of removed items are dropped on close once they make up this share
+        self.repack_dead_fraction = self.config.get("embeddings", {}).get("repack_dead_fraction", 0.25)
+        
+        # Every saved message, searchable with search_conversations. The
+        # indexes are built from the index's own log on first search.
+        self.message_index: Optional[MessageIndex] = None
+        conversations_config = self.config.get("conversations", {})
+        if conversations_config.get("search_index", True):
+            messages_lock = InterProcessLock(self.data_dir / "messages.lock") if self.shared else None
+            message_matrix = None
+            if EmbeddingMatrix.available():
+                message_matrix = EmbeddingMatrix(self.data_dir / "message_embeddings.f32", lock=messages_lock)
+            self.message_index = MessageIndex(
+                self.data_dir / conversations_config.get("index_file", "messages.jsonl"),
+                matrix=message_matrix,
+                lock=messages_lock
+            )
+        self._message_index_lock = asyncio.Lock()
+        self._message_backfill: Optional[asyncio.Task] = None
+        
+        # Normalised copy of every item's embedding for one-product searches,
+        # clustered for approximate search when the ANN index is enabled,
+        # quantized and rescored from the embedding matrix, or scanned in
+        # shards by a process pool
+        self.vector_index: Optional[VectorIndex] = None
+        embeddings_config = self.config.get("embeddings", {})
+        ann_config = embeddings_config.get("ann", {})
+        quantization = embeddings_config.get("quantization", {})
+        quantization_mode = quantization.get("mode", "none")
+        # Quantized recall is sampled against exact search after each load,
+        # in the background; 0 (the default) skips it
+        self.recall_samples = quantization.get("recall_samples", 0)
+        self._recall_task: Optional[asyncio.Task] = None
+        sharding = embeddings_config.get("sharding", {})
+        if sharding.get("enabled", False) and (ann_config.get("enabled", False) or quantization_mode != "none"):
+            logger.warning("⚠️  Sharded search is ignored while the ANN index or quantization is enabled")
+        if VectorIndex.available() and ann_config.get("enabled", False):
+            if quantization_mode != "none":
+                logger.warning("⚠️  Embedding quantization is ignored while the ANN index is enabled")
+            self.vector_index = IVFIndex(
+                nlist=ann_config.get("nlist", 0),
+                nprobe=ann_config.get("nprobe", 16),
+                min_items=ann_config.get("min_items", 50000),
+                index_file=self.data_dir / ann_config.get("index_file", "ann_index.npz")
+            )
+        elif VectorIndex.available() and quantization_mode != "none":
+            self.vector_index = QuantizedIndex(
+                mode=quantization_mode,
+                dimensions=quantization.get("dimensions", 0),
+                rescore_factor=quantization.get("rescore_factor", 4),
+                vector_source=self._item_vectors
+            )
+        elif ShardedIndex.available() and sharding.get("enabled", False):
+            self.vector_index = ShardedIndex(
+                shards=sharding.get("shards", 0),
+                min_items=sharding.get("min_items", 200000)
+            )
+        elif VectorIndex.available():
+            self.vector_index = VectorIndex()
+        
+        # Keyword index for searches without embeddings, built on first use
+        self.text_index: Optional[BM25Index] = None
+        
+        # Secondary indexes for filtered searches, built on first use
+        self.metadata_index: Optional[MetadataIndex] = None
+        
+        # MinHash buckets for spotting near-duplicate interactions, built on
+        # first use; a similarity of 1.0 only skips exact repeats
+        knowledge_config = self.config.get("knowledge", {})
+        self.near_duplicate_similarity = knowledge_config.get("near_duplicate_similarity", 0.9)
+        self.duplicate_index: Optional[NearDuplicateIndex] = None
+        
+        # Capacity limits (0 = unbounded); the eviction policy, fed with
+        # search hits, decides which items go first
+        self.max_knowledge_items = knowledge_config.get("max_knowledge_items", 0)
+        self.max_knowledge_bytes = int(performance_config.get("max_cache_size_mb", 0) * 1024 * 1024)
+        self.knowledge_bytes = 0
+        self.evicted = 0
+        self.eviction: Optional[EvictionPolicy] = None
+        if self.max_knowledge_items or self.max_knowledge_bytes:
+            self.eviction = EvictionPolicy(
+                knowledge_config.get("eviction_policy", "lru"),
+                half_life_days=knowledge_config.get("eviction_half_life_days", 30)
+            )
+        
+        # Recent search results, invalidated whenever the knowledge base changes
+        self.knowledge_generation = 0
+        cache_config = self.retrieval_config.get("cache", {})
+        self.result_cache: Optional[ResultCache] = None
+        if cache_config.get("enabled", True):
+            self.result_cache = ResultCache(
+                max_entries=cache_config.get("max_entries", 256),
+                ttl_seconds=cache_config.get("ttl_seconds", 300)
+            )
+        
+        self.store: MemoryStore = create_memory_store(self.data_dir, storage_config)
+        self.writer = PersistenceWriter(
+            interval=storage_config.get("flush_interval_seconds", 1.0),
+            max_pending=storage_config.get("flush_max_pending", 50)
+        )
+        
+        # Fully built state cached for fast startup, checked against the store files
+        # (not in shared mode, where other processes keep changing the files)
+        self.snapshot: Optional[WarmSnapshot] = None
+        if storage_config.get("warm_start_snapshot", True) and not self.shared:
+            self.snapshot = WarmSnapshot(self.data_dir / storage_config.get("snapshot_file", "snapshot.pkl"))
+        self._snapshot_current = False
+        self._knowledge_loaded = False
         
         self.active_conversations: Dict[str, ConversationMemory] = {}
+        
+        # Sessions ordered by their last message, so retention finds expired
+        # ones by bisection; built on first use
+        self.session_times: Optional[TimeIndex] = None
+        
+        # Indexes retention is building in slices; kept current meanwhile
+        self._building_filters: Optional[MetadataIndex] = None
+        self._building_timeline: Optional[TimeIndex] = None
+        self._retention_lock = asyncio.Lock()
+        
+        # Background retention, applied in short slices on the event loop
+        self.cleanup_config = self.config.get("cleanup", {})
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self.cleanup_stats: Dict[str, Any] = {"runs": 0, "last_run": None,
+                                              "knowledge_items": 0, "sessions": 0}
     
     async def initialize(self):
         """Initialize memory system"""
@@ -152,64 +436,605 @@ class MemoryManager:
         # Initialize embeddings
         await self.embeddings.initialize()
         
+        # Start background persistence
+        self.writer.start()
+        
         # Load existing data
         await self.load_conversations()
         await self.load_knowledge()
         
+        if self.cleanup_config.get("enabled", True):
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        
         logger.info("✅ Memory system initialized")
     
     async def load_conversations(self):
         """Load conversation history"""
-        if self.conversations_file.exists():
-            try:
-                with open(self.conversations_file, 'r', encoding='utf-8') as f:
-                    self.conversations = json.load(f)
+        try:
+            self.conversations = self.store.load_conversations()
+            if not self.store.lazy_sessions:
                 logger.info(f"📚 Loaded {len(self.conversations)} conversation sessions")
-            except Exception as e:
-                logger.error(f"Failed to load conversations: {e}")
+            if self.message_index is not None:
+                self.message_index.attach()
+        except Exception as e:
+            logger.error(f"Failed to load conversations: {e}")
     
     async def save_conversations(self):
-        """Save conversation history"""
+        """Hand a full snapshot of conversation history to the store"""
         try:
             # Include active conversations
             all_conversations = self.conversations.copy()
             for session_id, conv in self.active_conversations.items():
-                all_conversations[session_id] = conv.messages
+                all_conversations[session_id] = list(conv.messages)
             
-            with open(self.conversations_file, 'w', encoding='utf-8') as f:
-                json.dump(all_conversations, f, indent=2, ensure_ascii=False)
+            self.store.snapshot_conversations(all_conversations)
+            self._mark_dirty()
         except Exception as e:
             logger.error(f"Failed to save conversations: {e}")
     
     async def load_knowledge(self):
         """Load knowledge base"""
-        if self.knowledge_file.exists():
-            try:
-                with open(self.knowledge_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.knowledge = [MemoryItem.from_dict(item) for item in data]
+        try:
+            if self.embedding_matrix is not None:
+                self.embedding_matrix.load()
+            if not self._restore_snapshot():
+                self.knowledge = [MemoryItem.from_dict(item) for item in self.store.load_knowledge()]
                 logger.info(f"📖 Loaded {len(self.knowledge)} knowledge items")
-            except Exception as e:
-                logger.error(f"Failed to load knowledge: {e}")
+            self._knowledge_loaded = True
+        except Exception as e:
+            logger.error(f"Failed to load knowledge: {e}")
+            return
+        
+        self.knowledge_ids = {item.id: item for item in self.knowledge}
+        if self.eviction is not None:
+            self.eviction.clear()
+            self.knowledge_bytes = 0
+            with paused_gc():
+                for item in self.knowledge:
+                    self._track_item(item)
+        self._rebuild_vector_index()
+        self.text_index = None
+        self.metadata_index = None
+        self._building_filters = None
+        self.duplicate_index = None
+        self.knowledge_generation += 1
+        
+        # Move inline embeddings from older stores into the matrix
+        if self.embedding_matrix is not None:
+            migrated = 0
+            for item in self.knowledge:
+                if item.embedding and item.embedding_row is None:
+                    item.embedding_row = self.embedding_matrix.append(item.embedding)
+                    item.embedding = None
+                    migrated += 1
+            if migrated:
+                logger.info(f"🧮 Moved {migrated} inline embeddings into {self.embeddings_file.name}")
+                await self.save_knowledge()
+        
+        self._enforce_capacity()
+        
+        # Report how much the quantized index gives up against exact search,
+        # off the event loop so loading never waits for the full scan
+        if (self.recall_samples and isinstance(self.vector_index, QuantizedIndex)
+                and (self._recall_task is None or self._recall_task.done())):
+            self._recall_task = asyncio.create_task(self._measure_recall_in_background())
     
     async def save_knowledge(self):
-        """Save knowledge base"""
+        """Rewrite the whole knowledge base"""
         try:
-            data = [item.to_dict() for item in self.knowledge]
-            with open(self.knowledge_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # Row ids are shared with other processes, so never renumber them
+            if self.embedding_matrix is not None and not self.shared:
+                self._repack_embeddings()
+            self.store.rewrite_knowledge([item.to_dict() for item in self.knowledge])
+            self._mark_dirty()
         except Exception as e:
             logger.error(f"Failed to save knowledge: {e}")
     
+    def _rebuild_vector_index(self):
+        """Index every knowledge item that has an embedding"""
+        if self.vector_index is None:
+            return
+        self.vector_index.clear()
+        matrix_rows = len(self.embedding_matrix) if self.embedding_matrix is not None else 0
+        row_items, inline_items = [], []
+        for item in self.knowledge:
+            if item.embedding is not None:
+                inline_items.append(item)
+            elif item.embedding_row is not None and item.embedding_row < matrix_rows:
+                row_items.append(item)
+        try:
+            if row_items:
+                # One gather from the mapped matrix instead of a lookup per item
+                vectors = self.embedding_matrix.take([item.embedding_row for item in row_items])
+                self.vector_index.add_batch([item.id for item in row_items], vectors, row_items)
+            if inline_items:
+                self.vector_index.add_batch(
+                    [item.id for item in inline_items],
+                    [item.embedding for item in inline_items],
+                    inline_items
+                )
+        except ValueError as e:
+            logger.error(f"Failed to index embeddings: {e}")
+            self.vector_index.clear()
+            return
+        if isinstance(self.vector_index, IVFIndex):
+            self.vector_index.load()
+    
+    def _keyword_index(self) -> BM25Index:
+        """The BM25 index over knowledge content, built on first use"""
+        if self.text_index is None:
+            self.text_index = BM25Index()
+            with paused_gc():
+                for item in self.knowledge:
+                    self.text_index.add(item.id, item.content, item)
+            logger.info(f"🔤 Built keyword index over {len(self.knowledge)} knowledge items")
+        return self.text_index
+    
+    def _filter_index(self) -> MetadataIndex:
+        """Session, type, agent and time indexes, built on first use"""
+        if self.metadata_index is None:
+            self.metadata_index = MetadataIndex()
+            with paused_gc():
+                for item in self.knowledge:
+                    self.metadata_index.add(item.id, item.metadata, item.created, item)
+        return self.metadata_index
+    
+    @staticmethod
+    def _question(item: MemoryItem) -> str:
+        """The question of a Q/A item, or the whole content of any other"""
+        question = item.user_message
+        return question if question is not None else item.content
+    
+    def _near_duplicates(self) -> NearDuplicateIndex:
+        """MinHash buckets over knowledge questions, built on first use"""
+        if self.duplicate_index is None:
+            self.duplicate_index = NearDuplicateIndex()
+            with paused_gc():
+                for item in self.knowledge:
+                    self.duplicate_index.add(item.id, self.duplicate_index.signature(shingles(self._question(item))))
+            logger.info(f"🧬 Built near-duplicate index over {len(self.knowledge)} knowledge items")
+        return self.duplicate_index
+    
+    def _find_near_duplicate(self, question: str) -> Optional[MemoryItem]:
+        """A stored item asking nearly the same question
+        
+        Questions are compared as word-bigram sets with stopwords kept, so
+        "turn on" and "turn off" share little, and never match when their
+        negations or on/off particles differ.
+        """
+        if self.near_duplicate_similarity >= 1.0:
+            return None
+        question_shingles = shingles(question)
+        question_polarity = polarity(question)
+        index = self._near_duplicates()
+        for item_id in index.candidates(index.signature(question_shingles), limit=8):
+            item = self.knowledge_ids.get(item_id)
+            if item is None:
+                continue
+            stored = self._question(item)
+            if (polarity(stored) == question_polarity and
+                    jaccard(question_shingles, shingles(stored)) >= self.near_duplicate_similarity):
+                return item
+        return None
+    
+    @staticmethod
+    def _item_version(metadata: Dict[str, Any]) -> Tuple[int, str]:
+        """Orders the stored versions of one item: repeats only grow, and
+        each one stamps last_repeated"""
+        return (metadata.get("repeats", 0), metadata.get("last_repeated") or "")
+    
+    def _repeat_if_stored(self, item_id: str) -> bool:
+        """Count a repeat if the item is already stored; returns whether it was"""
+        existing = self.knowledge_ids.get(item_id)
+        if existing is None:
+            return False
+        self._record_repeat(existing)
+        return True
+    
+    def _record_repeat(self, item: MemoryItem):
+        """Count a repeated interaction on the item it duplicates"""
+        now = datetime.now()
+        item.metadata["repeats"] = item.metadata.get("repeats", 0) + 1
+        item.metadata["last_repeated"] = now.isoformat()
+        if self.eviction is not None:
+            self.eviction.touch(item.id, epoch_seconds(now))
+        self.store.append_knowledge([item.to_dict()])
+        self._mark_dirty()
+    
+    @staticmethod
+    def _item_bytes(item: MemoryItem) -> int:
+        """Rough in-memory size of an item: its text, any inline embedding
+        and the overhead of the object, id and metadata (see bench_memory.py)"""
+        size = len(item.content) + 768
+        if item.embedding is not None:
+            size += 4 * len(item.embedding)
+        return size
+    
+    def _track_item(self, item: MemoryItem):
+        """Register an item with the eviction policy"""
+        last_used = item.metadata.get("last_repeated")
+        self.eviction.add(
+            item.id,
+            epoch_seconds(datetime.fromisoformat(last_used)) if last_used else item.created,
+            hits=item.metadata.get("repeats", 0)
+        )
+        self.knowledge_bytes += self._item_bytes(item)
+    
+    def _enforce_capacity(self):
+        """Evict items beyond max_knowledge_items or max_cache_size_mb
+        
+        Evicts down to 1% below the limits, so the list rewrite is paid
+        once per batch rather than on every new item.
+        """
+        if self.eviction is None:
+            return
+        max_items, max_bytes = self.max_knowledge_items, self.max_knowledge_bytes
+        if not ((max_items and len(self.knowledge) > max_items) or
+                (max_bytes and self.knowledge_bytes > max_bytes)):
+            return
+        target_items = max_items - max_items // 100
+        target_bytes = max_bytes - max_bytes // 100
+        remaining, size = len(self.knowledge), self.knowledge_bytes
+        victims = []
+        while (max_items and remaining > target_items) or (max_bytes and size > target_bytes):
+            item_id = self.eviction.pop()
+            if item_id is None:
+                break
+            victims.append(item_id)
+            remaining -= 1
+            size -= self._item_bytes(self.knowledge_ids[item_id])
+        if not victims:
+            return
+        self._remove_items(victims)
+        self.store.delete_knowledge(victims)
+        self._mark_dirty()
+        self.evicted += len(victims)
+        logger.debug(f"🗑️  Evicted {len(victims)} knowledge items ({self.eviction.policy})")
+    
+    def _remove_items(self, item_ids: List[str]):
+        """Drop items from the knowledge list and every index"""
+        removed = set(item_ids)
+        # Expired items are the oldest, normally a prefix of the list
+        leading = 0
+        for item in self.knowledge:
+            if item.id not in removed:
+                break
+            leading += 1
+        if leading == len(removed):
+            del self.knowledge[:leading]
+        else:
+            self.knowledge = [item for item in self.knowledge if item.id not in removed]
+        self._unindex(item_ids)
+    
+    def _index_item(self, item: MemoryItem):
+        """Add one item to the search indexes"""
+        self.knowledge_generation += 1
+        self.knowledge_ids[item.id] = item
+        if self.eviction is not None:
+            self._track_item(item)
+        if self.duplicate_index is not None:
+            self.duplicate_index.add(item.id, self.duplicate_index.signature(shingles(self._question(item))))
+        if self.text_index is not None:
+            self.text_index.add(item.id, item.content, item)
+        for filters in (self.metadata_index, self._building_filters):
+            if filters is not None:
+                filters.add(item.id, item.metadata, item.created, item)
+        if self.vector_index is None:
+            return
+        vector = self.get_item_embedding(item)
+        if vector is None:
+            return
+        try:
+            self.vector_index.add(item.id, vector, item)
+        except ValueError as e:
+            logger.warning(f"Not indexing {item.id}: {e}")
+    
+    def _unindex(self, item_ids: Iterable[str]):
+        self.knowledge_generation += 1
+        for item_id in item_ids:
+            item = self.knowledge_ids.pop(item_id, None)
+            if item is not None and self.eviction is not None:
+                self.eviction.remove(item_id)
+                self.knowledge_bytes -= self._item_bytes(item)
+            if self.duplicate_index is not None:
+                self.duplicate_index.remove(item_id)
+            if self.vector_index is not None:
+                self.vector_index.remove(item_id)
+            if self.text_index is not None:
+                self.text_index.remove(item_id)
+            if self.metadata_index is not None:
+                self.metadata_index.remove(item_id)
+            if self._building_filters is not None:
+                self._building_filters.remove(item_id)
+    
+    def _snapshot_sources(self) -> Optional[List[Path]]:
+        """Files the snapshot must match, or None if the store cannot tell"""
+        sources = self.store.source_files()
+        if sources is None:
+            return None
+        if self.embedding_matrix is not None:
+            sources = sources + [self.embedding_matrix.data_file, self.embedding_matrix.meta_file]
+        return sources
+    
+    def _restore_snapshot(self) -> bool:
+        """Load knowledge from the warm-start snapshot if it is still valid"""
+        if self.snapshot is None:
+            return False
+        self.store.attach_knowledge()
+        sources = self._snapshot_sources()
+        if sources is None:
+            return False
+        with paused_gc():
+            state = self.snapshot.load(sources, self.store.change_marker())
+            if state is None:
+                return False
+            self.knowledge = [MemoryItem.from_tuple(fields) for fields in state["knowledge"]]
+        self._snapshot_current = True
+        logger.info(f"⚡ Restored {len(self.knowledge)} knowledge items from snapshot")
+        return True
+    
+    def _save_snapshot(self, marker: Any = None):
+        """Write the in-memory state once everything has been flushed"""
+        if self.snapshot is None or not self._knowledge_loaded:
+            return
+        if self._snapshot_current or self.writer.errors:
+            return
+        sources = self._snapshot_sources()
+        if sources is None:
+            return
+        try:
+            self.snapshot.save(sources, {
+                "knowledge": [item.to_tuple() for item in self.knowledge]
+            }, marker)
+            self._snapshot_current = True
+        except Exception as e:
+            logger.error(f"Failed to save memory snapshot: {e}")
+    
+    def _needs_repack(self) -> bool:
+        """Whether enough matrix rows belong to removed items to rewrite it"""
+        if self.embedding_matrix is None or self.shared or not self._knowledge_loaded:
+            return False
+        rows = len(self.embedding_matrix)
+        if not rows:
+            return False
+        live = sum(1 for item in self.knowledge if item.embedding_row is not None)
+        if (rows - live) / rows < self.repack_dead_fraction:
+            return False
+        logger.info(f"🧮 Repacking {self.embeddings_file.name}: {rows - live} of {rows} rows unused")
+        return True
+    
+    def _repack_embeddings(self):
+        """Drop matrix rows no longer referenced by any knowledge item"""
+        live = []
+        for item in self.knowledge:
+            vector = self.get_item_embedding(item) if item.embedding_row is not None else None
+            if vector is None:
+                item.embedding_row = None
+            else:
+                live.append((item, vector))
+        rows = self.embedding_matrix.rewrite([vector for _, vector in live])
+        for (item, _), row in zip(live, rows):
+            item.embedding_row = row
+    
+    def get_item_embedding(self, item: MemoryItem):
+        """Get a knowledge item's embedding, inline or from the matrix"""
+        if item.embedding is not None:
+            return item.embedding
+        if item.embedding_row is not None and self.embedding_matrix is not None:
+            return self.embedding_matrix.get(item.embedding_row)
+        return None
+    
+    def _item_vectors(self, items: List[MemoryItem]) -> Any:
+        """Full-precision embeddings of indexed items, for rescoring"""
+        rows = [item.embedding_row for item in items]
+        if self.embedding_matrix is not None and None not in rows:
+            return self.embedding_matrix.take(rows)
+        return [self.get_item_embedding(item) for item in items]
+    
+    def measure_search_recall(self, samples: int = 100, k: int = 10) -> Optional[Dict[str, Any]]:
+        """Measure quantized search recall@k against exact search"""
+        if not isinstance(self.vector_index, QuantizedIndex) or not len(self.vector_index):
+            return None
+        try:
+            result = self.vector_index.measure_recall(samples, k)
+        except ValueError as e:
+            logger.warning(f"⚠️  Could not measure search recall: {e}")
+            return None
+        logger.info(f"📏 Quantized search recall@{k}: {result['recall']:.3f} over {result['samples']} queries")
+        return result
+    
+    async def _measure_recall_in_background(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.measure_search_recall, self.recall_samples)
+        except Exception as e:
+            # The index may change underneath the scan; the next load retries
+            logger.warning(f"⚠️  Could not measure search recall: {e}")
+    
+    def _flush_store(self):
+        """Write queued changes (runs on the persistence thread)"""
+        # Matrix rows go first so stored items never point past the file
+        if self.embedding_matrix is not None:
+            self.embedding_matrix.flush()
+        if self.message_index is not None:
+            self.message_index.flush()
+        self.store.flush()
+    
+    def _mark_dirty(self):
+        """Schedule queued store changes for the persistence thread"""
+        self._snapshot_current = False
+        self.writer.mark_dirty("store", self._flush_store)
+    
+    async def flush(self):
+        """Write all pending changes to disk now"""
+        self.writer.flush()
+    
+    async def close(self):
+        """Flush pending changes, stop background workers and save a snapshot"""
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+        for task in (self._recall_task, self._message_backfill):
+            if task is not None:
+                task.cancel()
+        self._recall_task = self._message_backfill = None
+        if self._needs_repack():
+            await self.save_knowledge()
+        self.writer.stop()
+        if self.message_index is not None and not self.shared:
+            # Everything is flushed, so message rows can be renumbered
+            self.message_index.repack(self.repack_dead_fraction)
+        # Read while the store is still open; compaction on close may
+        # still change its files, so those are fingerprinted afterwards
+        marker = self.store.change_marker()
+        self.store.close()
+        self._save_snapshot(marker)
+        if self.embeddings.cache is not None:
+            self.embeddings.cache.save()
+        if self.vector_index is not None:
+            self.vector_index.close()
+    
+    async def export(self, path: str, format_name: Optional[str] = None,
+                     compress: Optional[bool] = None) -> Dict[str, Any]:
+        """Stream conversations and knowledge to an export file
+        
+        The format defaults to the file extension, then to the first format
+        in the export config; compression and metadata follow the config.
+        """
+        if not self.export_config.get("enabled", True):
+            raise ValueError("Export is disabled in the memory config")
+        allowed = self.export_config.get("formats") or ["json", "markdown", "csv"]
+        format_name = format_name or MemoryExporter.detect_format(Path(path)) or allowed[0]
+        if format_name not in allowed:
+            raise ValueError(f"Export format '{format_name}' is not enabled (choose from {', '.join(allowed)})")
+        if compress is None:
+            compress = self.export_config.get("compress", False)
+        
+        # Export what is on disk, including anything still queued
+        self.writer.flush()
+        exporter = MemoryExporter(
+            self.store.iter_sessions(),
+            self.store.iter_knowledge(),
+            include_metadata=self.export_config.get("include_metadata", True)
+        )
+        output = exporter.export(Path(path), format_name, compress=compress)
+        logger.info(f"📤 Exported memory to {output}")
+        return dict(exporter.counts, path=str(output), format=format_name)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get memory system statistics"""
+        return {
+            "sessions": self.store.session_count(),
+            "active_sessions": len(self.active_conversations),
+            "knowledge_items": len(self.knowledge),
+            "embeddings": self.embedding_matrix.stats() if self.embedding_matrix is not None else None,
+            "indexed_vectors": len(self.vector_index) if self.vector_index is not None else 0,
+            "ann": self.vector_index.stats() if isinstance(self.vector_index, IVFIndex) else None,
+            "quantization": self.vector_index.stats() if isinstance(self.vector_index, QuantizedIndex) else None,
+            "sharding": self.vector_index.stats() if isinstance(self.vector_index, ShardedIndex) else None,
+            "keyword_index": self.text_index.stats() if self.text_index is not None else None,
+            "metadata_index": self.metadata_index.stats() if self.metadata_index is not None else None,
+            "result_cache": self.result_cache.stats() if self.result_cache is not None else None,
+            "embedding_cache": self.embeddings.cache.stats() if self.embeddings.cache is not None else None,
+            "eviction": dict(self.eviction.stats(), evicted=self.evicted,
+                             estimated_bytes=self.knowledge_bytes) if self.eviction is not None else None,
+            "cleanup": dict(self.cleanup_stats, scheduled=self._cleanup_task is not None),
+            "message_index": self.message_index.stats()
+            if self.message_index is not None and self.message_index.loaded else None,
+            "persistence": self.writer.stats()
+        }
+    
+    async def refresh(self):
+        """Apply knowledge and conversation changes written by other processes"""
+        self._last_refresh = time.monotonic()
+        try:
+            changes = self.store.poll_changes()
+        except Exception as e:
+            logger.error(f"Failed to poll for memory changes: {e}")
+            return
+        
+        records = changes["knowledge"]
+        if records:
+            known = self.knowledge_ids
+            removed = set()
+            updated: Dict[str, MemoryItem] = {}
+            added = 0
+            for record in records:
+                item_id = record["id"]
+                if record.get("op") == "delete":
+                    removed.add(item_id)
+                    updated.pop(item_id, None)
+                    continue
+                removed.discard(item_id)
+                current = known.get(item_id)
+                if (current is not None and self._item_version(record["metadata"])
+                        <= self._item_version(current.metadata)):
+                    # Our own write, or older than what we hold
+                    continue
+                item = MemoryItem.from_dict(
+                    {key: value for key, value in record.items() if key != "op"}
+                )
+                if current is None:
+                    self.knowledge.append(item)
+                    self._index_item(item)
+                    added += 1
+                else:
+                    updated[item_id] = item
+            removed = {item_id for item_id in removed if item_id in known}
+            if removed:
+                self.knowledge = [item for item in self.knowledge if item.id not in removed]
+                self._unindex(removed)
+            if updated:
+                self.knowledge = [updated.get(item.id, item) for item in self.knowledge]
+                self._unindex(updated)
+                for item in updated.values():
+                    self._index_item(item)
+            if added or removed or updated:
+                logger.info(f"🔄 Picked up {added} new, {len(updated)} updated and "
+                            f"{len(removed)} removed knowledge items")
+        
+        for session_id in changes["sessions"]:
+            conv = self.active_conversations.get(session_id)
+            if conv is None:
+                continue
+            # Merge rather than replace: our own newest messages may not be stored yet
+            seen = {(msg["timestamp"], msg["role"], msg["content"]) for msg in conv.messages}
+            stored = self.store.load_session(session_id) or []
+            new = [msg for msg in stored if (msg["timestamp"], msg["role"], msg["content"]) not in seen]
+            if new:
+                merged = sorted(conv.messages + new, key=lambda msg: msg["timestamp"])
+                conv.messages = merged[-conv.max_history:]
+        
+        # Those sessions just gained (or lost) messages
+        now = datetime.now()
+        for session_id in changes["sessions"]:
+            self._note_session_activity(session_id, now)
+        
+        # The writers logged their own messages; index them here without embeddings
+        if self.message_index is not None and self.message_index.loaded:
+            for session_id in changes["sessions"]:
+                self.message_index.add(session_id, self.store.load_session(session_id) or [], log=False)
+    
+    async def _maybe_refresh(self):
+        """Refresh from other processes if shared and the interval has passed"""
+        if self.shared and time.monotonic() - self._last_refresh >= self.refresh_interval:
+            await self.refresh()
+    
     def get_conversation(self, session_id: str) -> ConversationMemory:
         """Get or create conversation memory"""
         if session_id not in self.active_conversations:
             conv = ConversationMemory(session_id)
             
             # Load existing messages
-            if session_id in self.conversations:
-                for msg in self.conversations[session_id]:
-                    conv.messages.append(msg)
+            messages = self.conversations.get(session_id)
+            if messages is None and self.store.lazy_sessions:
+                messages = self.store.load_session(session_id)
+            for msg in messages or []:
+                conv.messages.append(msg)
             
             self.active_conversations[session_id] = conv
         
@@ -225,25 +1050,59 @@ class MemoryManager:
         conv.add_message("user", user_message, context)
         conv.add_message("assistant", assistant_response)
         
-        # Save to persistent storage
-        await self.save_conversations()
+        # Queue the new messages for the persistence thread
+        new_messages = conv.messages[-2:]
+        self.store.append_messages(session_id, new_messages)
+        knowledge_vector = None
+        if self.message_index is not None:
+            vectors = None
+            if self.embeddings.model and self.message_index.matrix is not None:
+                # One model call per turn: the knowledge item's content is
+                # encoded in the same batch unless it is already stored
+                texts = [user_message, assistant_response]
+                content = f"Q: {user_message}\nA: {assistant_response}"
+                if hashlib.md5(content.encode()).hexdigest() not in self.knowledge_ids:
+                    texts.append(content)
+                vectors = await self.embeddings.encode(texts)
+                if len(vectors) == 3:
+                    knowledge_vector = vectors.pop()
+            self.message_index.add(session_id, new_messages, vectors)
+        self._note_session_activity(session_id, datetime.fromisoformat(new_messages[-1]["timestamp"]))
+        self._mark_dirty()
         
         # Add to knowledge base if significant
-        await self.add_to_knowledge(user_message, assistant_response, context)
+        await self.add_to_knowledge(user_message, assistant_response, context, knowledge_vector)
     
     async def add_to_knowledge(self, user_message: str, assistant_response: str, 
-                             context: Optional[Dict] = None):
-        """Add interaction to knowledge base"""
+                             context: Optional[Dict] = None,
+                             embedding: Optional[List[float]] = None):
+        """Add interaction to knowledge base
+        
+        ``embedding`` is the vector of the item's content when the caller
+        has already encoded it.
+        """
+        await self._maybe_refresh()
+        
         # Create a knowledge item
         content = f"Q: {user_message}\nA: {assistant_response}"
         
         # Generate ID
         content_hash = hashlib.md5(content.encode()).hexdigest()
         
-        # Check if already exists
-        if any(item.id == content_hash for item in self.knowledge):
+        # Exact repeats are counted on the stored item instead of being
+        # stored and embedded again
+        if self._repeat_if_stored(content_hash):
             return
         
+        # Generate embedding if available
+        embeddings = [embedding] if embedding is not None else None
+        if embeddings is None and self.embeddings.model:
+            embeddings = await self.embeddings.encode([content])
+            # A concurrent call may have stored it while the model ran;
+            # count it the same way as a sequential repeat
+            if self._repeat_if_stored(content_hash):
+                return
+        
         metadata = {
             "type": "qa_pair",
             "user_message": user_message,
@@ -251,6 +1110,13 @@ class MemoryManager:
             "context": context or {}
         }
         
+        # The same question asked again (with trivial edits) replaces the
+        # stored item, so a corrected or newer answer wins; its repeat
+        # count carries over
+        previous = self._find_near_duplicate(user_message)
+        if previous is not None:
+            metadata["repeats"] = previous.metadata.get("repeats", 0) + 1
+        
         # Create memory item
         memory_item = MemoryItem(
             id=content_hash,
@@ -258,71 +1124,272 @@ class MemoryManager:
             metadata=metadata,
             timestamp=datetime.now()
         )
+        if embeddings and self.embedding_matrix is not None:
+            memory_item.embedding_row = self.embedding_matrix.append(embeddings[0])
+        elif embeddings:
+            memory_item.embedding = embeddings[0]
         
-        # Generate embedding if available
-        if self.embeddings.model:
-            embeddings = await self.embeddings.encode([content])
-            if embeddings:
-                memory_item.embedding = embeddings[0]
+        if previous is not None:
+            self._remove_items([previous.id])
+            self.store.delete_knowledge([previous.id])
         
         # Add to knowledge
         self.knowledge.append(memory_item)
+        self._index_item(memory_item)
         
-        # Save to disk
-        await self.save_knowledge()
+        # Queue for the store; the persistence thread writes it
+        self.store.append_knowledge([memory_item.to_dict()])
+        self._mark_dirty()
+        self._enforce_capacity()
     
-    async def search_knowledge(self, query: str, max_results: int = 5) -> List[MemoryItem]:
-        """Search knowledge base using semantic similarity"""
+    async def search_knowledge(self, query: str, max_results: int = 5,
+                               mode: Optional[str] = None, session_id: Optional[str] = None,
+                               item_type: Optional[str] = None, agent: Optional[str] = None,
+                               since: Optional[datetime] = None,
+                               until: Optional[datetime] = None) -> List[MemoryItem]:
+        """Search the knowledge base
+        
+        ``mode`` is "semantic" (embedding similarity), "keyword" (BM25) or
+        "hybrid" (both, merged with reciprocal rank fusion) and defaults to
+        ``retrieval.mode`` in the config. Without an embedding model every
+        search is a keyword search.
+        
+        ``session_id``, ``item_type`` (metadata type), ``agent`` and the
+        ``since``/``until`` time range narrow the candidates through
+        secondary indexes before any scoring.
+        """
+        mode = mode or self.retrieval_config.get("mode", "semantic")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}' (choose from {', '.join(SEARCH_MODES)})")
+        
+        await self._maybe_refresh()
         if not self.knowledge:
             return []
         
-        if not self.embeddings.model:
-            # Fallback to simple text search
-            results = []
-            query_lower = query.lower()
-            for item in self.knowledge:
-                if query_lower in item.content.lower():
-                    results.append(item)
-            return results[:max_results]
+        if self.result_cache is None:
+            results = await self._search(query, max_results, mode, session_id, item_type, agent, since, until)
+        else:
+            cache_key = (normalize_query(query), mode, max_results, session_id, item_type, agent, since, until)
+            generation = self.knowledge_generation
+            results = self.result_cache.get(cache_key, generation)
+            if results is None:
+                results = await self._search(query, max_results, mode, session_id, item_type, agent, since, until)
+                # Results computed while the knowledge base changed are not kept
+                if self.knowledge_generation == generation:
+                    self.result_cache.put(cache_key, generation, results)
         
-        # Semantic search using embeddings
-        query_embedding = await self.embeddings.encode([query])
+        # Every returned item counts as a hit for eviction
+        if self.eviction is not None and results:
+            now = epoch_seconds(datetime.now())
+            for item in results:
+                self.eviction.touch(item.id, now)
+        return list(results)
+    
+    async def _search(self, query: str, max_results: int, mode: str, session_id: Optional[str],
+                      item_type: Optional[str], agent: Optional[str], since: Optional[datetime],
+                      until: Optional[datetime]) -> List[MemoryItem]:
+        """Run a search without the result cache"""
+        keys = None
+        if any(value is not None for value in (session_id, item_type, agent, since, until)):
+            keys = self._filter_index().select(
+                since=since, until=until, session=session_id, type=item_type, agent=agent
+            )
+            if not keys:
+                return []
+        
+        if not self.embeddings.model or mode == "keyword":
+            return self._keyword_search(query, max_results, keys)
+        if mode == "semantic":
+            return await self._semantic_search(query, max_results, keys)
+        
+        # Hybrid: each side contributes a deeper candidate list to the fusion
+        depth = max(max_results, self.retrieval_config.get("candidates", 20))
+        semantic = asyncio.create_task(self._semantic_search(query, depth, keys))
+        # Let the task hand the query to the encoder thread, then score
+        # keywords on the loop while the model runs
+        await asyncio.sleep(0)
+        keyword = self._keyword_search(query, depth, keys)
+        fused = reciprocal_rank_fusion(
+            [await semantic, keyword],
+            k=self.retrieval_config.get("rrf_k", 60),
+            key=lambda item: item.id
+        )
+        return fused[:max_results]
+    
+    def _keyword_search(self, query: str, max_results: int,
+                        keys: Optional[Iterable[str]] = None) -> List[MemoryItem]:
+        """BM25-ranked keyword search, optionally over a subset of item ids"""
+        # Use the store's keyword index when it has one (it cannot filter)
+        if keys is None:
+            records = self.store.search_text(query, max_results)
+            if records is not None:
+                return [MemoryItem.from_dict(record) for record in records]
+        
+        # Otherwise rank with the in-memory index
+        return [item for item, _ in self._keyword_index().search(query, max_results, keys)]
+    
+    async def _semantic_search(self, query: str, max_results: int,
+                               keys: Optional[Iterable[str]] = None) -> List[MemoryItem]:
+        """Embedding similarity search, optionally over a subset of item ids"""
+        query_embedding = await self.embeddings.encode([query], cached=True)
         if not query_embedding:
             return []
         
         query_vec = query_embedding[0]
+        if self.vector_index is not None:
+            try:
+                return [item for item, _ in self.vector_index.search(query_vec, max_results, keys)]
+            except ValueError as e:
+                logger.error(f"Vector search error: {e}")
+                return []
+        
         similarities = []
         
-        for item in self.knowledge:
-            if item.embedding:
-                similarity = self.embeddings.cosine_similarity(query_vec, item.embedding)
+        items = self.knowledge if keys is None else [self.metadata_index.get(key) for key in keys]
+        for item in items:
+            item_vec = self.get_item_embedding(item)
+            if item_vec is not None:
+                similarity = self.embeddings.cosine_similarity(query_vec, item_vec)
                 similarities.append((similarity, item))
         
         # Sort by similarity and return top results
         similarities.sort(key=lambda x: x[0], reverse=True)
         return [item for _, item in similarities[:max_results]]
     
+    async def search_conversations(self, query: str, max_results: int = 10,
+                                   mode: Optional[str] = None, session_id: Optional[str] = None,
+                                   role: Optional[str] = None, since: Optional[datetime] = None,
+                                   until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Search every saved conversation message
+        
+        Returns message dicts (session_id, role, content, timestamp), best
+        first. ``mode`` works as in ``search_knowledge``; ``session_id``,
+        ``role`` and the ``since``/``until`` time range narrow the messages
+        searched. Messages saved before the index existed are imported on
+        the first search and embedded in the background; until then
+        semantic searches match them by keywords.
+        """
+        mode = mode or self.retrieval_config.get("mode", "semantic")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}' (choose from {', '.join(SEARCH_MODES)})")
+        if self.message_index is None:
+            raise ValueError("Conversation search is disabled in the memory config")
+        
+        index = await self._load_message_index()
+        self._start_message_backfill()
+        keys = index.filters.select(since=since, until=until, session=session_id, role=role)
+        if keys is not None and not keys:
+            return []
+        
+        if not self.embeddings.model or index.vector_index is None or mode == "keyword":
+            results = index.search(query, max_results, keys=keys)
+        else:
+            depth = max_results if mode == "semantic" else max(
+                max_results, self.retrieval_config.get("candidates", 20)
+            )
+            encoding = asyncio.create_task(self.embeddings.encode([query], cached=True))
+            # Score keywords on the loop while the model runs
+            await asyncio.sleep(0)
+            keyword = index.search(query, depth, keys=keys) if mode == "hybrid" else []
+            query_embedding = await encoding
+            semantic = index.search(query, depth, "semantic",
+                                    query_embedding[0] if query_embedding else None, keys)
+            if mode == "semantic" and len(index.vector_index) < len(index):
+                # Messages still waiting for an embedding are matched by keywords
+                unembedded = index.unembedded_keys(keys)
+                keyword = index.search(query, depth, keys=unembedded) if unembedded else []
+            results = semantic if not keyword else reciprocal_rank_fusion(
+                [semantic, keyword], k=self.retrieval_config.get("rrf_k", 60)
+            )
+        return [dict(record) for record in results[:max_results]]
+    
+    async def _load_message_index(self) -> MessageIndex:
+        """The message index, loaded (and seeded from the store) on first use"""
+        index = self.message_index
+        async with self._message_index_lock:
+            if index.loaded:
+                return index
+            # Messages saved meanwhile are indexed by finish_load()
+            index.begin_load()
+            loop = asyncio.get_running_loop()
+            try:
+                imported = await loop.run_in_executor(None, self._build_message_index)
+            finally:
+                index.finish_load()
+        if imported:
+            logger.info(f"💬 Imported {imported} stored messages into the message index")
+            self._mark_dirty()
+        return index
+    
+    def _build_message_index(self) -> int:
+        """Load the message log, seeding it from the store if it is new
+        (runs in an executor); returns the messages imported"""
+        index = self.message_index
+        seed = not index.exists()
+        # Write queued messages first so the log and the store hold them
+        self.writer.flush()
+        with paused_gc():
+            index.load()
+            return index.seed(self.store.iter_sessions()) if seed else 0
+    
+    def _start_message_backfill(self):
+        """Embed earlier messages in the background, once per process"""
+        index = self.message_index
+        if (self._message_backfill is None and self.embeddings.model
+                and index.vector_index is not None and len(index.vector_index) < len(index)):
+            self._message_backfill = asyncio.create_task(self._embed_earlier_messages())
+    
+    async def _embed_earlier_messages(self):
+        """Embed indexed messages that were saved without an embedding"""
+        index = self.message_index
+        if not self.embeddings.model or index.vector_index is None:
+            return
+        missing = index.missing_vectors()
+        if not missing:
+            return
+        logger.info(f"💬 Embedding {len(missing)} earlier conversation messages...")
+        batch_size = self.config.get("performance", {}).get("embedding_batch_size", 32)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = await self.embeddings.encode([record["content"] for record in batch])
+            if len(vectors) != len(batch):
+                break
+            index.set_vectors(batch, vectors)
+        self._mark_dirty()
+    
     async def get_relevant_context(self, query: str, session_id: str, 
-                                 max_items: int = 3) -> Dict[str, Any]:
-        """Get relevant context for a query"""
+                                 max_items: Optional[int] = None,
+                                 mode: Optional[str] = None,
+                                 knowledge_filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get relevant context for a query
+        
+        ``max_items`` defaults to ``retrieval.context_items`` and ``mode``
+        to ``retrieval.mode``; ``knowledge_filters`` are passed on as
+        ``search_knowledge`` filter arguments.
+        """
+        if max_items is None:
+            max_items = self.retrieval_config.get("context_items", 3)
         context = {
             "conversation_history": [],
             "relevant_knowledge": [],
             "session_context": {}
         }
         
+        await self._maybe_refresh()
+        
         # Get conversation history
         conv = self.get_conversation(session_id)
         context["conversation_history"] = conv.get_recent_context(5)
         context["session_context"] = conv.context
         
         # Search knowledge base
-        relevant_items = await self.search_knowledge(query, max_items)
+        relevant_items = await self.search_knowledge(query, max_items, mode=mode,
+                                                     **(knowledge_filters or {}))
         context["relevant_knowledge"] = [
             {
                 "content": item.content,
                 "timestamp": item.timestamp.isoformat(),
-                "metadata": item.metadata
+                "metadata": item.full_metadata()
             }
             for item in relevant_items
         ]
@@ -330,35 +1397,193 @@ class MemoryManager:
         return context
     
     async def cleanup_old_data(self, days: int = 30):
-        """Clean up old memory data"""
+        """Remove knowledge items and sessions older than ``days`` right away"""
         cutoff_date = datetime.now() - timedelta(days=days)
+        removed = await self.run_retention(cutoff_date, cutoff_date, slice_seconds=float("inf"))
         
-        # Clean knowledge base
-        original_count = len(self.knowledge)
-        self.knowledge = [
-            item for item in self.knowledge
-            if item.timestamp > cutoff_date
-        ]
+        if removed["knowledge_items"]:
+            logger.info(f"🧹 Cleaned up {removed['knowledge_items']} old knowledge items")
+        if removed["sessions"]:
+            logger.info(f"🧹 Cleaned up {removed['sessions']} old conversation sessions")
         
-        removed_count = original_count - len(self.knowledge)
-        if removed_count > 0:
-            logger.info(f"🧹 Cleaned up {removed_count} old knowledge items")
-            await self.save_knowledge()
+        # Sweep the store too, for anything other processes wrote
+        self.store.expire(
+            cutoff_date,
+            knowledge_ids=[],
+            session_ids=[],
+            keep_sessions=list(self.active_conversations.keys())
+        )
+        self._mark_dirty()
+    
+    # Items or sessions removed per step of a retention slice
+    RETENTION_BATCH = 100
+    
+    async def run_retention(self, knowledge_cutoff: Optional[datetime], session_cutoff: Optional[datetime],
+                            slice_seconds: float = 0.005, pause_seconds: float = 0.0) -> Dict[str, int]:
+        """Remove knowledge items at or before ``knowledge_cutoff`` and sessions
+        whose last message is before ``session_cutoff`` (None keeps everything)
         
-        # Clean old conversations
-        old_sessions = []
-        for session_id, messages in self.conversations.items():
-            if messages:
-                last_message_time = datetime.fromisoformat(messages[-1]["timestamp"])
-                if last_message_time < cutoff_date:
-                    old_sessions.append(session_id)
+        Work runs in slices of about ``slice_seconds``, yielding to the event
+        loop for ``pause_seconds`` between them. Expired entries are found
+        by bisection over time-ordered indexes, so a slice costs the same
+        however large the store is; on first use those indexes are built
+        in slices too.
+        """
+        removed = {"knowledge_items": 0, "sessions": 0}
+        async with self._retention_lock:
+            if knowledge_cutoff is not None:
+                await self._build_filter_index(slice_seconds, pause_seconds)
+            if session_cutoff is not None:
+                await self._build_session_timeline(slice_seconds, pause_seconds)
+            
+            # Active sessions popped from the timeline, put back afterwards
+            kept: List[str] = []
+            steps = (
+                (self._expire_knowledge, knowledge_cutoff, "knowledge_items"),
+                (partial(self._expire_sessions, kept=kept), session_cutoff, "sessions")
+            )
+            for expire, cutoff, counter in steps:
+                if cutoff is None:
+                    continue
+                finished = False
+                while not finished:
+                    deadline = time.monotonic() + slice_seconds
+                    while time.monotonic() < deadline:
+                        examined, count = expire(cutoff, self.RETENTION_BATCH)
+                        removed[counter] += count
+                        if examined < self.RETENTION_BATCH:
+                            finished = True
+                            break
+                    if not finished:
+                        # Let chat requests run between slices
+                        await asyncio.sleep(pause_seconds)
+            
+            for session_id in kept:
+                conv = self.active_conversations.get(session_id)
+                if conv is not None and conv.messages:
+                    self._note_session_activity(session_id, datetime.fromisoformat(conv.messages[-1]["timestamp"]))
         
-        for session_id in old_sessions:
-            del self.conversations[session_id]
+        # Compacting the keyword index is one pass over all of it, so
+        # sliced runs leave it to the index's own threshold
+        if removed["knowledge_items"] and self.text_index is not None and slice_seconds == float("inf"):
+            self.text_index.prune()
+        return removed
+    
+    def _expire_knowledge(self, cutoff: datetime, limit: int) -> Tuple[int, int]:
+        """Remove up to ``limit`` of the oldest items at or before ``cutoff``"""
+        if not self.knowledge:
+            return 0, 0
+        expired = self._filter_index().pop_before(cutoff, limit)
+        if expired:
+            self._remove_items(expired)
+            self.store.delete_knowledge(expired)
+            self._mark_dirty()
+        return len(expired), len(expired)
+    
+    def _expire_sessions(self, cutoff: datetime, limit: int, kept: List[str]) -> Tuple[int, int]:
+        """Remove up to ``limit`` of the least recently active sessions
+        before ``cutoff``; sessions in use are added to ``kept`` instead"""
+        oldest = self.session_times.pop_before(cutoff, limit)
+        expired = []
+        for session_id in oldest:
+            if session_id in self.active_conversations:
+                kept.append(session_id)
+            else:
+                expired.append(session_id)
+        if expired:
+            for session_id in expired:
+                self.conversations.pop(session_id, None)
+            self.store.delete_sessions(expired)
+            if self.message_index is not None:
+                self.message_index.remove_sessions(expired)
+            self._mark_dirty()
+        return len(oldest), len(expired)
+    
+    def _note_session_activity(self, session_id: str, moment: datetime):
+        """Move a session to ``moment`` in the timeline (and one being built)"""
+        for timeline in (self.session_times, self._building_timeline):
+            if timeline is not None:
+                timeline.add(session_id, None, moment)
+    
+    @staticmethod
+    async def _in_slices(entries: List[Any], slice_seconds: float, pause_seconds: float):
+        """Yield ``entries``, pausing for the event loop after each slice"""
+        deadline = time.monotonic() + slice_seconds
+        for position, entry in enumerate(entries):
+            if position % 256 == 0 and time.monotonic() >= deadline:
+                await asyncio.sleep(pause_seconds)
+                deadline = time.monotonic() + slice_seconds
+            yield entry
+    
+    async def _build_filter_index(self, slice_seconds: float, pause_seconds: float):
+        """Build the metadata index in slices
         
-        if old_sessions:
-            logger.info(f"🧹 Cleaned up {len(old_sessions)} old conversation sessions")
-            await self.save_conversations()
+        Items added or removed meanwhile update the partial index directly,
+        so the bulk pass skips ids it already holds and items no longer
+        stored.
+        """
+        if self.metadata_index is not None:
+            return
+        filters = self._building_filters = MetadataIndex()
+        async for item in self._in_slices(list(self.knowledge), slice_seconds, pause_seconds):
+            if self._building_filters is not filters or self.metadata_index is not None:
+                # Reloaded, or built by a search meanwhile
+                break
+            if item.id not in filters and self.knowledge_ids.get(item.id) is item:
+                filters.add(item.id, item.metadata, item.created, item)
+        else:
+            self.metadata_index = filters
+        if self._building_filters is filters:
+            self._building_filters = None
+    
+    async def _build_session_timeline(self, slice_seconds: float, pause_seconds: float):
+        """Build the session timeline in slices, reading the store off the event loop"""
+        if self.session_times is not None:
+            return
+        timeline = self._building_timeline = TimeIndex()
+        # Their newest messages may not be stored yet
+        for session_id, conv in self.active_conversations.items():
+            if conv.messages:
+                timeline.add(session_id, None, datetime.fromisoformat(conv.messages[-1]["timestamp"]))
+        def read_activity():
+            # Oldest first, so every add appends to the time order
+            return sorted((entry for entry in self.store.session_activity() if entry[1]),
+                          key=itemgetter(1))
+        try:
+            activity = await asyncio.get_running_loop().run_in_executor(None, read_activity)
+            async for session_id, updated in self._in_slices(activity, slice_seconds, pause_seconds):
+                # Sessions already in the timeline were updated after the read
+                if session_id not in timeline:
+                    timeline.add(session_id, None, datetime.fromisoformat(updated))
+            self.session_times = timeline
+        finally:
+            self._building_timeline = None
+    
+    async def _cleanup_loop(self):
+        """Apply the retention windows shortly after start, then every cleanup interval"""
+        config = self.cleanup_config
+        await asyncio.sleep(config.get("startup_delay_seconds", 60))
+        while True:
+            now = datetime.now()
+            knowledge_days = config.get("knowledge_retention_days", 365)
+            conversation_days = config.get("conversation_retention_days", 90)
+            try:
+                removed = await self.run_retention(
+                    now - timedelta(days=knowledge_days) if knowledge_days else None,
+                    now - timedelta(days=conversation_days) if conversation_days else None,
+                    slice_seconds=config.get("slice_milliseconds", 5) / 1000,
+                    pause_seconds=config.get("slice_pause_milliseconds", 50) / 1000
+                )
+                self.cleanup_stats["runs"] += 1
+                self.cleanup_stats["last_run"] = now.isoformat()
+                for counter, count in removed.items():
+                    self.cleanup_stats[counter] += count
+                if any(removed.values()):
+                    logger.info(f"🧹 Retention removed {removed['knowledge_items']} knowledge items "
+                                f"and {removed['sessions']} conversation sessions")
+            except Exception as e:
+                logger.error(f"Scheduled cleanup failed: {e}")
+            await asyncio.sleep(config.get("cleanup_interval_days", 30) * 86400)
 
 # Example usage
 if __name__ == "__main__":
@@ -379,5 +1604,7 @@ if __name__ == "__main__":
         
         for item in results:
             print(f"- {item.content[:100]}...")
+        
+        await memory.close()
     
     asyncio.run(test_memory())
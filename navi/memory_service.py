@@ -0,0 +1,353 @@
+# NAVI Memory Service
+# Runs one MemoryManager in its own process and serves it to NAVI workers
+
+import os
+import hmac
+import json
+import asyncio
+import logging
+import secrets
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+from navi.memory import MemoryManager, MemoryItem
+
+logger = logging.getLogger(__name__)
+
+# Largest single request or response line
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+def _use_unix_socket(config: Dict[str, Any]) -> bool:
+    return bool(config.get("socket")) and hasattr(asyncio, "start_unix_server")
+
+def _read_token(config: Dict[str, Any], create: bool = False) -> Optional[str]:
+    """The shared token from the config or its token file
+
+    With ``create`` the service writes a new random token to the token
+    file (readable by its owner only) when neither is set.
+    """
+    if config.get("token"):
+        return config["token"]
+    token_file = Path(config.get("token_file") or "data/memory/navi-memory.token")
+    if token_file.exists():
+        return token_file.read_text(encoding="utf-8").strip() or None
+    if not create:
+        return None
+    token_file.parent.mkdir(parents=True, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    logger.info(f"🔑 Wrote a new memory service token to {token_file}")
+    return token
+
+def _filters_to_wire(filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in filters.items()}
+
+def _filters_from_wire(filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: datetime.fromisoformat(value) if key in ("since", "until") and value else value
+            for key, value in filters.items()}
+
+def _item_to_wire(item: MemoryItem) -> Dict[str, Any]:
+    record = item.to_dict()
+    # Embeddings stay with the service
+    record.pop("embedding", None)
+    record.pop("embedding_row", None)
+    return record
+
+class MemoryService:
+    """Serves a MemoryManager over a Unix socket or localhost TCP
+
+    The protocol is one JSON object per line in each direction. Requests
+    are ``{"id": n, "method": name, "params": {...}}`` and responses are
+    ``{"id": n, "result": ...}`` or ``{"id": n, "error": message}``.
+
+    TCP connections (and Unix socket ones, if a token is configured) must
+    first call ``auth`` with the shared token; anything else is refused
+    and the connection closed.
+    """
+
+    METHODS = ("ping", "get_relevant_context", "save_interaction", "search_knowledge",
+               "search_conversations", "get_stats", "flush")
+
+    def __init__(self, memory: MemoryManager, config: Optional[Dict[str, Any]] = None):
+        self.memory = memory
+        self.config = config or {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.token: Optional[str] = None
+
+    async def start(self):
+        """Start accepting connections"""
+        if _use_unix_socket(self.config):
+            socket_path = Path(self.config["socket"])
+            socket_path.parent.mkdir(parents=True, exist_ok=True)
+            if socket_path.exists():
+                await self._remove_stale_socket(socket_path)
+            # The socket is owner-only; a configured token is checked on top
+            self.token = self.config.get("token") or None
+            self.server = await asyncio.start_unix_server(
+                self._handle_client, path=str(socket_path), limit=MAX_MESSAGE_BYTES
+            )
+            os.chmod(socket_path, 0o600)
+            logger.info(f"🧠 Memory service listening on {socket_path}")
+        else:
+            host = self.config.get("host", "127.0.0.1")
+            port = self.config.get("port", 8765)
+            # Any local user can reach a TCP port, so clients must present the token
+            self.token = _read_token(self.config, create=True)
+            if host not in ("127.0.0.1", "localhost", "::1"):
+                logger.warning(f"⚠️  Memory service bound to {host}; only the token protects it")
+            self.server = await asyncio.start_server(
+                self._handle_client, host=host, port=port, limit=MAX_MESSAGE_BYTES
+            )
+            logger.info(f"🧠 Memory service listening on {host}:{port}")
+
+    @staticmethod
+    async def _remove_stale_socket(socket_path: Path):
+        """Remove a socket left by a crashed service, refusing to take over a live one"""
+        try:
+            _, writer = await asyncio.open_unix_connection(str(socket_path))
+        except (ConnectionRefusedError, FileNotFoundError):
+            socket_path.unlink(missing_ok=True)
+            return
+        writer.close()
+        raise RuntimeError(f"Another memory service is already listening on {socket_path}")
+
+    async def serve_forever(self):
+        """Run until cancelled"""
+        if not self.server:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self):
+        """Stop accepting connections"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if _use_unix_socket(self.config):
+            Path(self.config["socket"]).unlink(missing_ok=True)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        authenticated = self.token is None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if authenticated:
+                    response = await self._dispatch(line)
+                else:
+                    response = self._authenticate(line)
+                    authenticated = "error" not in response
+                writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+                if not authenticated:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Memory service connection error: {e}")
+        finally:
+            writer.close()
+
+    def _authenticate(self, line: bytes) -> Dict[str, Any]:
+        """Check a connection's first request, which must be ``auth``"""
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            token = str(request.get("params", {}).get("token", ""))
+            if request.get("method") == "auth" and hmac.compare_digest(token, self.token):
+                return {"id": request_id, "result": "ok"}
+        except (ValueError, AttributeError):
+            pass
+        logger.warning("⚠️  Refused an unauthenticated memory service connection")
+        return {"id": request_id, "error": "authentication required"}
+
+    async def _dispatch(self, line: bytes) -> Dict[str, Any]:
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            method = request.get("method")
+            if method not in self.METHODS:
+                raise ValueError(f"Unknown method '{method}'")
+            result = await getattr(self, f"_rpc_{method}")(**request.get("params", {}))
+            return {"id": request_id, "result": result}
+        except Exception as e:
+            logger.error(f"Memory service request failed: {e}")
+            return {"id": request_id, "error": str(e)}
+
+    async def _rpc_ping(self) -> str:
+        return "pong"
+
+    async def _rpc_get_relevant_context(self, query: str, session_id: str,
+                                        max_items: Optional[int] = None,
+                                        mode: Optional[str] = None,
+                                        knowledge_filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self.memory.get_relevant_context(
+            query, session_id, max_items, mode=mode,
+            knowledge_filters=_filters_from_wire(knowledge_filters or {})
+        )
+
+    async def _rpc_save_interaction(self, user_message: str, assistant_response: str,
+                                    context: Optional[Dict] = None) -> None:
+        await self.memory.save_interaction(user_message, assistant_response, context)
+
+    async def _rpc_search_knowledge(self, query: str, max_results: int = 5,
+                                    mode: Optional[str] = None, **filters) -> List[Dict[str, Any]]:
+        items = await self.memory.search_knowledge(query, max_results, mode=mode,
+                                                   **_filters_from_wire(filters))
+        return [_item_to_wire(item) for item in items]
+
+    async def _rpc_search_conversations(self, query: str, max_results: int = 10,
+                                        mode: Optional[str] = None, **filters) -> List[Dict[str, Any]]:
+        return await self.memory.search_conversations(query, max_results, mode=mode,
+                                                      **_filters_from_wire(filters))
+
+    async def _rpc_get_stats(self) -> Dict[str, Any]:
+        return self.memory.get_stats()
+
+    async def _rpc_flush(self) -> None:
+        await self.memory.flush()
+
+class RemoteMemoryManager:
+    """Client-side MemoryManager that forwards calls to a MemoryService
+
+    Offers the subset of the MemoryManager interface NAVI workers use, so
+    many workers can share one embedding model and knowledge base.
+    """
+
+    IDEMPOTENT = ("ping", "get_relevant_context", "search_knowledge", "search_conversations",
+                  "get_stats", "flush")
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, timeout: float = 30.0):
+        self.config = config or {}
+        self.timeout = self.config.get("timeout_seconds", timeout)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+        self._next_id = 0
+
+    async def initialize(self):
+        """Connect to the service and check that it answers"""
+        await self._connect()
+        await self._call("ping")
+        logger.info("✅ Connected to memory service")
+
+    async def _connect(self):
+        if _use_unix_socket(self.config):
+            self._reader, self._writer = await asyncio.open_unix_connection(
+                self.config["socket"], limit=MAX_MESSAGE_BYTES
+            )
+            token = self.config.get("token") or None
+        else:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.config.get("host", "127.0.0.1"), self.config.get("port", 8765),
+                limit=MAX_MESSAGE_BYTES
+            )
+            token = _read_token(self.config)
+        if token is not None:
+            await self._authenticate(token)
+
+    async def _authenticate(self, token: str):
+        request = {"id": 0, "method": "auth", "params": {"token": token}}
+        self._writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await self._writer.drain()
+        line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        if not line or "error" in json.loads(line):
+            self._disconnect()
+            raise PermissionError("Memory service rejected the token")
+
+    async def _call(self, method: str, **params) -> Any:
+        async with self._lock:
+            for attempt in range(2):
+                sent = False
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    self._next_id += 1
+                    request = {"id": self._next_id, "method": method, "params": params}
+                    self._writer.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+                    await self._writer.drain()
+                    sent = True
+                    line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+                    if not line:
+                        raise ConnectionError("Memory service closed the connection")
+                    break
+                except PermissionError:
+                    raise
+                except (ConnectionError, OSError, asyncio.TimeoutError):
+                    self._disconnect()
+                    # Reconnect once (the service may have restarted), unless
+                    # a write may already have been applied
+                    if attempt or (sent and method not in self.IDEMPOTENT):
+                        raise
+                    logger.warning("⚠️  Lost memory service connection, reconnecting...")
+
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"Memory service error: {response['error']}")
+        return response.get("result")
+
+    def _disconnect(self):
+        if self._writer:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get_relevant_context(self, query: str, session_id: str,
+                                   max_items: Optional[int] = None,
+                                   mode: Optional[str] = None,
+                                   knowledge_filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get relevant context for a query"""
+        return await self._call("get_relevant_context", query=query, session_id=session_id,
+                                max_items=max_items, mode=mode,
+                                knowledge_filters=_filters_to_wire(knowledge_filters or {}))
+
+    async def save_interaction(self, user_message: str, assistant_response: str,
+                               context: Optional[Dict] = None):
+        """Save an interaction to memory"""
+        await self._call("save_interaction", user_message=user_message,
+                         assistant_response=assistant_response, context=context)
+
+    async def search_knowledge(self, query: str, max_results: int = 5,
+                               mode: Optional[str] = None, **filters) -> List[MemoryItem]:
+        """Search the shared knowledge base (filters as in MemoryManager.search_knowledge)"""
+        records = await self._call("search_knowledge", query=query, max_results=max_results,
+                                   mode=mode, **_filters_to_wire(filters))
+        return [MemoryItem.from_dict(record) for record in records]
+
+    async def search_conversations(self, query: str, max_results: int = 10,
+                                   mode: Optional[str] = None, **filters) -> List[Dict[str, Any]]:
+        """Search saved conversation messages (filters as in MemoryManager.search_conversations)"""
+        return await self._call("search_conversations", query=query, max_results=max_results,
+                                mode=mode, **_filters_to_wire(filters))
+
+    async def get_service_stats(self) -> Dict[str, Any]:
+        """Get the service's memory statistics"""
+        return await self._call("get_stats")
+
+    async def flush(self):
+        """Ask the service to write pending changes"""
+        await self._call("flush")
+
+    async def close(self):
+        """Close the connection; the service keeps running"""
+        self._disconnect()
+
+async def run_memory_service(data_dir: str = "data/memory", config: Optional[Dict[str, Any]] = None,
+                             export_config: Optional[Dict[str, Any]] = None):
+    """Run a MemoryManager and serve it until cancelled"""
+    config = config or {}
+    memory = MemoryManager(data_dir=data_dir, config=config, export_config=export_config)
+    await memory.initialize()
+    service = MemoryService(memory, config.get("service", {}))
+    try:
+        await service.serve_forever()
+    finally:
+        await service.stop()
+        await memory.close()
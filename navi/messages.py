@@ -0,0 +1,332 @@
+# NAVI Message Search
+# Incrementally maintained search indexes over every conversation message
+
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterable, Set, Tuple
+
+from navi.filters import MetadataIndex
+from navi.lexical import BM25Index
+from navi.storage import read_jsonl, append_jsonl
+from navi.vectors import EmbeddingMatrix, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+def message_identity(session_id: str, message: Dict[str, Any]) -> Tuple[str, str, str]:
+    """What tells stored messages apart: session, timestamp and role"""
+    return (session_id, message["timestamp"], message["role"])
+
+class MessageFilters(MetadataIndex):
+    """Session, role and time indexes over conversation messages"""
+
+    FIELDS = ("session", "role")
+
+    @staticmethod
+    def fields_of(record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"session": record["session_id"], "role": record.get("role")}
+
+class MessageIndex:
+    """Searchable log of every saved conversation message
+
+    Each message is appended to ``log_file`` as it is saved, with the row
+    of its embedding in ``matrix`` when it has one. ``load()`` reads that
+    log, not the conversation store, into a BM25 index, session/role/time
+    filters and a vector index; afterwards ``add()`` keeps them current,
+    so a search never scans the stored sessions.
+
+    The log keeps messages that session files trim away, until
+    ``remove_sessions()`` drops them. Rewrites (removals and rows filled
+    in later) are applied to the file as it is on disk under ``lock``, so
+    appends from other processes sharing it survive them.
+
+    ``load()`` and ``seed()`` may run on a worker thread between
+    ``begin_load()`` and ``finish_load()``; messages added or sessions
+    removed meanwhile are applied to the indexes by ``finish_load()``.
+    """
+
+    def __init__(self, log_file: Path, matrix: Optional[EmbeddingMatrix] = None,
+                 lock: Optional[Any] = None):
+        self.log_file = Path(log_file)
+        self.matrix = matrix
+        self.lock = lock or threading.RLock()
+        self.text_index = BM25Index()
+        self.filters = MessageFilters()
+        self.vector_index: Optional[VectorIndex] = VectorIndex() if matrix is not None else None
+        self.loaded = False
+        self._loading = False
+        # Messages added and sessions removed while loading
+        self._arrived: List[Tuple[Dict[str, Any], Any]] = []
+        self._removed_while_loading: Set[str] = set()
+        # Set once sessions are dropped, so repack() knows to look for dead rows
+        self._rows_dropped = False
+        self._next_key = 0
+        # Identity -> key of every indexed message
+        self._keys: Dict[Tuple[str, str, str], int] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._dropped_sessions: Set[str] = set()
+        self._new_rows: Dict[Tuple[str, str, str], int] = {}
+        self._buffer_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.text_index)
+
+    def exists(self) -> bool:
+        """Whether the log has been written before"""
+        return self.log_file.exists()
+
+    def begin_load(self):
+        """Start collecting changes that arrive while the indexes are built"""
+        self._loading = True
+
+    def load(self):
+        """Index every message in the log"""
+        rows, vector_keys, vector_records = [], [], []
+        matrix_rows = len(self.matrix) if self.matrix is not None else 0
+        for record in read_jsonl(self.log_file):
+            row = record.pop("row", None)
+            key = self._index(record)
+            if key is not None and row is not None and row < matrix_rows:
+                rows.append(row)
+                vector_keys.append(key)
+                vector_records.append(record)
+        if rows and self.vector_index is not None:
+            try:
+                self.vector_index.add_batch(vector_keys, self.matrix.take(rows), vector_records)
+            except ValueError as e:
+                logger.error(f"Failed to index message embeddings: {e}")
+                self.vector_index.clear()
+        logger.info(f"💬 Indexed {len(self)} conversation messages")
+
+    def seed(self, sessions: Iterable[Tuple[str, List[Dict[str, Any]]]]) -> int:
+        """Log and index stored sessions the log does not hold; returns messages added"""
+        added = 0
+        for session_id, messages in sessions:
+            records = []
+            for message in messages:
+                record = self._record(session_id, message)
+                if self._index(record) is not None:
+                    records.append(dict(record, row=None))
+            with self._buffer_lock:
+                self._pending.extend(records)
+            added += len(records)
+        return added
+
+    def finish_load(self):
+        """Index what arrived during the load and mark the index loaded"""
+        arrived, self._arrived = self._arrived, []
+        removed, self._removed_while_loading = self._removed_while_loading, set()
+        self._loading = False
+        self.loaded = True
+        for record, vector in arrived:
+            self._add_to_indexes(record, vector)
+        self.remove_sessions(removed)
+
+    def _index(self, record: Dict[str, Any]) -> Optional[int]:
+        identity = message_identity(record["session_id"], record)
+        if identity in self._keys:
+            return None
+        key = self._next_key
+        self._next_key += 1
+        self._keys[identity] = key
+        self.text_index.add(key, record["content"], record)
+        self.filters.add(key, record, datetime.fromisoformat(record["timestamp"]), record)
+        return key
+
+    def attach(self):
+        """Map the embedding matrix so new rows follow the stored ones"""
+        if self.matrix is not None:
+            self.matrix.load()
+
+    @staticmethod
+    def _record(session_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "session_id": session_id,
+            "role": message["role"],
+            "content": message["content"],
+            "timestamp": message["timestamp"]
+        }
+
+    def add(self, session_id: str, messages: List[Dict[str, Any]],
+            vectors: Optional[List[Any]] = None, log: bool = True):
+        """Log new messages and, once loaded, index them (skipping known ones)
+
+        ``log=False`` only indexes them, for messages another process logged.
+        """
+        for position, message in enumerate(messages):
+            record = self._record(session_id, message)
+            if self.loaded and message_identity(session_id, record) in self._keys:
+                continue
+            vector = vectors[position] if vectors is not None and len(vectors) else None
+            if log:
+                row = self.matrix.append(vector) if vector is not None and self.matrix is not None else None
+                with self._buffer_lock:
+                    self._pending.append(dict(record, row=row))
+            if self._loading:
+                self._arrived.append((record, vector))
+            elif self.loaded:
+                self._add_to_indexes(record, vector)
+
+    def _add_to_indexes(self, record: Dict[str, Any], vector: Any):
+        key = self._index(record)
+        if key is not None and vector is not None and self.vector_index is not None:
+            try:
+                self.vector_index.add(key, vector, record)
+            except ValueError as e:
+                logger.warning(f"Not indexing message embedding: {e}")
+
+    def missing_vectors(self) -> List[Dict[str, Any]]:
+        """Indexed messages that have no embedding yet"""
+        indexed = self.vector_index
+        return [record for key, record in self._records()
+                if indexed is None or key not in indexed]
+
+    def unembedded_keys(self, keys: Optional[Iterable[int]] = None) -> List[int]:
+        """Keys (among ``keys``, if given) of messages without an embedding"""
+        indexed = self.vector_index
+        candidates = self._keys.values() if keys is None else keys
+        return [key for key in candidates if indexed is None or key not in indexed]
+
+    def set_vectors(self, records: List[Dict[str, Any]], vectors: List[Any]):
+        """Attach embeddings computed after the messages were logged"""
+        if self.matrix is None or self.vector_index is None:
+            return
+        keys, kept, kept_vectors = [], [], []
+        with self._buffer_lock:
+            for record, vector in zip(records, vectors):
+                identity = message_identity(record["session_id"], record)
+                key = self._keys.get(identity)
+                if key is None:
+                    # Removed since the embedding was requested
+                    continue
+                self._new_rows[identity] = self.matrix.append(vector)
+                keys.append(key)
+                kept.append(record)
+                kept_vectors.append(vector)
+        if not keys:
+            return
+        try:
+            self.vector_index.add_batch(keys, kept_vectors, kept)
+        except ValueError as e:
+            logger.warning(f"Not indexing message embeddings: {e}")
+
+    def _records(self) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        for key in self._keys.values():
+            yield key, self.filters.get(key)
+
+    def remove_sessions(self, session_ids: Iterable[str]) -> int:
+        """Drop whole sessions from the index and the log; returns messages removed"""
+        session_ids = set(session_ids)
+        if not session_ids:
+            return 0
+        removed = 0
+        if self._loading:
+            # The indexes are being built elsewhere; finish_load() removes them
+            self._removed_while_loading |= session_ids
+        for session_id in () if self._loading else session_ids:
+            for key in self.filters.select(session=session_id) or ():
+                record = self.filters.get(key)
+                del self._keys[message_identity(session_id, record)]
+                self.text_index.remove(key)
+                self.filters.remove(key)
+                if self.vector_index is not None:
+                    self.vector_index.remove(key)
+                removed += 1
+        with self._buffer_lock:
+            self._pending = [record for record in self._pending
+                             if record["session_id"] not in session_ids]
+            self._dropped_sessions |= session_ids
+        self._rows_dropped = True
+        return removed
+
+    def search(self, query: str, k: int, mode: str = "keyword", query_vector: Any = None,
+               keys: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """Messages best matching ``query`` by BM25 ("keyword") or by
+        ``query_vector`` ("semantic"), optionally among ``keys`` only"""
+        if mode == "semantic":
+            if self.vector_index is None or query_vector is None:
+                return []
+            try:
+                return [record for record, _ in self.vector_index.search(query_vector, k, keys)]
+            except ValueError as e:
+                logger.error(f"Message vector search error: {e}")
+                return []
+        return [record for record, _ in self.text_index.search(query, k, keys)]
+
+    def flush(self):
+        """Apply queued rewrites and append new messages (persistence thread)"""
+        if self.matrix is not None:
+            # Rows first so logged messages never point past the file
+            self.matrix.flush()
+        with self._buffer_lock:
+            pending, self._pending = self._pending, []
+            dropped, self._dropped_sessions = self._dropped_sessions, set()
+            new_rows, self._new_rows = self._new_rows, {}
+        for record in pending:
+            if record["row"] is None:
+                record["row"] = new_rows.pop(message_identity(record["session_id"], record), None)
+        with self.lock:
+            if dropped or new_rows:
+                self._rewrite(dropped, new_rows)
+            append_jsonl(self.log_file, pending)
+
+    def _rewrite(self, dropped: Set[str], new_rows: Dict[Tuple[str, str, str], int]):
+        records = []
+        for record in read_jsonl(self.log_file):
+            if record["session_id"] in dropped:
+                continue
+            row = new_rows.get(message_identity(record["session_id"], record))
+            if row is not None:
+                record["row"] = row
+            records.append(record)
+        self._write_log(records)
+
+    def _write_log(self, records: List[Dict[str, Any]]):
+        tmp_file = self.log_file.with_name(self.log_file.name + ".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.log_file)
+
+    def repack(self, dead_fraction: float) -> int:
+        """Drop embedding rows of removed sessions once they make up
+        ``dead_fraction`` of the matrix; returns the rows dropped
+
+        Row ids are renumbered, so this runs after a flush with no other
+        process sharing the files. Only needed once sessions were removed.
+        """
+        if self.matrix is None or not self._rows_dropped:
+            return 0
+        with self.lock:
+            total = len(self.matrix)
+            records = list(read_jsonl(self.log_file))
+            live = sorted({record["row"] for record in records
+                           if record.get("row") is not None and record["row"] < total})
+            if not total or (total - len(live)) / total < dead_fraction:
+                return 0
+            logger.info(f"🧮 Repacking {self.matrix.data_file.name}: "
+                        f"{total - len(live)} of {total} rows unused")
+            vectors = list(self.matrix.take(live)) if live else []
+            renumbered = dict(zip(live, self.matrix.rewrite(vectors)))
+            for record in records:
+                if record.get("row") is not None:
+                    record["row"] = renumbered.get(record["row"])
+            # Rows first, as in flush(), then the log that points at them
+            self.matrix.flush()
+            self._write_log(records)
+        self._rows_dropped = False
+        return total - len(live)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size information"""
+        return {
+            "messages": len(self),
+            "sessions": self.filters.stats()["session"],
+            "embedded": len(self.vector_index) if self.vector_index is not None else 0,
+            "embedding_rows": len(self.matrix) if self.matrix is not None else 0
+        }
@@ -0,0 +1,86 @@
+# NAVI Warm-Start Snapshots
+# Fully built memory state saved as one file for fast startup
+
+import gc
+import os
+import pickle
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 3
+
+def fingerprint(paths: Iterable[Path]) -> List[Tuple[str, int, int]]:
+    """Describe source files by path, modification time and size"""
+    entries = []
+    for path in sorted(Path(p) for p in paths):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return entries
+
+@contextmanager
+def paused_gc():
+    """Suspend the cyclic GC while building many objects that form no cycles"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+class WarmSnapshot:
+    """Pickled in-memory state, valid only while its source files are unchanged
+
+    The snapshot records the mtime and size of every file the state was
+    built from, plus an optional change ``marker`` for stores (such as
+    SQLite) whose files do not reflect writes reliably. Loading compares
+    both against the current ones, so any write to the store (from this
+    or another process) invalidates it and the caller falls back to a
+    normal load.
+
+    MemoryManager keeps only the knowledge items here. A warm start skips
+    reading and parsing the store. It still rebuilds the vector index
+    from the memory-mapped embedding matrix. The keyword, metadata and
+    near-duplicate indexes are rebuilt on first use.
+    """
+
+    def __init__(self, snapshot_file: Path):
+        self.snapshot_file = Path(snapshot_file)
+
+    def load(self, sources: Iterable[Path], marker: Any = None) -> Optional[Dict[str, Any]]:
+        """Return the saved state, or None if missing or stale"""
+        if not self.snapshot_file.exists():
+            return None
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot {self.snapshot_file.name}: {e}")
+            return None
+
+        if data.get("version") != SNAPSHOT_VERSION:
+            return None
+        if data.get("sources") != fingerprint(sources) or data.get("marker") != marker:
+            logger.info("Memory files changed since the last snapshot; loading from store")
+            return None
+        return data["state"]
+
+    def save(self, sources: Iterable[Path], state: Dict[str, Any], marker: Any = None):
+        """Write ``state`` along with the current fingerprint of ``sources``"""
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "sources": fingerprint(sources),
+            "marker": marker,
+            "state": state
+        }
+        tmp_file = self.snapshot_file.with_name(self.snapshot_file.name + ".tmp")
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.snapshot_file)
@@ -0,0 +1,993 @@
+# NAVI Vector Storage
+# Contiguous float32 embedding storage shared through memory mapping
+
+import json
+import os
+import atexit
+import logging
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Any, Iterable, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingMatrix:
+    """Append-only float32 embedding matrix backed by a raw file
+
+    Row ``i`` holds the embedding of the item whose ``embedding_row`` is
+    ``i``. The file is memory-mapped read-only, so processes on the same host
+    share one page-cached copy. New rows are kept in memory until ``flush()``
+    appends them, and ``rewrite()`` queues a repacked replacement.
+
+    Given a ``lock`` shared with other processes, ``append()`` instead
+    writes the row straight to the end of the file while holding the lock,
+    so every process gets a distinct row id; rows written elsewhere are
+    mapped in when first requested.
+    """
+
+    def __init__(self, data_file: Path, lock: Optional[Any] = None):
+        self.data_file = Path(data_file)
+        self.lock = lock
+        self._unsynced = False
+        self.meta_file = self.data_file.with_suffix(".meta.json")
+        self.dim: Optional[int] = None
+        self._mapped = None
+        self._replacement = None
+        self._pending: List[Any] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        """Check whether numpy is installed"""
+        return np is not None
+
+    def load(self):
+        """Memory-map the matrix file"""
+        with self._lock:
+            self._pending = []
+            self._replacement = None
+            self._mapped = None
+            if not self.meta_file.exists():
+                return
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)["dim"]
+            self._mapped = self._map()
+        logger.info(f"🧮 Mapped {len(self)} embedding rows")
+
+    def _map(self):
+        if not self.data_file.exists() or not self.dim:
+            return None
+        rows = self.data_file.stat().st_size // (4 * self.dim)
+        if rows == 0:
+            return None
+        return np.memmap(self.data_file, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def _base(self):
+        return self._replacement if self._replacement is not None else self._mapped
+
+    def _base_rows(self) -> int:
+        base = self._base()
+        return 0 if base is None else base.shape[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._base_rows() + len(self._pending)
+
+    def append(self, vector: List[float]) -> int:
+        """Queue a vector and return its row id"""
+        row = np.asarray(vector, dtype=np.float32)
+        if self.lock is not None:
+            return self._append_shared(row)
+        with self._lock:
+            if self.dim is None:
+                self.dim = row.shape[0]
+            elif row.shape[0] != self.dim:
+                raise ValueError(f"Embedding has {row.shape[0]} dimensions, matrix has {self.dim}")
+            self._pending.append(row)
+            return self._base_rows() + len(self._pending) - 1
+
+    def _append_shared(self, row) -> int:
+        """Write a row to the shared file and return its position"""
+        with self.lock:
+            if self.dim is None and self.meta_file.exists():
+                with open(self.meta_file, 'r', encoding='utf-8') as f:
+                    self.dim = json.load(f)["dim"]
+            if self.dim is None:
+                self.dim = row.shape[0]
+                self._write_meta(self.dim)
+            elif row.shape[0] != self.dim:
+                raise ValueError(f"Embedding has {row.shape[0]} dimensions, matrix has {self.dim}")
+
+            row_bytes = 4 * self.dim
+            with open(self.data_file, 'ab') as f:
+                end = f.seek(0, os.SEEK_END)
+                if end % row_bytes:
+                    # Pad over a row torn by a crashed writer
+                    f.write(b"\0" * (row_bytes - end % row_bytes))
+                    end += row_bytes - end % row_bytes
+                f.write(row.tobytes())
+            self._unsynced = True
+            return end // row_bytes
+
+    def get(self, row_id: int):
+        """Return a row as a float32 array, or None if it does not exist"""
+        with self._lock:
+            if self.lock is not None and row_id >= self._base_rows():
+                # Written by us or another process since the file was mapped
+                if self.dim is None and self.meta_file.exists():
+                    with open(self.meta_file, 'r', encoding='utf-8') as f:
+                        self.dim = json.load(f)["dim"]
+                self._mapped = self._map()
+            base_rows = self._base_rows()
+            if 0 <= row_id < base_rows:
+                return self._base()[row_id]
+            if base_rows <= row_id < base_rows + len(self._pending):
+                return self._pending[row_id - base_rows]
+        return None
+
+    def take(self, row_ids: List[int]):
+        """Gather many rows into one float32 array (rows must exist)"""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        with self._lock:
+            if self.lock is not None and len(row_ids) and row_ids.max() >= self._base_rows():
+                self._mapped = self._map()
+            base = self._base()
+            base_rows = self._base_rows()
+            if not self._pending:
+                return np.asarray(base[row_ids], dtype=np.float32)
+            # Gather mapped and pending rows separately; joining the two
+            # would copy the whole matrix for a single queued row
+            rows = np.empty((len(row_ids), self.dim), dtype=np.float32)
+            mapped = row_ids < base_rows
+            if mapped.any():
+                rows[mapped] = base[row_ids[mapped]]
+            if not mapped.all():
+                rows[~mapped] = np.stack([self._pending[i] for i in row_ids[~mapped] - base_rows])
+        return rows
+
+    def rewrite(self, vectors: List[Any]) -> List[int]:
+        """Queue a repacked matrix holding ``vectors``; returns their new rows"""
+        with self._lock:
+            if vectors:
+                self._replacement = np.vstack(vectors).astype(np.float32, copy=False)
+                self.dim = self._replacement.shape[1]
+            else:
+                self._replacement = np.zeros((0, self.dim or 0), dtype=np.float32)
+            self._pending = []
+            return list(range(len(vectors)))
+
+    def _write_meta(self, dim: int):
+        tmp_file = self.meta_file.with_name(self.meta_file.name + ".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"dim": dim, "dtype": "float32"}, f)
+        os.replace(tmp_file, self.meta_file)
+
+    def flush(self):
+        """Write queued rows (or a queued rewrite) and remap the file"""
+        if self._unsynced:
+            # Shared appends are already written; make them durable
+            self._unsynced = False
+            with open(self.data_file, 'rb') as f:
+                os.fsync(f.fileno())
+        with self._lock:
+            replacement = self._replacement
+            pending = list(self._pending)
+            dim = self.dim
+        if dim is None or (replacement is None and not pending):
+            return
+
+        self._write_meta(dim)
+
+        if replacement is not None:
+            # Replace the file atomically; existing maps keep the old inode
+            tmp_file = self.data_file.with_name(self.data_file.name + ".tmp")
+            with open(tmp_file, 'wb') as f:
+                f.write(replacement.tobytes())
+                for row in pending:
+                    f.write(row.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.data_file)
+        else:
+            with open(self.data_file, 'ab') as f:
+                for row in pending:
+                    f.write(row.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        with self._lock:
+            # A rewrite queued while we were writing supersedes this flush
+            if self._replacement is replacement:
+                self._replacement = None
+                self._pending = self._pending[len(pending):]
+            self._mapped = self._map()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return matrix size information"""
+        with self._lock:
+            return {
+                "rows": self._base_rows() + len(self._pending),
+                "dim": self.dim,
+                "pending_rows": len(self._pending)
+            }
+
+class VectorIndex:
+    """Contiguous matrix of unit-length float32 vectors for exact top-k search
+
+    Vectors are normalised once when added, so a query is a single
+    matrix-vector product followed by ``argpartition``. Rows are appended
+    into a buffer that grows geometrically, and removal moves the last row
+    into the freed slot, so both are O(dim).
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self.dim: Optional[int] = None
+        self.initial_capacity = initial_capacity
+        self._matrix = None
+        self._count = 0
+        self._keys: List[str] = []
+        self._values: List[Any] = []
+        self._positions: Dict[str, int] = {}
+
+    @staticmethod
+    def available() -> bool:
+        """Check whether numpy is installed"""
+        return np is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def _normalize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _reserve(self, rows: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, 2 * capacity, self.initial_capacity)
+        matrix = self._new_storage(new_capacity)
+        if self._count:
+            matrix[:self._count] = self._matrix[:self._count]
+        self._matrix = matrix
+
+    def _new_storage(self, capacity: int):
+        return np.empty((capacity, self.dim), dtype=np.float32)
+
+    def _write_rows(self, positions: List[int], rows):
+        self._matrix[positions] = rows
+
+    def _move_row(self, source: int, target: int):
+        self._matrix[target] = self._matrix[source]
+
+    def _check_dim(self, dim: int):
+        if self.dim is None:
+            self.dim = dim
+        elif dim != self.dim:
+            raise ValueError(f"Vector has {dim} dimensions, index has {self.dim}")
+
+    def add(self, key: str, vector: Any, value: Any = None):
+        """Add or replace the vector stored under ``key``"""
+        self.add_batch([key], [vector], [value])
+
+    def add_batch(self, keys: List[str], vectors: List[Any], values: List[Any]) -> List[int]:
+        """Add many vectors with one normalisation pass; returns their positions"""
+        if not keys:
+            return []
+        rows = self._normalize(np.vstack(vectors))
+        self._check_dim(rows.shape[1])
+        self._reserve(self._count + len(keys))
+        positions = []
+        for key, value in zip(keys, values):
+            position = self._positions.get(key)
+            if position is None:
+                position = self._count
+                self._count += 1
+                self._positions[key] = position
+                self._keys.append(key)
+                self._values.append(value)
+            else:
+                self._values[position] = value
+            positions.append(position)
+        self._write_rows(positions, rows)
+        return positions
+
+    def remove(self, key: str) -> bool:
+        """Remove ``key``; returns False if it was not indexed"""
+        position = self._positions.pop(key, None)
+        if position is None:
+            return False
+        last = self._count - 1
+        if position != last:
+            self._move_row(last, position)
+            self._keys[position] = self._keys[last]
+            self._values[position] = self._values[last]
+            self._positions[self._keys[position]] = position
+        self._keys.pop()
+        self._values.pop()
+        self._count -= 1
+        return True
+
+    def clear(self):
+        """Remove every vector"""
+        self._matrix = None
+        self._count = 0
+        self._keys = []
+        self._values = []
+        self._positions = {}
+
+    def search(self, query: Any, k: int, keys: Optional[Iterable[str]] = None) -> List[Tuple[Any, float]]:
+        """Return up to ``k`` (value, cosine similarity) pairs, best first
+
+        ``keys`` restricts the search to those entries, at a cost
+        proportional to their number; unknown keys are ignored.
+        """
+        if not self._count or k <= 0:
+            return []
+        query = self._query(query)
+        if keys is None:
+            return self._top_k(self._matrix[:self._count] @ query, k)
+        positions = self._subset(keys)
+        if not len(positions):
+            return []
+        return self._top_k(self._matrix[positions] @ query, k, positions)
+
+    def _subset(self, keys: Iterable[str]):
+        """Matrix positions of the indexed ``keys``"""
+        known = self._positions
+        return np.fromiter((known[key] for key in keys if key in known), dtype=np.int64)
+
+    def _query(self, query: Any):
+        query = self._normalize(query)
+        if query.shape[-1] != self.dim:
+            raise ValueError(f"Query has {query.shape[-1]} dimensions, index has {self.dim}")
+        return query
+
+    def _top_k(self, scores, k: int, positions=None) -> List[Tuple[Any, float]]:
+        """Pick the ``k`` best ``scores``; ``positions`` maps them to rows"""
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        rows = top if positions is None else positions[top]
+        return [(self._values[row], float(scores[i])) for row, i in zip(rows, top)]
+
+    def close(self):
+        """Release background resources (the exact index has none)"""
+        pass
+
+class IVFIndex(VectorIndex):
+    """VectorIndex with an inverted-file (IVF) layer for approximate search
+
+    Vectors are clustered with spherical k-means into ``nlist`` lists and
+    each row is labelled with its nearest centroid. A query then scores
+    only the rows in the ``nprobe`` lists whose centroids are closest to
+    it, trading a little recall for far fewer dot products. Below
+    ``min_items`` rows, or until clusters have been trained, searches stay
+    exact.
+
+    New rows are labelled as they are added. Training runs on a background
+    thread, started by ``search`` once the index has no clusters or has
+    doubled in size since it was last trained; searches keep using the
+    previous clusters (or the exact scan) meanwhile. Centroids and labels
+    are saved to ``index_file`` so the next start does not retrain.
+    """
+
+    KMEANS_ITERATIONS = 8
+    SAMPLES_PER_LIST = 32
+    ASSIGN_CHUNK = 8192
+
+    def __init__(self, nlist: int = 0, nprobe: int = 16, min_items: int = 50000,
+                 index_file: Optional[Path] = None, initial_capacity: int = 1024):
+        super().__init__(initial_capacity)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_items = min_items
+        self.index_file = Path(index_file) if index_file else None
+        self._centroids = None
+        self._labels = None
+        self._trained_count = 0
+        self._changed = False
+        self._lock = threading.RLock()
+        self._builder: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Positions whose rows changed while a build was reading the matrix
+        self._dirty: Optional[set] = None
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def _reserve(self, rows: int):
+        super()._reserve(rows)
+        if self._labels is not None and self._labels.shape[0] < self._matrix.shape[0]:
+            labels = np.zeros(self._matrix.shape[0], dtype=np.int32)
+            labels[:self._count] = self._labels[:self._count]
+            self._labels = labels
+
+    def _new_labels(self):
+        return np.zeros(self._matrix.shape[0], dtype=np.int32)
+
+    def add_batch(self, keys: List[str], vectors: List[Any], values: List[Any]) -> List[int]:
+        """Add vectors and file each under its nearest centroid"""
+        with self._lock:
+            positions = super().add_batch(keys, vectors, values)
+            if positions and self._centroids is not None:
+                self._labels[positions] = self._nearest(self._matrix[positions], self._centroids)
+                self._changed = True
+            if self._dirty is not None:
+                self._dirty.update(positions)
+            return positions
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            position = self._positions.get(key)
+            last = self._count - 1
+            if not super().remove(key):
+                return False
+            if self._labels is not None and position != last:
+                self._labels[position] = self._labels[last]
+            if self._dirty is not None:
+                self._dirty.add(position)
+            self._changed = True
+            return True
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._centroids = None
+            self._labels = None
+            self._trained_count = 0
+            if self._dirty is not None:
+                self._dirty = None
+                self._stop.set()
+
+    def search(self, query: Any, k: int, keys: Optional[Iterable[str]] = None) -> List[Tuple[Any, float]]:
+        """Approximate top-k once trained and above ``min_items``, else exact
+
+        A ``keys`` subset is always searched exactly.
+        """
+        with self._lock:
+            if self._count < self.min_items or keys is not None:
+                return super().search(query, k, keys)
+            self._maybe_rebuild()
+            if self._centroids is None or k <= 0:
+                return super().search(query, k)
+            query = self._query(query)
+            centroid_scores = self._centroids @ query
+            nprobe = min(self.nprobe, len(centroid_scores))
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            probed = np.zeros(len(centroid_scores), dtype=bool)
+            probed[probe] = True
+            candidates = np.flatnonzero(probed[self._labels[:self._count]])
+            if len(candidates) < k:
+                return super().search(query, k)
+            return self._top_k(self._matrix[candidates] @ query, k, candidates)
+
+    def _maybe_rebuild(self):
+        if self._builder is not None and self._builder.is_alive():
+            return
+        if self._centroids is None or self._count >= 2 * self._trained_count:
+            self.rebuild()
+
+    def rebuild(self, wait: bool = False):
+        """Retrain the clusters on a background thread"""
+        with self._lock:
+            if not self._count:
+                return
+            if self._builder is None or not self._builder.is_alive():
+                self._stop.clear()
+                self._dirty = set()
+                self._builder = threading.Thread(
+                    target=self._build, args=(self._matrix, self._count),
+                    name="navi-ivf-build", daemon=True
+                )
+                self._builder.start()
+            builder = self._builder
+        if wait:
+            builder.join()
+
+    def _build(self, matrix, count: int):
+        """Train on the rows present when the build started, then install"""
+        try:
+            started = time.monotonic()
+            nlist = self.nlist or max(1, int(np.sqrt(count)))
+            centroids = self._train(matrix[:count], min(nlist, count))
+            if centroids is None:
+                return
+            labels = np.empty(count, dtype=np.int32)
+            for start in range(0, count, self.ASSIGN_CHUNK):
+                if self._stop.is_set():
+                    return
+                end = min(start + self.ASSIGN_CHUNK, count)
+                labels[start:end] = self._nearest(matrix[start:end], centroids)
+
+            with self._lock:
+                if self._stop.is_set() or self._dirty is None:
+                    return
+                # Rows added, moved or replaced during the build are relabelled here
+                current = self._count
+                valid = min(count, current)
+                stale = sorted(p for p in self._dirty if p < valid)
+                stale.extend(range(valid, current))
+                self._dirty = None
+                self._labels = self._new_labels()
+                self._labels[:valid] = labels[:valid]
+                if stale:
+                    self._labels[stale] = self._nearest(self._matrix[stale], centroids)
+                self._centroids = centroids
+                self._trained_count = current
+                self._changed = True
+            logger.info(f"🗂️  Clustered {count} vectors into {len(centroids)} lists "
+                        f"in {time.monotonic() - started:.1f}s")
+            self.save()
+        except Exception as e:
+            logger.error(f"Failed to build ANN index: {e}")
+        finally:
+            with self._lock:
+                self._dirty = None
+
+    def _train(self, vectors, nlist: int):
+        """Spherical k-means on a sample of ``vectors``"""
+        rng = np.random.default_rng(0)
+        sample_size = min(len(vectors), nlist * self.SAMPLES_PER_LIST)
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            if self._stop.is_set():
+                return None
+            assignment = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            # Reseed empty lists from random sample rows
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = self._normalize(sums)
+        return centroids
+
+    def _nearest(self, rows, centroids):
+        """Label of the closest centroid for each row"""
+        labels = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), self.ASSIGN_CHUNK):
+            chunk = rows[start:start + self.ASSIGN_CHUNK]
+            labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return labels
+
+    def load(self) -> bool:
+        """Adopt saved clusters, labelling rows the saved file does not know"""
+        if self.index_file is None or not self.index_file.exists():
+            return False
+        try:
+            with np.load(self.index_file) as data:
+                centroids = data["centroids"]
+                saved_keys = data["keys"]
+                saved_labels = data["labels"]
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable ANN index {self.index_file.name}: {e}")
+            return False
+
+        with self._lock:
+            if not self._count or not len(saved_keys):
+                return False
+            if centroids.ndim != 2 or centroids.shape[1] != self.dim:
+                return False
+            # Saved keys are sorted, so matching is one vectorised search
+            keys = np.array([key.encode("utf-8") for key in self._keys])
+            found_at = np.searchsorted(saved_keys, keys)
+            found_at[found_at == len(saved_keys)] = 0
+            found = saved_keys[found_at] == keys
+            self._labels = self._new_labels()
+            self._labels[:self._count] = np.where(found, saved_labels[found_at], 0)
+            missing = np.flatnonzero(~found)
+            if len(missing):
+                self._labels[missing] = self._nearest(self._matrix[missing], centroids)
+            self._centroids = centroids
+            self._trained_count = len(saved_keys)
+            self._changed = bool(len(missing))
+        logger.info(f"🗂️  Loaded ANN index with {len(centroids)} lists")
+        return True
+
+    def save(self):
+        """Write centroids and labels if they changed since the last save"""
+        if self.index_file is None:
+            return
+        with self._lock:
+            if self._centroids is None or not self._changed:
+                return
+            keys = np.array([key.encode("utf-8") for key in self._keys])
+            order = np.argsort(keys)
+            data = {
+                "centroids": self._centroids,
+                "keys": keys[order],
+                "labels": self._labels[:self._count][order]
+            }
+            self._changed = False
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, **data)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            self._changed = True
+            logger.error(f"Failed to save ANN index: {e}")
+
+    def close(self):
+        """Stop a running build and save the clusters"""
+        self._stop.set()
+        if self._builder is not None:
+            self._builder.join()
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return clustering information"""
+        with self._lock:
+            return {
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "nprobe": self.nprobe,
+                "min_items": self.min_items,
+                "approximate": self._centroids is not None and self._count >= self.min_items,
+                "building": self._builder is not None and self._builder.is_alive()
+            }
+
+class QuantizedIndex(VectorIndex):
+    """VectorIndex holding int8 or one-bit codes, rescored with exact vectors
+
+    Each unit vector is optionally truncated to its first ``dimensions``
+    components, then stored as int8 with a per-row scale (about 4x smaller
+    than float32) or as packed sign bits (32x smaller). A query scans every
+    code, takes the best ``k * rescore_factor`` candidates and re-ranks them
+    by exact cosine similarity using the full-precision vectors returned by
+    ``vector_source(values)``.
+    """
+
+    MODES = ("int8", "binary")
+    SCAN_CHUNK = 16384
+    # The sign-bit threshold is re-estimated each time the index doubles, up to this size
+    CENTER_ROWS = 8192
+
+    def __init__(self, mode: str = "int8", dimensions: int = 0, rescore_factor: int = 4,
+                 vector_source: Optional[Callable[[List[Any]], Any]] = None,
+                 initial_capacity: int = 1024):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown quantization mode '{mode}'")
+        super().__init__(initial_capacity)
+        self.mode = mode
+        self.dimensions = dimensions
+        self.rescore_factor = max(1, rescore_factor)
+        self.vector_source = vector_source
+        self.last_recall: Optional[Dict[str, Any]] = None
+        self._scales = None
+        self._center = None
+        self._centered_count = 0
+
+    @property
+    def code_dim(self) -> int:
+        if self.dimensions and self.dim:
+            return min(self.dimensions, self.dim)
+        return self.dim or 0
+
+    def _reserve(self, rows: int):
+        super()._reserve(rows)
+        if self.mode == "int8" and (self._scales is None or len(self._scales) < self._matrix.shape[0]):
+            scales = np.empty(self._matrix.shape[0], dtype=np.float32)
+            if self._count:
+                scales[:self._count] = self._scales[:self._count]
+            self._scales = scales
+
+    def _new_storage(self, capacity: int):
+        if self.mode == "binary":
+            return np.empty((capacity, (self.code_dim + 7) // 8), dtype=np.uint8)
+        return np.empty((capacity, self.code_dim), dtype=np.int8)
+
+    def _truncate(self, rows):
+        if self.code_dim == self.dim:
+            return rows
+        return self._normalize(rows[..., :self.code_dim])
+
+    def _write_rows(self, positions: List[int], rows):
+        rows = self._truncate(rows)
+        if self.mode == "binary":
+            if self._center is None or self._centered_count * 2 <= self._count <= self.CENTER_ROWS:
+                self._recenter(positions, rows)
+            self._matrix[positions] = np.packbits(rows > self._center, axis=-1)
+            return
+        peaks = np.abs(rows).max(axis=1)
+        peaks[peaks == 0] = 1.0
+        self._matrix[positions] = np.rint(rows / peaks[:, None] * 127).astype(np.int8)
+        self._scales[positions] = peaks / 127
+
+    def _recenter(self, positions: List[int], rows):
+        """Set the sign-bit threshold to the mean vector and re-encode earlier rows
+
+        Embedding dimensions are rarely centred on zero, and bits split at
+        the mean carry far more information than raw signs.
+        """
+        fresh = set(positions)
+        earlier = [p for p in range(self._count) if p not in fresh]
+        sample = rows
+        if earlier and self.vector_source is not None:
+            previous = self._truncate(self._normalize(
+                np.vstack(self.vector_source([self._values[p] for p in earlier]))
+            ))
+            sample = np.vstack([rows, previous])
+        self._center = sample.mean(axis=0)
+        if earlier and self.vector_source is not None:
+            self._matrix[earlier] = np.packbits(previous > self._center, axis=-1)
+        self._centered_count = self._count
+
+    def _move_row(self, source: int, target: int):
+        super()._move_row(source, target)
+        if self.mode == "int8":
+            self._scales[target] = self._scales[source]
+
+    def clear(self):
+        super().clear()
+        self._scales = None
+        self._center = None
+        self._centered_count = 0
+
+    def _coarse_scores(self, query, subset=None):
+        """Approximate similarity of ``query`` to every stored code, or to ``subset`` rows"""
+        query = self._truncate(query)
+        rows = self._count if subset is None else len(subset)
+        scores = np.empty(rows, dtype=np.float32)
+        if self.mode == "binary":
+            query_bits = np.packbits(query > self._center)
+        for start in range(0, rows, self.SCAN_CHUNK):
+            end = min(start + self.SCAN_CHUNK, rows)
+            chunk = slice(start, end) if subset is None else subset[start:end]
+            codes = self._matrix[chunk]
+            if self.mode == "binary":
+                # Fewer differing sign bits means a smaller angle
+                scores[start:end] = -_popcount(codes ^ query_bits).sum(axis=1, dtype=np.int32)
+            else:
+                # einsum converts on the fly instead of materialising a float copy
+                scores[start:end] = np.einsum("ij,j->i", codes, query) * self._scales[chunk]
+        return scores
+
+    def _search_positions(self, query, k: int, subset=None):
+        """Positions and exact scores of the best ``k`` rows for a unit query"""
+        coarse = self._coarse_scores(query, subset)
+        candidates = min(len(coarse), k * self.rescore_factor)
+        if candidates < len(coarse):
+            positions = np.argpartition(-coarse, candidates - 1)[:candidates]
+        else:
+            positions = np.arange(len(coarse))
+        coarse = coarse[positions]
+        if subset is not None:
+            positions = subset[positions]
+        if self.vector_source is None:
+            scores = coarse
+        else:
+            vectors = self.vector_source([self._values[i] for i in positions])
+            scores = self._normalize(np.vstack(vectors)) @ query
+        top = np.argsort(-scores, kind="stable")[:k]
+        return positions[top], scores[top]
+
+    def search(self, query: Any, k: int, keys: Optional[Iterable[str]] = None) -> List[Tuple[Any, float]]:
+        """Return up to ``k`` (value, score) pairs, best first
+
+        Scores are exact cosine similarities when a ``vector_source`` is set.
+        ``keys`` restricts the search to those entries.
+        """
+        if not self._count or k <= 0:
+            return []
+        subset = None if keys is None else self._subset(keys)
+        if subset is not None and not len(subset):
+            return []
+        positions, scores = self._search_positions(self._query(query), k, subset)
+        return [(self._values[p], float(score)) for p, score in zip(positions, scores)]
+
+    def measure_recall(self, samples: int = 100, k: int = 10) -> Dict[str, Any]:
+        """Compare quantized search with exact search, using stored vectors as queries"""
+        if self.vector_source is None:
+            raise ValueError("Measuring recall needs a vector_source")
+        if not self._count:
+            return {"recall": None, "k": k, "samples": 0}
+        rng = np.random.default_rng(0)
+        picks = rng.choice(self._count, min(samples, self._count), replace=False)
+        queries = self._normalize(np.vstack(self.vector_source([self._values[i] for i in picks])))
+
+        # Exact top-k for every query, streamed through the full vectors
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self._count, self.SCAN_CHUNK):
+            end = min(start + self.SCAN_CHUNK, self._count)
+            vectors = self._normalize(np.vstack(self.vector_source(self._values[start:end])))
+            scores = np.hstack([best_scores, queries @ vectors.T])
+            positions = np.hstack([best_positions,
+                                   np.broadcast_to(np.arange(start, end), (len(queries), end - start))])
+            keep = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_positions = np.take_along_axis(positions, keep, axis=1)
+
+        hits = 0
+        for query, exact in zip(queries, best_positions):
+            found, _ = self._search_positions(query, k)
+            hits += len(set(found.tolist()) & set(exact.tolist()))
+        self.last_recall = {
+            "recall": hits / (len(queries) * min(k, self._count)),
+            "k": k,
+            "samples": len(queries)
+        }
+        return self.last_recall
+
+    def stats(self) -> Dict[str, Any]:
+        """Return code size and the last recall measurement"""
+        code_bytes = 0 if self._matrix is None else self._matrix.shape[1]
+        if self.mode == "int8" and code_bytes:
+            code_bytes += 4
+        return {
+            "mode": self.mode,
+            "dimensions": self.code_dim,
+            "bytes_per_vector": code_bytes,
+            "float32_bytes_per_vector": 4 * (self.dim or 0),
+            "rescore_factor": self.rescore_factor,
+            "recall": self.last_recall
+        }
+
+_POPCOUNT_TABLE = None
+
+def _popcount(codes):
+    """Set bits per byte"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(codes)
+    global _POPCOUNT_TABLE
+    if _POPCOUNT_TABLE is None:
+        _POPCOUNT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+    return _POPCOUNT_TABLE[codes]
+
+class ShardedIndex(VectorIndex):
+    """VectorIndex kept in shared memory and scanned by a process pool
+
+    The normalised vectors live in a ``multiprocessing.shared_memory``
+    block that worker processes map directly, so nothing is copied per
+    query. From ``min_items`` vectors, a query is split into ``shards``
+    row ranges; each worker returns the top k of its range and the parent
+    merges them, so latency follows the rows per core rather than the
+    corpus size. Smaller indexes and filtered searches scan in process.
+    """
+
+    def __init__(self, shards: int = 0, min_items: int = 200000, initial_capacity: int = 1024):
+        super().__init__(initial_capacity)
+        self.shards = shards or os.cpu_count() or 1
+        self.min_items = min_items
+        self.parallel_searches = 0
+        self._block = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._registered = False
+        self._broken = False
+
+    @staticmethod
+    def available() -> bool:
+        """Check whether numpy and shared memory are available"""
+        return np is not None and shared_memory is not None
+
+    def _new_storage(self, capacity: int):
+        if not self._registered:
+            atexit.register(self.close)
+            self._registered = True
+        self._block = shared_memory.SharedMemory(create=True, size=max(1, capacity * self.dim * 4))
+        return np.ndarray((capacity, self.dim), dtype=np.float32, buffer=self._block.buf)
+
+    def _reserve(self, rows: int):
+        old_block = self._block
+        super()._reserve(rows)
+        if old_block is not None and old_block is not self._block:
+            # Workers still attached to the old block reattach on their next task
+            _release(old_block)
+
+    def clear(self):
+        """Remove every vector and free the shared block"""
+        super().clear()
+        if self._block is not None:
+            _release(self._block)
+            self._block = None
+
+    def _workers(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: the parent runs threads (persistence, builds)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.shards, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"🧩 Started {self.shards} vector search workers")
+        return self._pool
+
+    def search(self, query: Any, k: int, keys: Optional[Iterable[str]] = None) -> List[Tuple[Any, float]]:
+        """Top-k search, fanned out over the worker pool for large unfiltered scans"""
+        if (keys is not None or self.shards < 2 or self._count < self.min_items
+                or k <= 0 or self._broken):
+            return super().search(query, k, keys)
+        query = self._query(query)
+        bounds = np.linspace(0, self._count, self.shards + 1).astype(np.int64)
+        try:
+            pool = self._workers()
+            tasks = [
+                pool.submit(_shard_top_k, self._block.name, self._matrix.shape, int(start), int(end), query, k)
+                for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+            ]
+            results = [task.result() for task in tasks]
+        except (BrokenProcessPool, OSError) as e:
+            logger.error(f"Vector search workers failed, searching in process from now on: {e}")
+            self._broken = True
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            return super().search(query, k, keys)
+        self.parallel_searches += 1
+        positions = np.concatenate([positions for positions, _ in results])
+        scores = np.concatenate([scores for _, scores in results])
+        return self._top_k(scores, k, positions)
+
+    def close(self):
+        """Stop the workers and free the shared block, leaving the index empty"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._block is not None:
+            self._matrix = None
+            _release(self._block)
+            self._block = None
+            self._count = 0
+            self._keys, self._values, self._positions = [], [], {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Return shard and worker information"""
+        return {
+            "shards": self.shards,
+            "min_items": self.min_items,
+            "parallel": self.shards > 1 and self._count >= self.min_items and not self._broken,
+            "workers_running": self._pool is not None,
+            "parallel_searches": self.parallel_searches,
+            "shared_bytes": self._block.size if self._block is not None else 0
+        }
+
+def _release(block):
+    """Close and unlink a shared memory block we created"""
+    try:
+        block.close()
+    except BufferError:
+        # A view is still alive; the mapping goes with it
+        pass
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+# Worker-side attachment to the index's current shared block
+_ATTACHED: Dict[str, Any] = {}
+
+def _shard_top_k(name: str, shape: Tuple[int, int], start: int, end: int, query, k: int):
+    """Score rows ``start:end`` of the shared matrix; returns their top-k positions and scores"""
+    block = _ATTACHED.get(name)
+    if block is None:
+        for old in _ATTACHED.values():
+            old.close()
+        _ATTACHED.clear()
+        block = _ATTACHED[name] = shared_memory.SharedMemory(name=name)
+    scores = np.ndarray(shape, dtype=np.float32, buffer=block.buf)[start:end] @ query
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top + start, scores[top]
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+# Add project paths
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+import hashlib
+import re
+
+import pytest
+
+class WordHashModel:
+    """Stands in for a sentence-transformers model: texts sharing words get
+    similar vectors"""
+
+    def __init__(self, dim=32):
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, texts):
+        import numpy as np
+        self.calls.append(list(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        vectors[:, -1] += 0.01
+        return vectors
+
+@pytest.fixture
+def word_model():
+    """Install a WordHashModel on a MemoryManager's embeddings"""
+    pytest.importorskip("numpy")
+
+    def install(memory, dim=32):
+        memory.embeddings.model = WordHashModel(dim)
+        return memory.embeddings.model
+    return install
@@ -0,0 +1,72 @@
+import asyncio
+
+from navi.cache import EmbeddingCache, ResultCache, normalize_query
+from navi.memory import MemoryManager
+
+def test_embedding_cache_is_a_bounded_lru(tmp_path):
+    cache = EmbeddingCache(max_entries=2, cache_file=tmp_path / "embeddings.cache")
+    cache.put("model", "a", [1.0])
+    cache.put("model", "b", [2.0])
+    assert cache.get("model", "a") == [1.0]
+    cache.put("model", "c", [3.0])
+    assert cache.get("model", "b") is None
+    assert cache.get("other-model", "a") is None
+    cache.save()
+
+    reloaded = EmbeddingCache(max_entries=2, cache_file=tmp_path / "embeddings.cache")
+    reloaded.load()
+    assert reloaded.get("model", "c") == [3.0] and reloaded.get("model", "a") == [1.0]
+
+def test_only_queries_fill_the_embedding_cache(tmp_path, word_model):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False}})
+        await memory.initialize()
+        model = word_model(memory)
+        for n in range(5):
+            await memory.save_interaction(f"Where is backup {n} kept?", f"On disk {n}.")
+        await memory.embeddings.encode(["Any other text that is written once"])
+        stored = len(memory.embeddings.cache)
+        for max_results in (1, 2, 3):
+            # Different result counts keep the result cache out of the way
+            await memory.search_knowledge("Where is backup 2 kept?", max_results, mode="semantic")
+        calls = len(model.calls)
+        stats = memory.get_stats()["embedding_cache"]
+        await memory.close()
+        return stored, calls, stats
+
+    stored, calls, stats = asyncio.run(run())
+    assert stored == 0
+    # Five turns and the write above, then one model call for the repeated query
+    assert calls == 7
+    assert stats["entries"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.667
+
+def test_result_cache_expires_by_generation_and_age(monkeypatch):
+    from navi import cache as cache_module
+
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    results = ResultCache(max_entries=2, ttl_seconds=10)
+    results.put("a", 0, ["x"])
+    assert results.get("a", 0) == ["x"]
+    assert results.get("a", 1) is None and results.invalidations == 1
+    results.put("b", 1, ["y"])
+    now[0] += 11
+    assert results.get("b", 1) is None and results.expirations == 1
+    assert normalize_query("  Where is the PRINTER? ") == "where is the printer"
+
+def test_knowledge_changes_invalidate_cached_searches(tmp_path):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False}})
+        await memory.initialize()
+        await memory.save_interaction("Where is the printer?", "Second floor.")
+        first = await memory.search_knowledge("where is the printer", mode="keyword")
+        repeat = await memory.search_knowledge("Where is the printer?", mode="keyword")
+        hits = memory.result_cache.hits
+        await memory.save_interaction("Which printer is in colour?", "The printer by the door.")
+        after = await memory.search_knowledge("Where is the printer?", mode="keyword")
+        await memory.close()
+        return len(first), len(repeat), hits, len(after)
+
+    assert asyncio.run(run()) == (1, 1, 1, 2)
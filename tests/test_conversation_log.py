@@ -0,0 +1,34 @@
+import json
+
+from navi.storage import CONVERSATIONS_FORMAT, ConversationLog, JsonMemoryStore
+
+def message(content):
+    return {"role": "user", "content": content, "timestamp": "2026-01-01T12:00:00", "metadata": {}}
+
+def write_log(path, events):
+    path.write_text("".join(json.dumps(event) + "\n" for event in events))
+
+def test_only_the_log_tail_is_replayed_over_the_snapshot(tmp_path):
+    snapshot = {"_format": CONVERSATIONS_FORMAT, "seq": 2,
+                "sessions": {"s1": [message("one"), message("two")]}}
+    (tmp_path / "conversations.json").write_text(json.dumps(snapshot))
+    write_log(tmp_path / "conversations.log.jsonl", [
+        {"seq": 1, "op": "message", "session_id": "s1", "message": message("one")},
+        {"seq": 2, "op": "message", "session_id": "s1", "message": message("two")},
+        {"seq": 3, "op": "message", "session_id": "s1", "message": message("three")},
+        {"seq": 4, "op": "message", "session_id": "s2", "message": message("gone")},
+        {"seq": 5, "op": "delete_session", "session_id": "s2"},
+    ])
+    log = ConversationLog(tmp_path / "conversations.json", tmp_path / "conversations.log.jsonl",
+                          max_history=2)
+    assert {session_id: [m["content"] for m in messages]
+            for session_id, messages in log.load().items()} == {"s1": ["two", "three"]}
+
+def test_plain_conversations_json_is_migrated_into_shards(tmp_path):
+    (tmp_path / "conversations.json").write_text(json.dumps({"s1": [message("hello")]}))
+    store = JsonMemoryStore(tmp_path)
+    store.load_conversations()
+    assert [m["content"] for m in store.load_session("s1")] == ["hello"]
+    store.close()
+    assert (tmp_path / "conversations.json.migrated").exists()
+    assert not (tmp_path / "conversations.json").exists()
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from navi.dedup import jaccard, polarity, shingles
+from navi.memory import MemoryManager
+
+def open_memory(path):
+    return MemoryManager(str(path), config={"cleanup": {"enabled": False}})
+
+def test_negated_questions_are_not_near_duplicates():
+    on, off = "Turn on the porch light", "Turn off the porch light"
+    assert polarity(on) != polarity(off)
+    assert jaccard(shingles("How do I restart the NAS?"), shingles("How do I restart the NAS")) == 1.0
+
+def test_near_duplicate_question_keeps_the_newer_answer(tmp_path):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        await memory.save_interaction("How do I restart the NAS?", "Unplug it.")
+        await memory.save_interaction("How do I restart the NAS", "Use the power menu.")
+        await memory.save_interaction("Turn on the porch light", "Done.")
+        await memory.save_interaction("Turn off the porch light", "Done.")
+        items = {item.user_message: item for item in memory.knowledge}
+        await memory.close()
+        return items
+
+    items = asyncio.run(run())
+    assert set(items) == {"How do I restart the NAS", "Turn on the porch light", "Turn off the porch light"}
+    assert items["How do I restart the NAS"].assistant_response == "Use the power menu."
+    assert items["How do I restart the NAS"].metadata["repeats"] == 1
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_repeats_are_counted_regardless_of_timing(tmp_path, word_model, concurrent):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        word_model(memory)
+        adds = [memory.add_to_knowledge("Is the backup done?", "Yes.") for _ in range(3)]
+        if concurrent:
+            await asyncio.gather(*adds)
+        else:
+            for add in adds:
+                await add
+        items = list(memory.knowledge)
+        rows = len(memory.embedding_matrix)
+        await memory.close()
+        return items, rows
+
+    items, rows = asyncio.run(run())
+    assert len(items) == 1 and rows == 1
+    assert items[0].metadata["repeats"] == 2
+    assert "last_repeated" in items[0].metadata
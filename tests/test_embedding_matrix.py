@@ -0,0 +1,56 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from navi.vectors import EmbeddingMatrix
+
+def vector(n, dim=4):
+    return [float(n)] * dim
+
+def test_rows_survive_flush_and_reload(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path / "embeddings.f32")
+    assert [matrix.append(vector(n)) for n in range(3)] == [0, 1, 2]
+    matrix.flush()
+
+    reopened = EmbeddingMatrix(tmp_path / "embeddings.f32")
+    reopened.load()
+    assert len(reopened) == 3 and reopened.dim == 4
+    assert isinstance(reopened._mapped, np.memmap)
+    assert reopened.get(2).tolist() == vector(2)
+    assert reopened.get(3) is None
+
+def test_take_mixes_mapped_and_pending_rows(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path / "embeddings.f32")
+    for n in range(3):
+        matrix.append(vector(n))
+    matrix.flush()
+    for n in range(3, 5):
+        matrix.append(vector(n))
+
+    rows = matrix.take([4, 0, 3, 2, 4])
+    assert rows.dtype == np.float32
+    assert rows[:, 0].tolist() == [4, 0, 3, 2, 4]
+    assert matrix.take([1, 2])[:, 0].tolist() == [1, 2]
+    assert matrix.take([3])[:, 0].tolist() == [3]
+
+def test_take_from_pending_rows_only(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path / "embeddings.f32")
+    for n in range(3):
+        matrix.append(vector(n))
+    assert matrix.take([2, 0])[:, 0].tolist() == [2, 0]
+
+def test_rewrite_repacks_rows(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path / "embeddings.f32")
+    for n in range(4):
+        matrix.append(vector(n))
+    matrix.flush()
+    assert matrix.rewrite([matrix.get(3), matrix.get(1)]) == [0, 1]
+    matrix.flush()
+    assert (tmp_path / "embeddings.f32").stat().st_size == 2 * 4 * 4
+    assert matrix.take([0, 1])[:, 0].tolist() == [3, 1]
+
+def test_mismatched_dimension_is_rejected(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path / "embeddings.f32")
+    matrix.append(vector(0))
+    with pytest.raises(ValueError):
+        matrix.append(vector(1, dim=3))
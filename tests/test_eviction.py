@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from navi.eviction import EvictionPolicy
+from navi.memory import MemoryManager
+
+def drain(policy):
+    order = []
+    while (key := policy.pop()) is not None:
+        order.append(key)
+    return order
+
+def test_policies_order_evictions():
+    day = 86400.0
+    orders = {}
+    for name in EvictionPolicy.POLICIES:
+        policy = EvictionPolicy(name, half_life_days=1)
+        policy.add("old", 0.0)
+        policy.add("popular", 1 * day)
+        policy.add("recent", 5 * day)
+        for _ in range(15):
+            policy.touch("popular", 2 * day)
+        orders[name] = drain(policy)
+    assert orders == {
+        "lru": ["old", "popular", "recent"],
+        "lfu": ["old", "recent", "popular"],
+        # Fifteen hits are worth four half-lives, more than three days of recency
+        "age_weighted": ["old", "recent", "popular"],
+    }
+    with pytest.raises(ValueError):
+        EvictionPolicy("fifo")
+
+def test_removed_and_stale_entries_are_skipped():
+    policy = EvictionPolicy("lru")
+    for n in range(100):
+        policy.add(f"k{n}", float(n))
+    for n in range(50):
+        policy.touch(f"k{n}", 1000.0 + n)
+    policy.remove("k50")
+    assert policy.stats()["heap_entries"] <= 2 * len(policy) + 64
+    assert drain(policy)[:3] == ["k51", "k52", "k53"]
+
+def test_knowledge_is_evicted_least_recently_retrieved_first(tmp_path):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={
+            "cleanup": {"enabled": False}, "knowledge": {"max_knowledge_items": 5}})
+        await memory.initialize()
+        for n in range(5):
+            await memory.add_to_knowledge(f"Where is server {n} racked?", f"Rack {n}.")
+        await memory.search_knowledge("server 0", mode="keyword", max_results=1)
+        await memory.add_to_knowledge("Where is server 5 racked?", "Rack 5.")
+        kept = sorted(item.user_message for item in memory.knowledge)
+        evicted = memory.get_stats()["eviction"]["evicted"]
+        await memory.close()
+        return kept, evicted
+
+    kept, evicted = asyncio.run(run())
+    assert evicted == 1
+    assert "Where is server 0 racked?" in kept and "Where is server 1 racked?" not in kept
@@ -0,0 +1,47 @@
+import csv
+import gzip
+import json
+
+import pytest
+
+from navi.export import MemoryExporter
+
+SESSIONS = [
+    ("s1", [{"role": "user", "content": "Hello, \"NAVI\"", "timestamp": "2026-01-01T12:00:00",
+             "metadata": {"mood": "ok"}},
+            {"role": "assistant", "content": "Hi.\nHow can I help?", "timestamp": "2026-01-01T12:00:01",
+             "metadata": {}}]),
+    ("s2", []),
+]
+KNOWLEDGE = [{"id": "item-1", "content": "Q: a\nA: b", "timestamp": "2026-01-01T12:00:00",
+              "metadata": {"type": "qa_pair"}, "embedding": [0.1, 0.2], "embedding_row": 0}]
+
+def exporter(**kwargs):
+    return MemoryExporter(iter(SESSIONS), iter(KNOWLEDGE), **kwargs)
+
+def test_json_export_is_valid_and_drops_embeddings(tmp_path):
+    writer = exporter()
+    path = writer.export(tmp_path / "memory.json", "json", compress=True)
+    assert path.name == "memory.json.gz"
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    assert [(s["session_id"], len(s["messages"])) for s in data["conversations"]] == [("s1", 2), ("s2", 0)]
+    assert data["knowledge"] == [{key: value for key, value in KNOWLEDGE[0].items()
+                                  if key not in ("embedding", "embedding_row")}]
+    assert writer.counts == {"sessions": 2, "messages": 2, "knowledge_items": 1}
+
+def test_csv_export_round_trips_without_metadata(tmp_path):
+    path = exporter(include_metadata=False).export(tmp_path / "memory.csv", "csv")
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row["kind"] for row in rows] == ["message", "message", "knowledge"]
+    assert rows[1]["content"] == "Hi.\nHow can I help?"
+    assert "metadata" not in rows[0]
+
+def test_markdown_export_and_format_detection(tmp_path):
+    assert MemoryExporter.detect_format(tmp_path / "memory.md.gz") == "markdown"
+    assert MemoryExporter.detect_format(tmp_path / "memory.txt") is None
+    text = exporter().export(tmp_path / "memory.md", "markdown").read_text(encoding='utf-8')
+    assert "### Session `s1`" in text and "### item-1" in text and '"mood": "ok"' in text
+    with pytest.raises(ValueError):
+        exporter().export(tmp_path / "memory.xml", "xml")
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from navi.filters import MetadataIndex
+from navi.memory import MemoryManager
+
+def metadata(session, item_type="qa_pair", agent=None):
+    return {"type": item_type, "agent": agent, "context": {"session_id": session}}
+
+def test_select_intersects_fields_and_time_range():
+    index = MetadataIndex()
+    start = datetime(2026, 1, 1)
+    for n in range(10):
+        index.add(f"k{n}", metadata(f"s{n % 2}", agent="ops" if n < 5 else None), start + timedelta(days=n))
+    assert index.select() is None
+    assert index.select(session="s0", agent="ops") == {"k0", "k2", "k4"}
+    assert index.select(session="s1", since=start + timedelta(days=3), until=start + timedelta(days=7)) == \
+        {"k3", "k5", "k7"}
+    # Aware bounds are compared in UTC with naive timestamps
+    assert index.select(since=datetime(2026, 1, 10, 1, tzinfo=timezone(timedelta(hours=2)))) == {"k9"}
+    index.remove("k2")
+    assert index.select(session="s0", agent="ops") == {"k0", "k4"}
+    assert index.select(type="note") == set()
+    with pytest.raises(ValueError):
+        index.select(colour="red")
+
+def test_filtered_search_only_returns_matching_items(tmp_path, word_model):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False}})
+        await memory.initialize()
+        word_model(memory)
+        for session in ("home", "work"):
+            await memory.save_interaction("Where is the printer?", f"In the {session} office.",
+                                          {"session_id": session})
+        found = {}
+        for mode in ("semantic", "keyword", "hybrid"):
+            results = await memory.search_knowledge("printer", mode=mode, session_id="work")
+            found[mode] = [item.assistant_response for item in results]
+        found["none"] = await memory.search_knowledge("printer", session_id="garage")
+        await memory.close()
+        return found
+
+    found = asyncio.run(run())
+    assert found == {"semantic": ["In the work office."], "keyword": ["In the work office."],
+                     "hybrid": ["In the work office."], "none": []}
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from navi.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from navi.memory import MemoryManager
+
+def build(count=2000):
+    index = BM25Index()
+    for n in range(count):
+        # Printer notes of different lengths, so no two score the same
+        text = f"printer jams on floor {n}" + " paper" * (n // 10) if n % 10 == 0 else f"router reset note {n}"
+        index.add(f"k{n}", text, n)
+    return index
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("Where IS the Printer?") == ["printer"]
+
+def test_rarer_terms_and_shorter_documents_score_higher():
+    index = BM25Index()
+    index.add("a", "backup on the NAS", "a")
+    index.add("b", "backup copied to the NAS overnight with rsync and verified", "b")
+    index.add("c", "backup schedule", "c")
+    assert [value for value, _ in index.search("NAS backup", 3)] == ["a", "b", "c"]
+
+def test_removed_documents_leave_results_and_statistics():
+    index = build(20)
+    before = dict(index.search("printer", 5))
+    index.remove("k0")
+    assert 0 not in dict(index.search("printer", 5))
+    index.prune()
+    assert index.stats()["removed_pending"] == 0
+    assert set(dict(index.search("printer", 5))) == set(before) - {0}
+
+@pytest.mark.parametrize("keys", [["k10", "k30", "k31"], [f"k{n}" for n in range(0, 2000, 2)]])
+def test_key_filter_matches_filtering_the_full_ranking(keys):
+    index = build()
+    index.remove("k20")
+    everything = index.search("printer floor", len(index))
+    wanted = {int(key[1:]) for key in keys}
+    expected = [(value, score) for value, score in everything if value in wanted]
+    found = index.search("printer floor", len(index), keys=keys)
+    assert [value for value, _ in found] == [value for value, _ in expected]
+    assert [score for _, score in found] == pytest.approx([score for _, score in expected])
+
+def test_rank_fusion_favours_entries_found_by_both_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]], k=60, key=str)
+    assert fused[:2] == ["a", "c"] and set(fused) == {"a", "b", "c", "d"}
+    assert reciprocal_rank_fusion([[], []]) == []
+
+def test_hybrid_search_fuses_semantic_and_keyword_rankings(tmp_path, word_model):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False},
+                                                      "retrieval": {"candidates": 10}})
+        await memory.initialize()
+        word_model(memory)
+        for n in range(12):
+            await memory.add_to_knowledge(f"How do I fix printer error {n}?", f"Reseat tray {n}.")
+        await memory.add_to_knowledge("Router keeps dropping wifi", "Move it off the floor.")
+        found = {}
+        for mode in ("semantic", "keyword", "hybrid"):
+            found[mode] = [item.id for item in await memory.search_knowledge("printer error 7", 10, mode=mode)]
+        await memory.close()
+        return found
+
+    found = asyncio.run(run())
+    expected = reciprocal_rank_fusion([found["semantic"], found["keyword"]], key=str)[:10]
+    assert found["hybrid"] == expected
+    assert found["hybrid"][0] == found["keyword"][0]
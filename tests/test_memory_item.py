@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from navi.memory import MemoryItem, MemoryManager
+
+def make_item(timestamp):
+    return MemoryItem("item-1", "Q: backup?\nA: nightly", {"type": "qa_pair"}, timestamp)
+
+def test_aware_timestamp_keeps_its_offset():
+    moment = datetime(2026, 3, 1, 9, 30, tzinfo=timezone(timedelta(hours=2)))
+    item = make_item(moment)
+    assert item.timestamp == moment
+    assert item.timestamp.utcoffset() == timedelta(hours=2)
+    assert item.to_dict()["timestamp"] == "2026-03-01T09:30:00+02:00"
+    restored = MemoryItem.from_dict(item.to_dict())
+    assert restored.timestamp == moment and restored.created == item.created
+    assert MemoryItem.from_tuple(item.to_tuple()).timestamp == moment
+
+def test_naive_timestamp_stays_naive():
+    moment = datetime(2026, 3, 1, 9, 30)
+    item = make_item(moment)
+    assert item.timestamp == moment and item.timestamp.tzinfo is None
+    assert item.to_dict()["timestamp"] == "2026-03-01T09:30:00"
+
+def test_concurrent_duplicate_leaves_no_matrix_row(tmp_path):
+    pytest.importorskip("numpy")
+
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False}})
+        await memory.initialize()
+        release = asyncio.Event()
+
+        async def encode(texts, cached=False):
+            await release.wait()
+            return [[0.5] * 8 for _ in texts]
+
+        memory.embeddings.model = object()
+        memory.embeddings.encode = encode
+        both = asyncio.gather(*(memory.add_to_knowledge("Is the backup done?", "Yes.")
+                                for _ in range(2)))
+        await asyncio.sleep(0)
+        release.set()
+        await both
+        rows = len(memory.embedding_matrix)
+        memory.embeddings.model = None
+        await memory.close()
+        return rows, len(memory.knowledge)
+
+    assert asyncio.run(run()) == (1, 1)
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from navi.memory import MemoryManager
+from navi.memory_service import MemoryService, RemoteMemoryManager
+
+def open_memory(path):
+    return MemoryManager(str(path), config={"cleanup": {"enabled": False}})
+
+def tcp_config(tmp_path, **overrides):
+    config = {"socket": "", "host": "127.0.0.1", "port": 0,
+              "token_file": str(tmp_path / "navi-memory.token")}
+    config.update(overrides)
+    return config
+
+async def start_service(memory, config):
+    service = MemoryService(memory, config)
+    await service.start()
+    if not config.get("socket"):
+        config["port"] = service.server.sockets[0].getsockname()[1]
+    return service
+
+def test_calls_round_trip_over_tcp_with_the_token(tmp_path):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        config = tcp_config(tmp_path)
+        service = await start_service(memory, config)
+        client = RemoteMemoryManager(dict(config))
+        await client.initialize()
+        await client.save_interaction("Where is the backup kept?", "On the NAS.")
+        found = await client.search_knowledge("backup", mode="keyword")
+        await client.close()
+        await service.stop()
+        await memory.close()
+        return found
+
+    found = asyncio.run(run())
+    assert [item.assistant_response for item in found] == ["On the NAS."]
+    assert (tmp_path / "navi-memory.token").stat().st_mode & 0o077 == 0
+
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_tcp_refuses_clients_without_the_token(tmp_path, token):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        config = tcp_config(tmp_path, token="secret")
+        service = await start_service(memory, config)
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", config["port"])
+            if token is None:
+                writer.write(b'{"id": 1, "method": "ping", "params": {}}\n')
+            else:
+                writer.write(b'{"id": 1, "method": "auth", "params": {"token": "wrong"}}\n')
+            answer = await reader.readline()
+            closed = await reader.readline() == b""
+            writer.close()
+            with pytest.raises(PermissionError):
+                await RemoteMemoryManager(dict(config, token="wrong")).initialize()
+        finally:
+            await service.stop()
+            await memory.close()
+        return answer, closed
+
+    answer, closed = asyncio.run(run())
+    assert b"authentication required" in answer and closed
+
+@pytest.mark.skipif(not hasattr(asyncio, "start_unix_server"), reason="needs Unix sockets")
+def test_live_socket_is_not_taken_over(tmp_path):
+    socket_path = tmp_path / "navi-memory.sock"
+
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        config = {"socket": str(socket_path)}
+        first = await start_service(memory, config)
+        try:
+            with pytest.raises(RuntimeError):
+                await start_service(memory, dict(config))
+            client = RemoteMemoryManager(dict(config))
+            await client.initialize()
+            await client.close()
+        finally:
+            await first.stop()
+            await memory.close()
+
+    asyncio.run(run())
+
+@pytest.mark.skipif(not hasattr(asyncio, "start_unix_server"), reason="needs Unix sockets")
+def test_stale_socket_is_replaced(tmp_path):
+    import socket
+
+    socket_path = tmp_path / "navi-memory.sock"
+    # A socket file nobody listens on, as left by a crashed service
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(str(socket_path))
+    stale.close()
+
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        config = {"socket": str(socket_path)}
+        service = await start_service(memory, config)
+        client = RemoteMemoryManager(dict(config))
+        await client.initialize()
+        answer = await client._call("ping")
+        await client.close()
+        await service.stop()
+        await memory.close()
+        return answer
+
+    assert asyncio.run(run()) == "pong"
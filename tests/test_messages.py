@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from navi.memory import MemoryManager
+from navi.messages import MessageIndex
+
+def open_memory(path):
+    return MemoryManager(str(path), config={"cleanup": {"enabled": False}})
+
+def message(content, role="user", moment=datetime(2026, 1, 1, 12, 0)):
+    return {"role": role, "content": content, "timestamp": moment.isoformat(), "metadata": {}}
+
+def test_keyword_search_seeds_the_index_from_stored_sessions(tmp_path):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        memory.store.append_messages("old", [message("The printer on floor two jams")])
+        memory.store.flush()
+        await memory.save_interaction("Where is the backup kept?", "On the NAS.", {"session_id": "new"})
+        printer = await memory.search_conversations("printer jams", mode="keyword")
+        backup = await memory.search_conversations("backup", mode="keyword", role="assistant")
+        nas = await memory.search_conversations("NAS", mode="keyword", session_id="new")
+        await memory.close()
+        return printer, backup, nas
+
+    printer, backup, nas = asyncio.run(run())
+    assert [(r["session_id"], r["content"]) for r in printer] == [("old", "The printer on floor two jams")]
+    assert backup == []
+    assert [r["role"] for r in nas] == ["assistant"]
+
+def test_messages_added_while_loading_are_indexed(tmp_path):
+    index = MessageIndex(tmp_path / "messages.jsonl")
+    index.begin_load()
+    index.load()
+    index.add("s1", [message("saved during the load")])
+    index.add("gone", [message("removed during the load")])
+    index.remove_sessions(["gone"])
+    index.seed([("s1", [message("already stored", moment=datetime(2026, 1, 1, 11, 0))])])
+    index.finish_load()
+    assert index.loaded and len(index) == 2
+    assert [r["content"] for r in index.search("load", 5)] == ["saved during the load"]
+    assert {record["session_id"] for record in index._pending} == {"s1"}
+
+def test_semantic_search_falls_back_to_keywords_until_backfilled(tmp_path, word_model):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        # Saved without a model, so the messages have no embeddings yet
+        await memory.save_interaction("How do I reset the router?", "Hold the button for ten seconds.")
+        await memory.flush()
+        word_model(memory)
+        found = await memory.search_conversations("reset router", mode="semantic")
+        backfill = memory._message_backfill
+        await backfill
+        embedded = memory.message_index.stats()["embedded"]
+        after = await memory.search_conversations("reset router", mode="semantic")
+        await memory.close()
+        return found, embedded, after
+
+    found, embedded, after = asyncio.run(run())
+    assert found[0]["content"] == "How do I reset the router?"
+    assert embedded == 2
+    assert after[0]["content"] == "How do I reset the router?"
+
+def test_dropped_session_rows_are_repacked_on_close(tmp_path, word_model):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        word_model(memory)
+        for n in range(4):
+            await memory.save_interaction(f"Question {n}?", f"Answer {n}.", {"session_id": f"s{n}"})
+        for n in range(3):
+            del memory.active_conversations[f"s{n}"]
+        await memory.flush()
+        await memory.run_retention(None, datetime.now() + timedelta(days=1))
+        await memory.close()
+
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        word_model(memory)
+        rows = len(memory.message_index.matrix)
+        found = await memory.search_conversations("Question 3", mode="semantic")
+        await memory.close()
+        return rows, found
+
+    rows, found = asyncio.run(run())
+    assert rows == 2
+    assert [r["content"] for r in found] == ["Question 3?", "Answer 3."]
+
+def test_each_turn_runs_the_model_once(tmp_path, word_model):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        model = word_model(memory)
+        await memory.save_interaction("Where is the backup kept?", "On the NAS.")
+        calls = list(model.calls)
+        item = memory.knowledge[0]
+        vector = memory.get_item_embedding(item)
+        await memory.close()
+        return calls, item.content, vector, model
+
+    calls, content, vector, model = asyncio.run(run())
+    assert calls == [["Where is the backup kept?", "On the NAS.", content]]
+    assert list(vector) == pytest.approx(model.encode([content])[0].tolist())
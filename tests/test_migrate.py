@@ -0,0 +1,52 @@
+import json
+
+from navi import codec
+from navi.codec import read_records, write_records
+from navi.storage import JsonMemoryStore
+
+def item(n):
+    return {
+        "id": f"item-{n}",
+        "content": f"Q: question {n}\nA: answer {n}",
+        "metadata": {"type": "qa_pair"},
+        "timestamp": "2026-01-01T12:00:00",
+        "embedding": None,
+        "embedding_row": None
+    }
+
+def refuse_load():
+    raise AssertionError("knowledge was loaded into memory")
+
+def test_write_records_streams_in_frames(tmp_path, monkeypatch):
+    path = tmp_path / "records.jsonl.gz"
+    sizes = []
+    encode = codec.RecordCodec.encode
+    monkeypatch.setattr(codec.RecordCodec, "encode",
+                        lambda self, records: sizes.append(len(records)) or encode(self, records))
+    write_records(path, (item(n) for n in range(2500)))
+    assert sizes == [1000, 1000, 500]
+    assert [r["id"] for r in read_records(path)] == [f"item-{n}" for n in range(2500)]
+
+def test_empty_append_leaves_file_untouched(tmp_path):
+    path = tmp_path / "records.jsonl"
+    write_records(path, [], append=True)
+    assert not path.exists()
+    write_records(path, [])
+    assert path.read_bytes() == b""
+
+def test_convert_migrates_legacy_knowledge_without_loading(tmp_path, monkeypatch):
+    (tmp_path / "knowledge.json").write_text(json.dumps([item(n) for n in range(50)]))
+    store = JsonMemoryStore(tmp_path, {"format": "json", "compression": "gzip"})
+    monkeypatch.setattr(store.knowledge_segments, "load", refuse_load)
+    store.load_conversations()
+    store.attach_knowledge()
+    stats = store.convert()
+    store.close()
+    assert not (tmp_path / "knowledge.json").exists()
+    assert stats["format"] == "json" and stats["compression"] == "gzip"
+
+    store = JsonMemoryStore(tmp_path, {"format": "json", "compression": "gzip"})
+    assert all(path.name.endswith(".jsonl.gz") for path in store.knowledge_segments.files())
+    assert sorted(record["id"] for record in store.load_knowledge()) == sorted(
+        f"item-{n}" for n in range(50))
+    store.close()
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from navi.memory import MemoryManager
+from navi.storage import SQLiteMemoryStore
+
+OLD = datetime(2025, 1, 1, 12, 0, 0)
+
+def old_message(content, moment=OLD):
+    return {"role": "user", "content": content, "timestamp": moment.isoformat(), "metadata": {}}
+
+def open_memory(path):
+    return MemoryManager(str(path), config={
+        "storage": {"backend": "sqlite"},
+        "cleanup": {"enabled": False}
+    })
+
+def test_retention_removes_old_items_and_sessions(tmp_path):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        await memory.save_interaction("How often does the backup run?", "Every night at two.",
+                                      {"session_id": "recent"})
+        memory.knowledge[0].timestamp = OLD
+        await memory.save_interaction("Where are the backups kept?", "On the NAS in the basement.",
+                                      {"session_id": "recent"})
+        memory.store.append_messages("stale", [old_message("Is the printer fixed?")])
+        memory.store.flush()
+
+        removed = await memory.run_retention(OLD + timedelta(days=1), OLD + timedelta(days=1))
+        remaining = [item.user_message for item in memory.knowledge]
+        await memory.close()
+        store = SQLiteMemoryStore(tmp_path / "memory.db")
+        sessions = dict(store.session_activity())
+        store.close()
+        return removed, sessions, remaining
+
+    removed, sessions, remaining = asyncio.run(run())
+    assert removed == {"knowledge_items": 1, "sessions": 1}
+    assert remaining == ["Where are the backups kept?"]
+    assert "stale" not in sessions and "recent" in sessions
+
+def test_active_sessions_stay_in_the_timeline(tmp_path):
+    async def run():
+        memory = open_memory(tmp_path)
+        await memory.initialize()
+        memory.store.append_messages("active", [old_message("Is the printer fixed?")])
+        memory.store.flush()
+        conversation = memory.get_conversation("active")
+
+        cutoff = OLD + timedelta(days=1)
+        first = await memory.run_retention(None, cutoff)
+        # Still in use, so kept; once released it expires on the next run
+        del memory.active_conversations["active"]
+        second = await memory.run_retention(None, cutoff)
+        await memory.close()
+        return conversation, first, second
+
+    conversation, first, second = asyncio.run(run())
+    assert conversation.messages
+    assert first["sessions"] == 0
+    assert second["sessions"] == 1
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from navi.storage import KnowledgeSegments
+
+def item(n, content=None, timestamp="2026-01-01T12:00:00"):
+    return {"id": f"item-{n}", "content": content or f"Q: question {n}\nA: answer {n}",
+            "metadata": {}, "timestamp": timestamp}
+
+def levels(segments):
+    return sorted(level for level, _, _ in segments.segments)
+
+def test_full_level_merges_into_one_segment_up(tmp_path):
+    segments = KnowledgeSegments(tmp_path, fanout=3)
+    segments.append([item(0), item(1)])
+    segments.flush()
+    segments.append([item(0, "Q: question 0\nA: updated")])
+    segments.flush()
+    segments.delete(["item-1"])
+    segments.flush()
+    assert levels(segments) == [0, 0, 0] and segments.needs_compaction()
+
+    assert segments.compact() == 1
+    assert levels(segments) == [1]
+    assert len(list(tmp_path.iterdir())) == 1
+
+    reopened = KnowledgeSegments(tmp_path, fanout=3)
+    assert [(r["id"], r["content"]) for r in reopened.load()] == [("item-0", "Q: question 0\nA: updated")]
+
+def test_tombstones_survive_while_older_levels_remain(tmp_path):
+    segments = KnowledgeSegments(tmp_path, fanout=2)
+    segments.rewrite([item(n) for n in range(10)])
+    segments.flush()
+    segments.delete(["item-3"])
+    segments.flush()
+    segments.append([item(10)])
+    segments.flush()
+    segments.compact()
+    assert "item-3" not in {r["id"] for r in segments.load()}
+    assert len(segments.load()) == 10
+
+def test_compaction_drops_expired_items(tmp_path):
+    segments = KnowledgeSegments(tmp_path, fanout=2)
+    segments.append([item(0, timestamp="2025-01-01T12:00:00")])
+    segments.flush()
+    segments.append([item(1)])
+    segments.flush()
+    segments.compact(expire_before=datetime(2025, 6, 1))
+    assert [r["id"] for r in segments.load()] == ["item-1"]
+    assert [r["id"] for r in segments.iter_records()] == ["item-1"]
+
+def test_legacy_knowledge_json_becomes_a_segment(tmp_path):
+    import json
+
+    (tmp_path / "knowledge.json").write_text(json.dumps([item(n) for n in range(3)]))
+    segments = KnowledgeSegments(tmp_path / "knowledge", legacy_file=tmp_path / "knowledge.json")
+    assert sorted(r["id"] for r in segments.load()) == ["item-0", "item-1", "item-2"]
+    assert (tmp_path / "knowledge.json.migrated").exists()
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+from navi.memory import MemoryManager
+from navi.storage import SessionShards
+
+def message(n, day=1):
+    return {"role": "user", "content": f"message {n}", "timestamp": f"2026-01-{day:02d}T12:00:00",
+            "metadata": {}}
+
+def test_appends_are_trimmed_back_to_the_history_window(tmp_path):
+    shards = SessionShards(tmp_path, max_history=3)
+    for n in range(7):
+        shards.append("s1", [message(n)])
+        shards.flush()
+    assert [m["content"] for m in shards.load_session("s1")] == ["message 4", "message 5", "message 6"]
+    assert shards.index["s1"]["count"] <= 6
+
+    reopened = SessionShards(tmp_path, max_history=3)
+    reopened.load_index()
+    assert reopened.count() == 1
+    assert reopened.load_session("s1")[-1]["content"] == "message 6"
+
+def test_expired_and_deleted_sessions(tmp_path):
+    shards = SessionShards(tmp_path)
+    shards.append("old", [message(0, day=1)])
+    shards.append("kept", [message(0, day=1)])
+    shards.append("new", [message(0, day=9)])
+    shards.flush()
+    expired = shards.expired(datetime(2026, 1, 5), keep_sessions=["kept"])
+    assert expired == ["old"]
+    shards.delete(expired)
+    shards.flush()
+    assert shards.load_session("old") is None
+    assert sorted(shards.index) == ["kept", "new"]
+    assert len(list(tmp_path.glob("*.jsonl"))) == 3  # two shards plus the index
+
+def test_sessions_load_only_when_used(tmp_path):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False}})
+        await memory.initialize()
+        for n in range(3):
+            await memory.save_interaction(f"Question {n}?", f"Answer {n}.", {"session_id": f"s{n}"})
+        await memory.close()
+
+        memory = MemoryManager(str(tmp_path), config={"cleanup": {"enabled": False}})
+        await memory.initialize()
+        before = set(memory.active_conversations)
+        messages = [m["content"] for m in memory.get_conversation("s1").messages]
+        after = set(memory.active_conversations)
+        await memory.close()
+        return before, messages, after
+
+    before, messages, after = asyncio.run(run())
+    assert before == set() and after == {"s1"}
+    assert messages == ["Question 1?", "Answer 1."]
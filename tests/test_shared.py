@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from navi.memory import MemoryManager
+
+def open_shared(path, backend):
+    return MemoryManager(str(path), config={
+        "storage": {"backend": backend, "shared": True},
+        "cleanup": {"enabled": False}
+    })
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_processes_see_each_others_changes(tmp_path, backend):
+    async def run():
+        writer, reader = open_shared(tmp_path, backend), open_shared(tmp_path, backend)
+        await writer.initialize()
+        await reader.initialize()
+        seen = {}
+
+        await writer.save_interaction("Where is the backup kept?", "On the NAS.", {"session_id": "s1"})
+        await writer.flush()
+        await reader.refresh()
+        seen["added"] = [item.user_message for item in reader.knowledge]
+
+        # A repeat only changes the stored item's metadata
+        await writer.add_to_knowledge("Where is the backup kept?", "On the NAS.")
+        await writer.flush()
+        await reader.refresh()
+        seen["repeats"] = reader.knowledge[0].metadata.get("repeats")
+        results = await reader.search_knowledge("backup NAS", mode="keyword")
+        seen["searchable"] = [item.metadata.get("repeats") for item in results]
+
+        # Our own writes come back from the poll and change nothing
+        await reader.add_to_knowledge("Where is the backup kept?", "On the NAS.")
+        await reader.flush()
+        await reader.refresh()
+        await writer.refresh()
+        seen["after_own_poll"] = (reader.knowledge[0].metadata.get("repeats"),
+                                  writer.knowledge[0].metadata.get("repeats"))
+
+        writer.store.delete_knowledge([writer.knowledge[0].id])
+        writer.store.flush()
+        await reader.refresh()
+        seen["removed"] = len(reader.knowledge)
+
+        await writer.close()
+        await reader.close()
+        return seen
+
+    seen = asyncio.run(run())
+    assert seen == {"added": ["Where is the backup kept?"], "repeats": 1, "searchable": [1],
+                    "after_own_poll": (2, 2), "removed": 0}
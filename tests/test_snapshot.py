@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+import pytest
+
+from navi.memory import MemoryManager
+
+def open_memory(path, backend):
+    return MemoryManager(str(path), config={
+        "storage": {"backend": backend},
+        "cleanup": {"enabled": False}
+    })
+
+async def save_and_close(path, backend, interactions):
+    memory = open_memory(path, backend)
+    await memory.initialize()
+    for question, answer in interactions:
+        await memory.save_interaction(question, answer)
+    await memory.close()
+
+async def reopen(path, backend):
+    memory = open_memory(path, backend)
+    await memory.initialize()
+    knowledge = [item.to_dict() for item in memory.knowledge]
+    await memory.close()
+    return knowledge
+
+def restored(caplog):
+    return any("from snapshot" in record.getMessage() for record in caplog.records)
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_restart_uses_snapshot(tmp_path, caplog, backend):
+    caplog.set_level(logging.INFO, logger="navi")
+    asyncio.run(save_and_close(tmp_path, backend, [
+        ("How often does the backup run?", "Every night at two."),
+        ("Where are the backups kept?", "On the NAS in the basement.")
+    ]))
+    caplog.clear()
+    first = asyncio.run(reopen(tmp_path, backend))
+    assert restored(caplog)
+    assert len(first) == 2
+
+    # A restart that changed nothing keeps the snapshot valid
+    caplog.clear()
+    assert asyncio.run(reopen(tmp_path, backend)) == first
+    assert restored(caplog)
+
+def test_sqlite_snapshot_invalidated_by_writes(tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger="navi")
+    asyncio.run(save_and_close(tmp_path, "sqlite", [
+        ("How often does the backup run?", "Every night at two.")
+    ]))
+    asyncio.run(reopen(tmp_path, "sqlite"))
+
+    # Written behind the snapshot's back, as another process would
+    memory = open_memory(tmp_path, "sqlite")
+    memory.store.append_knowledge([{
+        "id": "external",
+        "content": "Q: Who set up the NAS?\nA: Alex did.",
+        "metadata": {"type": "qa_pair"},
+        "timestamp": "2026-01-01T12:00:00"
+    }])
+    memory.store.flush()
+    memory.store.close()
+
+    caplog.clear()
+    knowledge = asyncio.run(reopen(tmp_path, "sqlite"))
+    assert not restored(caplog)
+    assert {item["id"] for item in knowledge} >= {"external"}
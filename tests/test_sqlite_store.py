@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timezone
+
+from navi.memory import MemoryManager
+from navi.storage import SQLiteMemoryStore
+
+def item(content, item_id="item-1", repeats=0):
+    return {
+        "id": item_id,
+        "content": content,
+        "metadata": {"type": "qa_pair", "repeats": repeats},
+        "timestamp": "2026-01-01T12:00:00",
+        "embedding": None,
+        "embedding_row": None
+    }
+
+def fts_rows(store):
+    return store._query("SELECT COUNT(*) FROM knowledge_fts_docsize")[0][0]
+
+def test_repeated_knowledge_keeps_one_fts_row(tmp_path):
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    for repeats in range(4):
+        store.append_knowledge([item("Q: backup schedule\nA: nightly", repeats=repeats)])
+        store.flush()
+    assert len(store.load_knowledge()) == 1
+    assert fts_rows(store) == 1
+    assert [row["id"] for row in store.search_text("backup", 10)] == ["item-1"]
+    store.close()
+
+def test_updated_content_replaces_fts_terms(tmp_path):
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    store.append_knowledge([item("Q: backup schedule\nA: nightly")])
+    store.append_knowledge([item("Q: backup schedule\nA: weekly")])
+    store.flush()
+    assert fts_rows(store) == 1
+    assert store.search_text("nightly", 10) == []
+    assert len(store.search_text("weekly", 10)) == 1
+    store.close()
+
+def test_repeated_saves_do_not_grow_fts(tmp_path):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={
+            "storage": {"backend": "sqlite"},
+            "cleanup": {"enabled": False}
+        })
+        await memory.initialize()
+        for _ in range(4):
+            await memory.save_interaction("How often does the backup run?", "Every night at two.")
+        await memory.close()
+        return memory.knowledge
+
+    knowledge = asyncio.run(run())
+    assert len(knowledge) == 1
+    assert knowledge[0].metadata["repeats"] == 3
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    assert fts_rows(store) == 1
+    store.close()
+
+def test_leaked_fts_rows_are_rebuilt_on_open(tmp_path):
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    for _ in range(3):
+        store._queue(
+            "INSERT OR REPLACE INTO knowledge (id, content, metadata, timestamp) VALUES (?, ?, ?, ?)",
+            ("item-1", "Q: backup schedule\nA: nightly", "{}", "2026-01-01T12:00:00")
+        )
+    store.flush()
+    assert fts_rows(store) == 3
+    store.close()
+
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    assert fts_rows(store) == 1
+    store.close()
+
+def test_expire_compares_mixed_offsets_in_time_order(tmp_path):
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    # 04:00 UTC on Jan 2, so newer than the cutoff though it sorts before it as text
+    kept = dict(item("Q: kept\nA: one", "kept"), timestamp="2026-01-01T23:00:00-05:00")
+    expired = dict(item("Q: expired\nA: two", "expired"), timestamp="2026-01-01T12:30:00")
+    store.append_knowledge([kept, expired])
+    for session_id, timestamp in (("naive", "2026-01-01T12:30:00"),
+                                  # 22:00 UTC on Jan 1, though it sorts after the cutoff as text
+                                  ("offset", "2026-01-02T10:00:00+12:00")):
+        store.append_messages(session_id, [{"role": "user", "content": "hi",
+                                            "timestamp": timestamp, "metadata": {}}])
+    store.flush()
+    store.expire(datetime(2026, 1, 2, 0, 0, tzinfo=timezone.utc), [], [], [])
+    store.flush()
+    assert [record["id"] for record in store.load_knowledge()] == ["kept"]
+    assert store.load_session("naive") is None and store.load_session("offset") is None
+    store.close()
+
+def test_epoch_columns_are_added_to_older_databases(tmp_path):
+    import sqlite3
+
+    conn = sqlite3.connect(str(tmp_path / "memory.db"))
+    conn.executescript("""
+        CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+            role TEXT NOT NULL, content TEXT NOT NULL, timestamp TEXT NOT NULL, metadata TEXT);
+        CREATE TABLE knowledge (pk INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, content TEXT NOT NULL,
+            metadata TEXT, timestamp TEXT NOT NULL, embedding BLOB);
+        INSERT INTO knowledge (id, content, metadata, timestamp) VALUES ('old', 'Q: a\nA: b', '{}',
+            '2026-01-01T12:00:00+02:00');
+    """)
+    conn.commit()
+    conn.close()
+    store = SQLiteMemoryStore(tmp_path / "memory.db")
+    assert store._query("SELECT epoch FROM knowledge")[0][0] == \
+        datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc).timestamp()
+    store.close()
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from navi.memory import MemoryManager
+
+def open_memory(path, backend):
+    return MemoryManager(str(path), config={
+        "storage": {"backend": backend},
+        "cleanup": {"enabled": False}
+    })
+
+async def save_sessions(path, backend, session_ids):
+    memory = open_memory(path, backend)
+    await memory.initialize()
+    for session_id in session_ids:
+        await memory.save_interaction("Is the backup done?", "Yes.", {"session_id": session_id})
+    count = memory.get_stats()["sessions"]
+    await memory.close()
+    return count
+
+async def reopened_count(path, backend):
+    memory = open_memory(path, backend)
+    await memory.initialize()
+    count = memory.get_stats()["sessions"]
+    await memory.close()
+    return count
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_session_count_covers_sessions_not_loaded(tmp_path, backend):
+    asyncio.run(save_sessions(tmp_path, backend, ["one", "two", "three"]))
+    # Sessions are loaded lazily, so none are in memory after a restart
+    assert asyncio.run(reopened_count(tmp_path, backend)) == 3
+
+def test_session_count_includes_queued_sessions(tmp_path):
+    assert asyncio.run(save_sessions(tmp_path, "json", ["one", "two"])) == 2
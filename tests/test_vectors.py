@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from navi.memory import MemoryManager
+from navi.vectors import IVFIndex, QuantizedIndex, ShardedIndex, VectorIndex
+
+def random_vectors(count, dim=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def brute_force(vectors, query, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(unit @ (query / np.linalg.norm(query))), kind="stable")[:k])
+
+def test_top_k_matches_a_full_sort():
+    vectors = random_vectors(3000)
+    index = VectorIndex(initial_capacity=16)
+    index.add_batch([f"v{i}" for i in range(3000)], list(vectors), list(range(3000)))
+    query = random_vectors(1, seed=1)[0]
+    found = index.search(query, 10)
+    assert [value for value, _ in found] == brute_force(vectors, query, 10)
+    assert [score for _, score in found] == sorted((score for _, score in found), reverse=True)
+
+def test_removal_and_key_subsets():
+    vectors = random_vectors(50)
+    index = VectorIndex()
+    index.add_batch([f"v{i}" for i in range(50)], list(vectors), list(range(50)))
+    index.remove("v7")
+    index.add("v3", vectors[7], "moved")
+    assert len(index) == 49 and "v7" not in index
+    assert index.search(vectors[7], 1)[0][0] == "moved"
+    assert [value for value, _ in index.search(vectors[10], 5, keys=["v10", "v11", "nope"])][0] == 10
+    assert index.search(vectors[10], 5, keys=["nope"]) == []
+    with pytest.raises(ValueError):
+        index.search(vectors[0][:8], 1)
+
+def clustered_vectors(count, clusters=20, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim))
+    return (centres[rng.integers(clusters, size=count)]
+            + 0.3 * rng.standard_normal((count, dim))).astype(np.float32)
+
+def test_ivf_recall_and_saved_clusters(tmp_path):
+    vectors = clustered_vectors(4000)
+    keys = [f"v{i}" for i in range(4000)]
+    index = IVFIndex(nlist=20, nprobe=4, min_items=1000, index_file=tmp_path / "ann.npz")
+    index.add_batch(keys, list(vectors), list(range(4000)))
+    index.rebuild(wait=True)
+    assert index.stats()["approximate"] and (tmp_path / "ann.npz").exists()
+
+    queries = clustered_vectors(20, seed=1)
+    hits = sum(len(set(v for v, _ in index.search(q, 10)) & set(brute_force(vectors, q, 10)))
+               for q in queries)
+    assert hits / 200 > 0.9
+    # Key subsets are always exact
+    assert index.search(vectors[5], 1, keys=["v5", "v6"])[0][0] == 5
+
+    reloaded = IVFIndex(nlist=20, nprobe=4, min_items=1000, index_file=tmp_path / "ann.npz")
+    reloaded.add_batch(keys, list(vectors), list(range(4000)))
+    assert reloaded.load() and reloaded.trained
+    assert reloaded.search(queries[0], 10) == index.search(queries[0], 10)
+    index.close()
+    reloaded.close()
+
+def test_ivf_stays_exact_below_min_items():
+    vectors = random_vectors(100)
+    index = IVFIndex(min_items=1000)
+    index.add_batch([f"v{i}" for i in range(100)], list(vectors), list(range(100)))
+    query = random_vectors(1, seed=2)[0]
+    assert [v for v, _ in index.search(query, 5)] == brute_force(vectors, query, 5)
+    assert not index.trained and not index.stats()["building"]
+
+def sharded(count):
+    if not ShardedIndex.available():
+        pytest.skip("needs multiprocessing.shared_memory")
+    vectors = random_vectors(count)
+    index = ShardedIndex(shards=2, min_items=100, initial_capacity=16)
+    index.add_batch([f"v{i}" for i in range(count)], list(vectors), list(range(count)))
+    return index, vectors
+
+def test_sharded_search_matches_the_exact_scan():
+    index, vectors = sharded(1000)
+    query = random_vectors(1, seed=3)[0]
+    try:
+        found = index.search(query, 10)
+        filtered = index.search(query, 3, keys=["v1", "v2", "v3"])
+        stats = index.stats()
+    finally:
+        index.close()
+    assert [value for value, _ in found] == brute_force(vectors, query, 10)
+    assert stats["parallel_searches"] == 1 and stats["workers_running"]
+    assert sorted(value for value, _ in filtered) == [1, 2, 3]
+    assert len(index) == 0 and index.stats()["shared_bytes"] == 0
+
+def test_sharded_search_falls_back_when_workers_fail(monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+
+    index, vectors = sharded(200)
+
+    def broken_pool():
+        raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(index, "_workers", broken_pool)
+    query = random_vectors(1, seed=4)[0]
+    try:
+        first = index.search(query, 5)
+        second = index.search(query, 5)
+        stats = index.stats()
+    finally:
+        index.close()
+    assert [value for value, _ in first] == brute_force(vectors, query, 5) == [value for value, _ in second]
+    assert not stats["parallel"] and stats["parallel_searches"] == 0
+
+@pytest.mark.parametrize("mode", ["int8", "binary"])
+def test_quantized_search_rescoring_finds_exact_neighbours(mode):
+    vectors = random_vectors(500)
+    index = QuantizedIndex(mode=mode, rescore_factor=8, vector_source=lambda rows: vectors[rows])
+    index.add_batch([f"v{i}" for i in range(500)], list(vectors), list(range(500)))
+    found = index.search(vectors[42], 3)
+    assert found[0][0] == 42
+    assert found[0][1] == pytest.approx(1.0, abs=1e-5)
+
+def test_quantized_recall_is_measured():
+    vectors = random_vectors(300)
+    index = QuantizedIndex(mode="int8", vector_source=lambda rows: vectors[rows])
+    index.add_batch([f"v{i}" for i in range(300)], list(vectors), list(range(300)))
+    result = index.measure_recall(samples=20, k=5)
+    assert result["samples"] == 20 and result["recall"] > 0.8
+    assert index.stats()["recall"] == result
+
+def test_truncated_codes_are_smaller():
+    vectors = random_vectors(10)
+    index = QuantizedIndex(mode="int8", dimensions=8, vector_source=lambda rows: vectors[rows])
+    index.add_batch([f"v{i}" for i in range(10)], list(vectors), list(range(10)))
+    assert index.stats()["bytes_per_vector"] == 8 + 4
+    assert index.stats()["float32_bytes_per_vector"] == 4 * 32
+
+def test_recall_is_measured_in_the_background_after_load(tmp_path, word_model):
+    config = {"cleanup": {"enabled": False},
+              "embeddings": {"quantization": {"mode": "int8", "recall_samples": 10}}}
+
+    async def run():
+        memory = MemoryManager(str(tmp_path), config=config)
+        await memory.initialize()
+        word_model(memory)
+        for n in range(30):
+            await memory.add_to_knowledge(f"Where is backup {n} kept?", f"On disk {n}.")
+        await memory.close()
+
+        memory = MemoryManager(str(tmp_path), config=config)
+        await memory.initialize()
+        task = memory._recall_task
+        await task
+        recall = memory.get_stats()["quantization"]["recall"]
+        await memory.close()
+        return recall
+
+    recall = asyncio.run(run())
+    assert recall["samples"] == 10 and recall["recall"] > 0.5
+
+def test_recall_is_not_measured_by_default(tmp_path):
+    async def run():
+        memory = MemoryManager(str(tmp_path), config={
+            "cleanup": {"enabled": False}, "embeddings": {"quantization": {"mode": "int8"}}})
+        await memory.initialize()
+        task = memory._recall_task
+        await memory.close()
+        return task
+
+    assert asyncio.run(run()) is None